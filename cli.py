@@ -0,0 +1,63 @@
+import argparse
+import importlib
+import sys
+
+# Subcommands, the modules implementing them and their descriptions. Only the
+# module of the selected subcommand is imported, together with its backends.
+COMMANDS = {
+    "generate": ("create_datasets", "Create reduced networks and removed edge sets."),
+    "rank": ("rank_method_I", "Rank candidate edges of the reduced networks."),
+    "cluster": ("perform_clustering", "Cluster the reduced networks."),
+    "evaluate": ("evaluate", "Evaluate rankings against the held-out edges."),
+}
+
+
+def build_parser(command=None):
+    """
+    Build the command-line parser, with the options of one subcommand.
+
+    Every subcommand is listed, but only the module of `command` is imported to
+    add its options, so that the others do not cost any startup time.
+
+    Args:
+        command (str or None): The selected subcommand.
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="Network-based prediction of protein interactions."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name, (module_name, description) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=description, description=description)
+        if name == command:
+            module = importlib.import_module(module_name)
+            module.add_arguments(subparser)
+            subparser.set_defaults(run=module.run)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Run a subcommand, e.g. `python cli.py rank --workers 8 --network EcoliCong --method cn`.
+
+    Args:
+        argv (list or None): Command-line arguments. None uses sys.argv.
+
+    Returns:
+        The result of the subcommand.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    command = argv[0] if argv and argv[0] in COMMANDS else None
+    args = build_parser(command).parse_args(argv)
+
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    main()
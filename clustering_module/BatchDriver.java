@@ -0,0 +1,81 @@
+import java.io.BufferedReader;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.Constructor;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.util.Arrays;
+
+/**
+ * Runs the command-line application of a clusterer on many networks in one JVM.
+ *
+ * Usage: java -cp <driver folder>:<clusterer classpath> BatchDriver <main class>
+ *
+ * Jobs are read from the standard input, one per line, as tab-separated
+ * fields: the file receiving the standard output of the job, the file
+ * receiving its standard error, then the command-line arguments of the
+ * application. Every job creates a new instance of the main class and calls
+ * its run(String[]) method, as its main method does, but without exiting the
+ * JVM afterwards. A "<job index>\t<exit code>" line is printed once a job is
+ * done, the exit code being the value returned by run(String[]).
+ *
+ * Both bundled main classes, ClusterONE's CommandLineApplication and IMHRC's
+ * XAlgorithmCommandLine, have a public no-argument constructor and a public
+ * int run(String[]) method, and their main methods only call run on a new
+ * instance. ClusterONE's main exits with the value returned by run, while
+ * IMHRC's ignores it, so a job returning a non-zero value there is only rerun
+ * in its own process. The driver exits once all jobs are done, since the
+ * thread pools of the clusterers may otherwise keep the JVM alive.
+ */
+public class BatchDriver {
+    public static void main(String[] args) throws Exception {
+        Class<?> application = Class.forName(args[0]);
+        Constructor<?> constructor = application.getDeclaredConstructor();
+        constructor.setAccessible(true);
+        Method run = application.getDeclaredMethod("run", String[].class);
+        run.setAccessible(true);
+
+        PrintStream out = System.out;
+        PrintStream err = System.err;
+        BufferedReader jobs = new BufferedReader(new InputStreamReader(System.in));
+
+        String line;
+        int index = 0;
+        while ((line = jobs.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+
+            String[] fields = line.split("\t", -1);
+            String[] arguments = Arrays.copyOfRange(fields, 2, fields.length);
+
+            int exitCode;
+            PrintStream jobOut = new PrintStream(new FileOutputStream(fields[0]), true);
+            PrintStream jobErr = new PrintStream(new FileOutputStream(fields[1]), true);
+            System.setOut(jobOut);
+            System.setErr(jobErr);
+            try {
+                Object result = run.invoke(constructor.newInstance(), (Object) arguments);
+                exitCode = result instanceof Integer ? (Integer) result : 0;
+            } catch (InvocationTargetException e) {
+                e.getCause().printStackTrace();
+                exitCode = 1;
+            } catch (Throwable e) {
+                e.printStackTrace();
+                exitCode = 1;
+            } finally {
+                System.setOut(out);
+                System.setErr(err);
+                jobOut.close();
+                jobErr.close();
+            }
+
+            out.println(index + "\t" + exitCode);
+            out.flush();
+            index++;
+        }
+
+        System.exit(0);
+    }
+}
@@ -1,11 +1,18 @@
 import os
 
-import networkx as nx
 import numpy as np
+import scipy.sparse as sp
 import sklearn as sk
 from sklearn import cluster
 from sklearn.cluster import AffinityPropagation
 
+import graph_io
+from similarity import sparse
+
+# Affinity propagation modes: 'dense' passes messages between all node pairs,
+# 'sparse' only along the edges of the network
+AP_MODES = ("dense", "sparse")
+
 
 def graph_to_edge_matrix(G):
     """
@@ -22,20 +29,201 @@ def graph_to_edge_matrix(G):
         tuple: A tuple containing the edge matrix and a dictionary mapping
                node names to their corresponding matrix indices.
     """
-    num_nodes = len(G)
-    edge_mat = np.zeros((num_nodes, num_nodes), dtype=int)
-    node_indices = {node: i for i, node in enumerate(G.nodes)}
+    edges = graph_io.EdgeList.from_networkx(G)
+    node_indices = {node: i for i, node in enumerate(edges.nodes)}
 
-    for node in G.nodes:
-        node_int = node_indices[node]
-        edge_mat[node_int][node_int] = 1  # Set diagonal elements to 1
-        for neighbor in G.neighbors(node):
-            neighbor_int = node_indices[neighbor]
-            edge_mat[node_int][neighbor_int] = 1
+    edge_mat = closed_neighborhood_matrix(edges).toarray().astype(int)
 
     return edge_mat, node_indices
 
 
+def closed_neighborhood_matrix(edges):
+    """
+    Build the sparse adjacency matrix of a network with every node adjacent to itself.
+
+    Its rows are the rows of the edge matrix, i.e. the closed neighborhoods of the nodes.
+
+    Args:
+        edges (graph_io.EdgeList): The edges of the network.
+
+    Returns:
+        scipy.sparse.csr_array: Binary matrix with sorted indices, indexed like edges.nodes.
+    """
+    adjacency = sparse.edges_to_csr(len(edges.nodes), edges.sources, edges.targets)
+    adjacency = sp.csr_array(adjacency + sp.eye_array(adjacency.shape[0], format="csr"))
+    adjacency.data[:] = 1.0
+    adjacency.sort_indices()
+
+    return adjacency
+
+
+def dense_similarity(adjacency):
+    """
+    Compute the similarity of all node pairs, as the negative squared Euclidean
+    distance between their closed neighborhoods.
+
+    These are the similarities AffinityPropagation computes from the rows of the
+    edge matrix, derived from the neighborhood overlaps (A @ A) instead of
+    comparing every pair of dense rows: |N(i)| + |N(j)| - 2 |N(i) & N(j)|.
+
+    Args:
+        adjacency (scipy.sparse.csr_array): Closed neighborhood matrix.
+
+    Returns:
+        numpy.ndarray: The N x N similarity matrix.
+    """
+    sizes = np.diff(adjacency.indptr).astype(np.float64)
+
+    similarity = sparse.common_neighbors_matrix(adjacency).toarray()
+    similarity *= 2
+    similarity -= sizes[:, None]
+    similarity -= sizes[None, :]
+
+    return similarity
+
+
+def edge_similarity(adjacency):
+    """
+    Compute the similarities of dense_similarity() for the stored entries of a
+    closed neighborhood matrix only, i.e. for the adjacent pairs and every node
+    with itself.
+
+    Args:
+        adjacency (scipy.sparse.csr_array): Closed neighborhood matrix.
+
+    Returns:
+        tuple: (rows, cols, similarities) arrays, in the order of the stored entries.
+    """
+    sizes = np.diff(adjacency.indptr).astype(np.float64)
+    rows = np.repeat(np.arange(adjacency.shape[0], dtype=np.int64), np.diff(adjacency.indptr))
+    cols = adjacency.indices.astype(np.int64)
+
+    overlap = sparse.chunked_product_scores(adjacency, adjacency, rows, cols)
+    similarities = 2 * overlap - sizes[rows] - sizes[cols]
+
+    return rows, cols, similarities
+
+
+def _row_argmax(values, indptr, rows):
+    """
+    Maximum of every row of CSR-ordered entries, and the position of its first occurrence.
+    """
+    row_max = np.maximum.reduceat(values, indptr[:-1])
+    positions = np.flatnonzero(values == row_max[rows])
+    first = positions[np.unique(rows[positions], return_index=True)[1]]
+
+    return row_max, first
+
+
+def sparse_affinity_propagation(
+    adjacency,
+    damping=0.6,
+    preference=None,
+    max_iter=200,
+    convergence_iter=15,
+    random_state=0,
+):
+    """
+    Run affinity propagation with messages passed along the edges of the network only.
+
+    The responsibilities and availabilities of the dense algorithm are stored
+    for the entries of the closed neighborhood matrix, so a node can only pick
+    itself or one of its neighbors as exemplar, and memory scales with the
+    number of edges instead of N^2. The message updates, damping and
+    convergence test are the ones of sklearn's AffinityPropagation.
+
+    Args:
+        adjacency (scipy.sparse.csr_array): Closed neighborhood matrix.
+        damping (float): Damping factor of the message updates.
+        preference (float or None): Self-similarity of every node. None uses the
+            median similarity of the adjacent pairs.
+        max_iter (int): Maximum number of iterations.
+        convergence_iter (int): Number of iterations without a change of exemplars
+            after which the algorithm stops.
+        random_state (int or None): Seed of the noise that removes degeneracies.
+
+    Returns:
+        numpy.ndarray: Cluster label of every node. Nodes that have no exemplar
+            among their neighbors, and nodes without neighbors, are labelled as
+            a cluster of their own.
+    """
+    n_nodes = adjacency.shape[0]
+    isolated = np.diff(adjacency.indptr) == 1
+    if isolated.any():
+        # A node whose closed neighborhood is itself can only be its own exemplar, and
+        # has no second-best exemplar to compute its responsibility from, so messages
+        # are only passed between the other nodes.
+        kept = np.flatnonzero(~isolated)
+        labels = np.arange(n_nodes)
+        if len(kept):
+            labels[kept] = kept[
+                sparse_affinity_propagation(
+                    sp.csr_array(adjacency[kept][:, kept]),
+                    damping=damping,
+                    preference=preference,
+                    max_iter=max_iter,
+                    convergence_iter=convergence_iter,
+                    random_state=random_state,
+                )
+            ]
+        return np.unique(labels, return_inverse=True)[1]
+
+    indptr = adjacency.indptr
+    rows, cols, S = edge_similarity(adjacency)
+    diagonal = np.flatnonzero(rows == cols)
+
+    if preference is None:
+        off_diagonal = S[rows != cols]
+        preference = np.median(off_diagonal) if len(off_diagonal) else 0.0
+    S[diagonal] = preference
+
+    # Remove degeneracies
+    rng = np.random.default_rng(random_state)
+    S += (np.finfo(S.dtype).eps * S + np.finfo(S.dtype).tiny * 100) * rng.standard_normal(len(S))
+
+    A = np.zeros_like(S)
+    R = np.zeros_like(S)
+    e = np.zeros((n_nodes, convergence_iter), dtype=bool)
+
+    for it in range(max_iter):
+        # Responsibilities
+        AS = A + S
+        Y, I = _row_argmax(AS, indptr, rows)
+        AS[I] = -np.inf
+        Y2 = np.maximum.reduceat(AS, indptr[:-1])
+
+        Rnew = S - Y[rows]
+        Rnew[I] = S[I] - Y2
+        R = damping * R + (1 - damping) * Rnew
+
+        # Availabilities
+        Rp = np.maximum(R, 0)
+        Rp[diagonal] = R[diagonal]
+        Anew = np.bincount(cols, weights=Rp, minlength=n_nodes)[cols] - Rp
+        dA = Anew[diagonal]
+        Anew = np.minimum(Anew, 0)
+        Anew[diagonal] = dA
+        A = damping * A + (1 - damping) * Anew
+
+        # Check for convergence
+        E = (A[diagonal] + R[diagonal]) > 0
+        e[:, it % convergence_iter] = E
+        if it >= convergence_iter:
+            se = np.sum(e, axis=1)
+            converged = np.sum((se == convergence_iter) + (se == 0)) == n_nodes
+            if converged and E.any():
+                break
+
+    # Assign every node to the most similar exemplar among its neighbors
+    exemplar_entries = E[cols]
+    _, best = _row_argmax(np.where(exemplar_entries, S, -np.inf), indptr, rows)
+    labels = np.where(exemplar_entries[best], cols[best], np.arange(n_nodes))
+    labels[E] = np.flatnonzero(E)
+
+    # Reduce labels to a sorted, gapless, list
+    return np.unique(labels, return_inverse=True)[1]
+
+
 def get_clusters(clustering_data, name_dict):
     """
     Organize nodes into clusters based on clustering results.
@@ -98,16 +286,24 @@ def save_clusters(clusters, file, org, percent, clustering, saving_folder_path):
                 f.write(str(tuple(c)) + "\n")
 
 
-def cluster_network(filepath, saving_folder_path):
+def cluster_network(filepath, saving_folder_path, mode="dense", damping=0.6):
     """
     Apply clustering algorithms to a network and save the results.
 
     This function reads a weighted edgelist file, applies the Affinity
     Propagation clustering algorithm, and saves the clustering results.
 
+    In 'dense' mode, sklearn's AffinityPropagation runs on the precomputed
+    similarities of all node pairs, the same ones it would compute from the
+    edge matrix. In 'sparse' mode, messages are only passed along the edges
+    (see sparse_affinity_propagation), so memory scales with the number of
+    edges and full-proteome networks fit in memory.
+
     Args:
         filepath (str): Path to the weighted edgelist file.
         saving_folder_path (str): Path to the folder for saving clustering results.
+        mode (str): One of AP_MODES.
+        damping (float): Damping factor of the message updates.
 
     Returns:
         None
@@ -118,22 +314,30 @@ def cluster_network(filepath, saving_folder_path):
     percent = prefix_list[-2].split("_")[-1]
     algorithm = "ap"
 
-    # Read the weighted edgelist and convert to edge matrix
-    G = nx.read_weighted_edgelist(filepath, create_using=nx.Graph(), nodetype=str)
-    edge_mat = graph_to_edge_matrix(G)
-
-    # Initialize clustering algorithms
-    algorithms = {"affinity": cluster.AffinityPropagation(damping=0.6)}
+    # Read the weighted edgelist and build the closed neighborhood matrix
+    edges = graph_io.read_edgelist(filepath)
+    adjacency = closed_neighborhood_matrix(edges)
+    node_indices = {node: i for i, node in enumerate(edges.nodes)}
 
     results = []
 
-    # Fit all models
-    for model in algorithms.values():
-        model.fit(edge_mat[0])
-        results.append(list(model.labels_))
+    if mode == "sparse":
+        results.append(list(sparse_affinity_propagation(adjacency, damping=damping)))
+    elif mode == "dense":
+        # Initialize clustering algorithms
+        algorithms = {
+            "affinity": cluster.AffinityPropagation(damping=damping, affinity="precomputed")
+        }
+
+        # Fit all models
+        for model in algorithms.values():
+            model.fit(dense_similarity(adjacency))
+            results.append(list(model.labels_))
+    else:
+        raise ValueError(f"Unknown affinity propagation mode '{mode}', expected one of {AP_MODES}.")
 
     # Extract cluster data
-    clust_data = get_clusters(results, edge_mat[1])
+    clust_data = get_clusters(results, node_indices)
 
     # Save clustering results
     save_clusters(clust_data, filepath, organism, percent, algorithm, saving_folder_path)
@@ -1,5 +1,39 @@
 import os
-import subprocess
+import tempfile
+import traceback
+
+from clustering_module import jvm
+
+# The ClusterONE jar, shipped in clustering_module
+CLUSTERONE_JAR = jvm.jar_path("ClusterONE-v1.0.jar")
+
+
+def clusters_filepath(filepath, saving_folder_path):
+    """
+    Path of the clustered results of a network file in the saving folder.
+    """
+    # Extract details from the filepath
+    prefix_list = filepath.split("/")
+    organism = prefix_list[-2].split("_")[-2]
+    algorithm = "clusterone"
+
+    # Prepare the new filename for the clustered results
+    original_name = os.path.basename(filepath)
+    file_name, file_ext = os.path.splitext(original_name)
+    new_filename = f"{file_name}_{organism}_{algorithm}.txt"
+
+    return os.path.join(saving_folder_path, new_filename)
+
+
+def save_clusters(stdout, saving_path):
+    """
+    Write the clusters printed by ClusterONE, one tab-separated cluster per line, to a text file.
+    """
+    with open(saving_path, "w") as file:
+        for cluster in stdout.split("\n"):
+            if cluster:
+                tuple_cluster = str(tuple(cluster.split("\t")))
+                file.write(f"{tuple_cluster}\n")
 
 
 def cluster_network(filepath, saving_folder_path):
@@ -16,37 +50,44 @@ def cluster_network(filepath, saving_folder_path):
     Note:
     The function uses the ClusterONE-v1.0.jar file located in the 'clustering_module' directory.
     The output is saved as a text file with the clustered results.
+    Every call runs Java in its own temporary working directory, so calls can
+    run concurrently from any working directory.
     """
-    # Define the absolute path to the ClusterONE JAR file
-    absolute_path_jar_file = os.path.join(
-        os.path.abspath("clustering_module"), "ClusterONE-v1.0.jar"
-    )
+    # Run the ClusterONE Java subprocess in a temporary working directory and capture the output
+    with tempfile.TemporaryDirectory(prefix="clusterone-") as working_folder:
+        result = jvm.run_jar(CLUSTERONE_JAR, [os.path.abspath(filepath)], working_folder)
 
-    # Extract details from the filepath
-    prefix_list = filepath.split("/")
-    organism = prefix_list[-2].split("_")[-2]
-    algorithm = "clusterone"
+    save_clusters(result.stdout, clusters_filepath(filepath, saving_folder_path))
 
-    # Prepare the new filename for the clustered results
-    original_name = os.path.basename(filepath)
-    file_name, file_ext = os.path.splitext(original_name)
-    new_filename = f"{file_name}_{organism}_{algorithm}.txt"
 
-    try:
-        # Run the ClusterONE Java subprocess and capture the output
-        result = subprocess.run(
-            ["java", "-jar", absolute_path_jar_file, filepath], stdout=subprocess.PIPE, text=True
+def cluster_networks(jobs):
+    """
+    Clusters many networks using ClusterONE, in a single Java process.
+
+    The results are the same as calling cluster_network() on every network,
+    without paying for the startup of a JVM per network. When the batch driver
+    cannot be compiled, cluster_network() is called on every network instead.
+
+    Args:
+    jobs (list): (filepath, saving_folder_path) tuples.
+
+    Returns:
+    list: (job, traceback) tuples of the networks that could not be clustered.
+    """
+    if jvm.driver_folder() is None:
+        return jvm.run_jobs(cluster_network, jobs, workers=1)
+
+    with tempfile.TemporaryDirectory(prefix="clusterone-") as working_folder:
+        results = jvm.run_batch(
+            CLUSTERONE_JAR, [[os.path.abspath(filepath)] for filepath, _ in jobs], working_folder
         )
-        output = result.stdout.split("\n")
-
-        # Define the path for saving the clustered results
-        saving_path = os.path.join(saving_folder_path, new_filename)
-
-        # Write the clustered results to a text file
-        with open(saving_path, "w") as file:
-            for cluster in output:
-                if cluster:
-                    tuple_cluster = str(tuple(cluster.split("\t")))
-                    file.write(f"{tuple_cluster}\n")
-    except subprocess.CalledProcessError as e:
-        raise subprocess.CalledProcessError(f"Error occurred: {e}")
+
+    failed_jobs = []
+    for job, result in zip(jobs, results):
+        try:
+            result.check_returncode()
+            save_clusters(result.stdout, clusters_filepath(*job))
+        except Exception:
+            failed_jobs.append((job, traceback.format_exc()))
+
+    return failed_jobs
@@ -1,29 +1,38 @@
 import os
-import subprocess
 import shutil
+import tempfile
+import traceback
 
+from clustering_module import jvm
 
-def copy_temp_file(filepath):
+# The IMHRC jar, shipped in clustering_module/imhrc
+IMHRC_JAR = jvm.jar_path("imhrc", "IMHRC-V1.jar")
+
+
+def copy_temp_file(filepath, destination_folder=".", file_name=None):
     """
-    Copies a network temp file to the current working directory.
+    Copies a network temp file to a working directory.
 
     Args:
     - filepath (str): Path of the file to be copied.
+    - destination_folder (str): Folder the file is copied to.
+    - file_name (str or None): Name of the copy. None keeps the name of the file.
 
     Returns:
-    - str: Path of the copied file in the current working directory.
+    - str: Path of the copied file in the working directory.
     """
     try:
-        # Source file path (file to be copied)
-        source_file = filepath
-
         # Destination file path (where the file will be copied)
-        destination_folder = os.path.abspath(".")  # Replace with the desired destination file path
+        destination_folder = os.path.abspath(destination_folder)
+
+        destination_filepath = os.path.join(
+            destination_folder, file_name or os.path.basename(filepath)
+        )
 
         # Copy the file from source to destination
-        shutil.copy(source_file, destination_folder)
+        shutil.copy(filepath, destination_filepath)
 
-        return os.path.join(destination_folder, os.path.basename(filepath))
+        return destination_filepath
     except FileNotFoundError:
         print(f"Error: File '{filepath}' not found.")
     except PermissionError:
@@ -32,7 +41,44 @@ def copy_temp_file(filepath):
         print(f"An error occurred: {e}")
 
 
-def save_clusters(input_filepath, temp_filepath, temp_filename, output_folder_path):
+def find_cluster_file(workspace, temp_filepath):
+    """
+    Find the clusters written by the IMHRC jar in a job workspace.
+
+    The jar writes the clusters of '<name>' under '<working directory>\\IMHRC',
+    as 'IMHRC/<name>' in the working directory on Windows. Elsewhere the
+    backslash is part of the file name, so they are written next to the
+    working directory, to a file named '<working directory name>\\IMHRC<name>'.
+    Only these two paths are accepted.
+
+    Args:
+    - workspace (str): Folder containing the working directory of the job.
+    - temp_filepath (str): Path of the input copy passed to the jar, in the
+      working directory.
+
+    Returns:
+    - str: Path of the cluster file.
+
+    Raises:
+    - FileNotFoundError: If the jar did not write the cluster file.
+    - ValueError: If the cluster file was written to both paths.
+    """
+    working_folder, temp_filename = os.path.split(temp_filepath)
+    candidates = [
+        os.path.join(workspace, f"{os.path.basename(working_folder)}\\IMHRC{temp_filename}"),
+        os.path.join(working_folder, "IMHRC", temp_filename),
+    ]
+
+    cluster_files = [path for path in candidates if os.path.isfile(path)]
+    if not cluster_files:
+        raise FileNotFoundError(f"IMHRC wrote no clusters for '{temp_filename}'.")
+    if len(cluster_files) > 1:
+        raise ValueError(f"IMHRC wrote several cluster files for '{temp_filename}': {cluster_files}")
+
+    return cluster_files[0]
+
+
+def save_clusters(input_filepath, cluster_file_path, output_folder_path):
     # Extract details from the input filepath
     filepath_parts = input_filepath.split("/")
     organism = filepath_parts[-2].split("_")[-2]
@@ -43,25 +89,9 @@ def save_clusters(input_filepath, temp_filepath, temp_filename, output_folder_pa
     filename_no_ext, file_extension = os.path.splitext(original_filename)
     new_filename = f"{filename_no_ext}_{organism}_{algorithm}.txt"
 
-    # Extract cluster temporary path
-    cluster_tmp_path = temp_filepath.split("imhrc")[0]
-
-    # Find the cluster files
-    cluster_folder = "imhrc\\IMHRC"
-    abspath_cluster_tmp = os.path.abspath(cluster_tmp_path)
-    cluster_file_pattern = cluster_folder + temp_filename
-    cluster_files = [f for f in os.listdir(cluster_tmp_path) if temp_filename in f]
-
-    # Define paths
-    cluster_folder_path = os.path.join(abspath_cluster_tmp, cluster_folder)
-    file_cluster_path = os.path.join(abspath_cluster_tmp, cluster_files[0])
-
-    # Remove temporary cluster folder
-    shutil.rmtree(cluster_folder_path)
-
     # Extract clusters from the file
     cluster_output = []
-    with open(file_cluster_path, "r") as file:
+    with open(cluster_file_path, "r") as file:
         for line in file:
             cluster = tuple(line.strip().split("\t"))
             cluster_output.append(cluster)
@@ -72,14 +102,16 @@ def save_clusters(input_filepath, temp_filepath, temp_filename, output_folder_pa
         for cluster in cluster_output:
             file.write(f"{cluster}\n")
 
-    # Remove temporary cluster file
-    os.remove(file_cluster_path)
-
 
 def cluster_network(filepath, saving_folder_path):
     """
     Cluster a network file and save the results.
 
+    Every call runs the jar in its own temporary workspace, with the input
+    copied into the working directory and the jar referenced by its absolute
+    path. Calls never change the working directory of the process, so they can
+    run concurrently.
+
     Args:
     - filepath (str): Path to the network file to be clustered.
     - saving_folder_path (str): Folder path to save the clustered results.
@@ -87,22 +119,66 @@ def cluster_network(filepath, saving_folder_path):
     Returns:
     - None
     """
-    abs_filepath = os.path.abspath(filepath)
-    root = abs_filepath.split("data")[0]
-    working = os.path.join(root, "clustering_module/imhrc")
-    clustering_module_path = os.path.join(root, "clustering_module")
-    abs_saving_path = os.path.abspath(saving_folder_path)
+    with tempfile.TemporaryDirectory(prefix="imhrc-") as workspace:
+        # The jar writes its results next to its working directory, so the
+        # working directory is a subfolder of the workspace
+        working_folder = os.path.join(workspace, "imhrc")
+        os.makedirs(working_folder)
+
+        # Create a temp copy of the network to cluster
+        temp_filepath = copy_temp_file(filepath, working_folder)
 
-    os.chdir(working)
+        jvm.run_jar(IMHRC_JAR, [os.path.basename(temp_filepath)], working_folder)
 
-    # Create a temp copy of the network to cluster
-    temp_filepath = copy_temp_file(abs_filepath)
-    temp_filename = temp_filepath.split("/")[-1]
+        save_clusters(filepath, find_cluster_file(workspace, temp_filepath), saving_folder_path)
 
-    subprocess.call(["java", "-jar", "IMHRC-V1.jar", temp_filename])
 
-    os.remove(temp_filename)
+def cluster_networks(jobs):
+    """
+    Cluster many network files in a single Java process and save the results.
 
-    save_clusters(filepath, temp_filepath, temp_filename, abs_saving_path)
+    The results are the same as calling cluster_network() on every network,
+    without paying for the startup of a JVM per network. The inputs are copied
+    to a shared working directory under names unique to their job, which the
+    jar also uses to name its results. When the batch driver cannot be
+    compiled, cluster_network() is called on every network instead.
 
-    os.chdir(root)
+    Args:
+    - jobs (list): (filepath, saving_folder_path) tuples.
+
+    Returns:
+    - list: (job, traceback) tuples of the networks that could not be clustered.
+    """
+    if jvm.driver_folder() is None:
+        return jvm.run_jobs(cluster_network, jobs, workers=1)
+
+    failed_jobs = []
+    with tempfile.TemporaryDirectory(prefix="imhrc-") as workspace:
+        working_folder = os.path.join(workspace, "imhrc")
+        os.makedirs(working_folder)
+
+        # Fixed-width prefixes, so that no copy name contains another one
+        temp_filepaths = [
+            copy_temp_file(
+                filepath, working_folder, f"job{index:06d}-{os.path.basename(filepath)}"
+            )
+            for index, (filepath, _) in enumerate(jobs)
+        ]
+
+        results = jvm.run_batch(
+            IMHRC_JAR,
+            [[os.path.basename(temp_filepath)] for temp_filepath in temp_filepaths],
+            working_folder,
+        )
+
+        for job, temp_filepath, result in zip(jobs, temp_filepaths, results):
+            filepath, saving_folder_path = job
+            try:
+                result.check_returncode()
+                save_clusters(
+                    filepath, find_cluster_file(workspace, temp_filepath), saving_folder_path
+                )
+            except Exception:
+                failed_jobs.append((job, traceback.format_exc()))
+
+    return failed_jobs
@@ -0,0 +1,320 @@
+import functools
+import hashlib
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import traceback
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Folder of the clustering module, with the jars of the Java clusterers
+MODULE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Source of the driver running a clusterer on many networks in one JVM
+DRIVER_SOURCE = os.path.join(MODULE_FOLDER, "BatchDriver.java")
+DRIVER_CLASS = "BatchDriver"
+
+# Default maximum number of networks clustered by one Java process in batch mode,
+# which the clustering command only uses when asked to (--java-batch-size)
+BATCH_SIZE = 64
+
+
+def jar_path(*parts):
+    """
+    Absolute path of a jar shipped with the clustering module, whatever the working directory.
+    """
+    return os.path.join(MODULE_FOLDER, *parts)
+
+
+def run_jar(jar, arguments, working_folder):
+    """
+    Run a jar in its own working directory and capture its output.
+
+    Args:
+        jar (str): Absolute path to the jar.
+        arguments (list): Command-line arguments of the jar.
+        working_folder (str): Working directory of the Java process.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process, with its stdout and stderr as text.
+
+    Raises:
+        subprocess.CalledProcessError: If the Java process exits with an error.
+    """
+    return subprocess.run(
+        ["java", "-jar", jar, *arguments],
+        cwd=working_folder,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+
+
+def _build_once(folder, build):
+    """
+    Build a cache folder under the temp directory once, shared by every process.
+
+    The folder is built under a temporary name by `build` and then renamed, so
+    that concurrent processes never see it half-built.
+
+    Returns:
+        str or None: The folder, or None if `build` failed.
+    """
+    if os.path.isdir(folder):
+        return folder
+
+    staging_folder = tempfile.mkdtemp(prefix=f"{os.path.basename(folder)}-")
+    try:
+        build(staging_folder)
+    except (OSError, subprocess.CalledProcessError, zipfile.BadZipFile):
+        shutil.rmtree(staging_folder, ignore_errors=True)
+        return None
+
+    try:
+        os.rename(staging_folder, folder)
+    except OSError:
+        # Built concurrently by another process
+        shutil.rmtree(staging_folder, ignore_errors=True)
+
+    return folder
+
+
+@functools.lru_cache(maxsize=None)
+def driver_folder():
+    """
+    Compile the batch driver, once per version of its source.
+
+    Returns:
+        str or None: Folder of the compiled driver, or None if javac is not
+            available or the compilation failed, in which case the clusterers
+            run one Java process per network.
+    """
+    if shutil.which("javac") is None:
+        return None
+
+    with open(DRIVER_SOURCE, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+
+    def compile_driver(folder):
+        subprocess.run(
+            ["javac", "-d", folder, DRIVER_SOURCE],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+
+    folder = os.path.join(tempfile.gettempdir(), f"ppi-batch-driver-{digest}")
+    return _build_once(folder, compile_driver)
+
+
+def _manifest(archive):
+    # Main attributes of a jar manifest, with the continuation lines joined
+    text = archive.read("META-INF/MANIFEST.MF").decode("utf-8")
+    attributes = {}
+    name = None
+    for line in text.replace("\r\n", "\n").split("\n"):
+        if not line.strip():
+            break
+        if line.startswith(" ") and name is not None:
+            attributes[name] += line[1:]
+        else:
+            name, _, value = line.partition(":")
+            attributes[name] = value.strip()
+    return attributes
+
+
+@functools.lru_cache(maxsize=None)
+def jar_classpath(jar):
+    """
+    Classpath and main class of a jar, to run it from the batch driver.
+
+    Jars packaged by Eclipse start through a loader of nested jars, which can
+    only be set up once per JVM. The nested jars are extracted next to the
+    driver instead, and the actual main class is used.
+
+    Args:
+        jar (str): Absolute path to the jar.
+
+    Returns:
+        tuple: (classpath, main_class), the classpath being a list of paths.
+    """
+    with zipfile.ZipFile(jar) as archive:
+        manifest = _manifest(archive)
+        nested_jars = [
+            entry for entry in manifest.get("Rsrc-Class-Path", "").split() if entry.endswith(".jar")
+        ]
+        main_class = manifest.get("Rsrc-Main-Class") or manifest["Main-Class"]
+
+        if not nested_jars:
+            return [jar], main_class
+
+        stat = os.stat(jar)
+        key = f"{jar}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8")
+        folder = os.path.join(
+            tempfile.gettempdir(), f"ppi-jar-{hashlib.sha1(key).hexdigest()[:16]}"
+        )
+        folder = _build_once(
+            folder, lambda staging_folder: archive.extractall(staging_folder, nested_jars)
+        )
+        if folder is None:
+            raise OSError(f"Could not extract the nested jars of '{jar}'.")
+
+    return [jar, *(os.path.join(folder, entry) for entry in nested_jars)], main_class
+
+
+def _read_log(path):
+    if not os.path.exists(path):
+        return ""
+    with open(path) as f:
+        return f.read()
+
+
+def run_batch(jar, jobs, working_folder):
+    """
+    Run a jar on many argument lists in a single Java process.
+
+    The jobs run one after the other in the batch driver, which must be
+    available (see driver_folder()), each with its own standard output and
+    error, so every result matches what run_jar() returns for the same arguments.
+
+    Args:
+        jar (str): Absolute path to the jar.
+        jobs (list): Command-line arguments of every run, as lists of strings.
+        working_folder (str): Working directory of the Java process.
+
+    Returns:
+        list: subprocess.CompletedProcess of every job, in order. Jobs that did
+            not finish, e.g. because the JVM crashed, have the exit code and
+            standard error of the Java process.
+    """
+    classpath, main_class = jar_classpath(jar)
+    command = ["java", "-cp", os.pathsep.join([driver_folder(), *classpath]), DRIVER_CLASS]
+
+    with tempfile.TemporaryDirectory(prefix="batch-") as log_folder:
+        lines = []
+        for index, arguments in enumerate(jobs):
+            if any("\t" in argument or "\n" in argument for argument in arguments):
+                raise ValueError(f"Batch arguments cannot contain tabs or newlines: {arguments}")
+            out_path = os.path.join(log_folder, f"{index}.out")
+            err_path = os.path.join(log_folder, f"{index}.err")
+            lines.append("\t".join([out_path, err_path, *arguments]))
+
+        process = subprocess.run(
+            [*command, main_class],
+            cwd=working_folder,
+            input="\n".join(lines) + "\n",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+
+        exit_codes = {}
+        for line in process.stdout.splitlines():
+            index, _, exit_code = line.partition("\t")
+            exit_codes[int(index)] = int(exit_code)
+
+        results = []
+        for index, arguments in enumerate(jobs):
+            outputs = [
+                _read_log(os.path.join(log_folder, f"{index}.{extension}"))
+                for extension in ("out", "err")
+            ]
+
+            returncode = exit_codes.get(index)
+            if returncode is None:
+                returncode = process.returncode or 1
+                outputs[1] += process.stderr
+
+            results.append(
+                subprocess.CompletedProcess(["java", "-jar", jar, *arguments], returncode, *outputs)
+            )
+
+    return results
+
+
+def run_jobs(cluster_network, jobs, workers=None):
+    """
+    Run a Java clusterer on many networks concurrently.
+
+    Every job spends its time waiting for its own Java process, so the jobs run
+    on a thread pool, which bounds the number of Java processes running at once.
+
+    Args:
+        cluster_network (callable): The cluster_network function of the clusterer.
+        jobs (list): (filepath, saving_folder_path) tuples.
+        workers (int or None): Maximum number of concurrent Java processes. None
+            uses the number of CPUs.
+
+    Returns:
+        list: (job, traceback) tuples of the jobs that failed.
+    """
+    failed_jobs = []
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(cluster_network, *job): job for job in jobs}
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+            except Exception:
+                failed_jobs.append((job, traceback.format_exc()))
+
+    return failed_jobs
+
+
+def split_batches(jobs, workers=None, batch_size=BATCH_SIZE):
+    """
+    Split jobs in batches of at most `batch_size` networks, and in at least one
+    batch per worker, keeping their order.
+
+    Args:
+        jobs (list): (filepath, saving_folder_path) tuples.
+        workers (int or None): Number of concurrent Java processes. None uses
+            the number of CPUs.
+        batch_size (int): Maximum number of networks per Java process.
+
+    Returns:
+        list: The batches, as lists of jobs.
+    """
+    workers = workers or os.cpu_count()
+    batch_size = max(1, min(batch_size, math.ceil(len(jobs) / workers)))
+    return [jobs[start : start + batch_size] for start in range(0, len(jobs), batch_size)]
+
+
+def run_batches(cluster_networks, jobs, workers=None, batch_size=BATCH_SIZE):
+    """
+    Run a Java clusterer on many networks, with batches of networks per Java process.
+
+    The batches (see split_batches()) run on a thread pool.
+
+    Args:
+        cluster_networks (callable): The cluster_networks function of the
+            clusterer, taking a list of jobs and returning the failed ones.
+        jobs (list): (filepath, saving_folder_path) tuples.
+        workers (int or None): Maximum number of concurrent Java processes. None
+            uses the number of CPUs.
+        batch_size (int): Maximum number of networks per Java process.
+
+    Returns:
+        list: (job, traceback) tuples of the jobs that failed.
+    """
+    workers = workers or os.cpu_count()
+
+    failed_jobs = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(cluster_networks, batch): batch
+            for batch in split_batches(jobs, workers, batch_size)
+        }
+
+        for future in as_completed(futures):
+            try:
+                failed_jobs.extend(future.result())
+            except Exception:
+                error = traceback.format_exc()
+                failed_jobs.extend((job, error) for job in futures[future])
+
+    return failed_jobs
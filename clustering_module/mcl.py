@@ -1,11 +1,19 @@
-from markov_clustering import mcl as mcl
-
-import networkx as nx
-import sklearn as sk
 import numpy as np
-from sklearn import cluster
+import scipy.sparse as sp
 import os
 
+import graph_io
+from similarity import sparse
+
+# Default parameters of the MCL algorithm, the ones of markov_clustering.run_mcl
+MCL_EXPANSION = 2
+MCL_INFLATION = 2
+MCL_LOOP_VALUE = 1
+MCL_ITERATIONS = 100
+MCL_PRUNING_THRESHOLD = 0.001
+MCL_PRUNING_FREQUENCY = 1
+MCL_CONVERGENCE_CHECK_FREQUENCY = 1
+
 
 def get_clusters(clustering_data, name_dict):
     """
@@ -58,16 +66,274 @@ def translate_node_ids(clusters, nodes):
     return translated_clusters
 
 
-def cluster_network(filepath, saving_folder_path):
+def _entry_columns(matrix):
+    """
+    Column index of every stored entry of a CSC matrix.
+    """
+    return np.repeat(np.arange(matrix.shape[1], dtype=np.int64), np.diff(matrix.indptr))
+
+
+def normalize(matrix):
+    """
+    Normalize the columns of a sparse matrix, so that each of them sums to 1.
+
+    Columns that sum to 0 are left as they are.
+
+    Args:
+        matrix (scipy.sparse matrix): The matrix to normalize.
+
+    Returns:
+        scipy.sparse.csc_array: The column-stochastic matrix.
+    """
+    matrix = sp.csc_array(matrix, copy=True)
+    columns = _entry_columns(matrix)
+    sums = np.bincount(columns, weights=np.abs(matrix.data), minlength=matrix.shape[1])
+    scale = np.divide(1.0, sums, out=np.zeros_like(sums), where=sums != 0)
+    matrix.data *= scale[columns]
+    return matrix
+
+
+def add_self_loops(adjacency, loop_value=MCL_LOOP_VALUE):
+    """
+    Set the diagonal of an adjacency matrix to loop_value.
+
+    Args:
+        adjacency (scipy.sparse matrix): The adjacency matrix.
+        loop_value (float): Weight of the self-loops. 0 keeps the matrix as it is.
+
+    Returns:
+        scipy.sparse.csc_array: The matrix with self-loops.
+    """
+    adjacency = sp.csc_array(adjacency)
+    if loop_value <= 0:
+        return adjacency
+
+    diagonal = sp.diags_array(loop_value - adjacency.diagonal(), format="csc")
+    matrix = sp.csc_array(adjacency + diagonal)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def inflate(matrix, power):
+    """
+    Raise every entry of a matrix to the given power, and normalize its columns.
+    """
+    return normalize(matrix.power(power))
+
+
+def prune(matrix, threshold):
+    """
+    Remove the entries below threshold, except the largest entry of every column.
+
+    Args:
+        matrix (scipy.sparse.csc_array): The matrix to prune.
+        threshold (float): The value below which entries are removed.
+
+    Returns:
+        scipy.sparse.csc_array: The pruned matrix.
+    """
+    matrix = sp.csc_array(matrix)
+    matrix.sort_indices()
+
+    keep = matrix.data >= threshold
+
+    # Keep the first largest entry of every non-empty column, like argmax
+    columns = _entry_columns(matrix)
+    non_empty = np.flatnonzero(np.diff(matrix.indptr))
+    if len(non_empty):
+        column_max = np.maximum.reduceat(matrix.data, matrix.indptr[non_empty])
+        is_max = matrix.data == np.repeat(column_max, np.diff(matrix.indptr)[non_empty])
+        max_positions = np.flatnonzero(is_max)
+        first = max_positions[np.unique(columns[max_positions], return_index=True)[1]]
+        keep[first] = True
+
+    indptr = np.concatenate([[0], np.cumsum(keep)])[matrix.indptr]
+    return sp.csc_array((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
+
+
+def converged(matrix1, matrix2, rtol=1e-5, atol=1e-8):
+    """
+    Check whether two sparse matrices are equal within the tolerances of np.allclose.
+    """
+    difference = np.abs(matrix1 - matrix2) - rtol * np.abs(matrix2)
+    return difference.max() <= atol
+
+
+def initial_matrix(adjacency, loop_value=MCL_LOOP_VALUE):
+    """
+    Build the column-stochastic matrix MCL starts from: the adjacency with
+    self-loops, normalized.
+    """
+    return normalize(add_self_loops(adjacency, loop_value))
+
+
+def expand(matrix, expansion=MCL_EXPANSION):
+    """
+    Raise a sparse matrix to the given integer power.
+    """
+    expanded = matrix
+    for _ in range(expansion - 1):
+        expanded = expanded @ matrix
+    return sp.csc_array(expanded)
+
+
+def run_sparse_mcl(
+    matrix,
+    expansion=MCL_EXPANSION,
+    inflation=MCL_INFLATION,
+    iterations=MCL_ITERATIONS,
+    pruning_threshold=MCL_PRUNING_THRESHOLD,
+    pruning_frequency=MCL_PRUNING_FREQUENCY,
+    convergence_check_frequency=MCL_CONVERGENCE_CHECK_FREQUENCY,
+    first_expansion=None,
+):
+    """
+    Run MCL on scipy sparse matrices.
+
+    This follows markov_clustering.run_mcl step by step (expansion, inflation,
+    pruning, convergence check), but every step is a vectorized sparse
+    operation, so the matrix never becomes dense as long as pruning keeps it
+    sparse.
+
+    Args:
+        matrix (scipy.sparse matrix): The initial column-stochastic matrix, see
+            initial_matrix().
+        expansion (int): The cluster expansion factor.
+        inflation (float): The cluster inflation factor.
+        iterations (int): Maximum number of iterations.
+        pruning_threshold (float): Threshold below which matrix entries are
+            removed. 0 disables pruning.
+        pruning_frequency (int): Prune every pruning_frequency iterations.
+        convergence_check_frequency (int): Check for convergence every
+            convergence_check_frequency iterations.
+        first_expansion (scipy.sparse matrix or None): The expansion of matrix,
+            if it was already computed, e.g. for another inflation.
+
+    Returns:
+        scipy.sparse.csc_array: The final matrix.
+    """
+    if expansion <= 1 or inflation <= 1:
+        raise ValueError("The expansion and inflation parameters must be greater than 1.")
+
+    matrix = sp.csc_array(matrix)
+
+    for i in range(iterations):
+        last_matrix = matrix
+
+        # Expansion, reusing the first one if it was given
+        if i == 0 and first_expansion is not None:
+            matrix = sp.csc_array(first_expansion)
+        else:
+            matrix = expand(matrix, expansion)
+
+        # Inflation
+        matrix = inflate(matrix, inflation)
+
+        # Pruning
+        if pruning_threshold > 0 and i % pruning_frequency == pruning_frequency - 1:
+            matrix = prune(matrix, pruning_threshold)
+
+        # Check for convergence
+        if i % convergence_check_frequency == convergence_check_frequency - 1:
+            if converged(matrix, last_matrix):
+                break
+
+    return matrix
+
+
+def attractor_clusters(matrix):
+    """
+    Retrieve the clusters of the final MCL matrix.
+
+    The nodes in the row of every attractor, i.e. a node with a non-zero
+    diagonal entry, form a cluster.
+
+    Args:
+        matrix (scipy.sparse matrix): The matrix produced by run_sparse_mcl().
+
+    Returns:
+        list: Sorted tuples of node ids, one per cluster.
+    """
+    matrix = sp.csr_array(matrix)
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+
+    attractors = matrix.diagonal().nonzero()[0]
+
+    clusters = set()
+    for attractor in attractors:
+        row = matrix.indices[matrix.indptr[attractor] : matrix.indptr[attractor + 1]]
+        clusters.add(tuple(row.tolist()))
+
+    return sorted(clusters)
+
+
+def sweep_inflation(
+    adjacency, inflations, expansion=MCL_EXPANSION, loop_value=MCL_LOOP_VALUE, **kwargs
+):
+    """
+    Run MCL for several inflation parameters on the same network.
+
+    The initial matrix and its first expansion do not depend on the inflation,
+    so they are computed once and shared by every run.
+
+    Args:
+        adjacency (scipy.sparse matrix): The weighted adjacency matrix.
+        inflations (list): The inflation parameters.
+        expansion (int): The cluster expansion factor.
+        loop_value (float): Weight of the self-loops.
+        **kwargs: Other parameters of run_sparse_mcl().
+
+    Returns:
+        dict: Inflation parameters mapped to their clusters, see attractor_clusters().
+    """
+    matrix = initial_matrix(adjacency, loop_value)
+    first_expansion = expand(matrix, expansion)
+
+    return {
+        inflation: attractor_clusters(
+            run_sparse_mcl(
+                matrix,
+                expansion=expansion,
+                inflation=inflation,
+                first_expansion=first_expansion,
+                **kwargs,
+            )
+        )
+        for inflation in inflations
+    }
+
+
+def cluster_network(
+    filepath,
+    saving_folder_path,
+    inflation=MCL_INFLATION,
+    expansion=MCL_EXPANSION,
+    loop_value=MCL_LOOP_VALUE,
+    pruning_threshold=MCL_PRUNING_THRESHOLD,
+    pruning_frequency=MCL_PRUNING_FREQUENCY,
+    iterations=MCL_ITERATIONS,
+):
     """
     Apply MCL clustering algorithm to a network and save the results.
 
     This function reads a weighted edgelist file, applies the MCL clustering
     algorithm, and saves the clustering results.
 
+    The network is clustered as a scipy sparse matrix. Several inflation
+    parameters can be given at once, in which case they share the parsed
+    network and its first expansion (see sweep_inflation) and each result is
+    saved with an '_I<inflation>' suffix.
+
     Args:
         filepath (str): Path to the weighted edgelist file.
         saving_folder_path (str): Path to the folder for saving clustering results.
+        inflation (float or list): The inflation parameter, or a list of them.
+        expansion (int): The cluster expansion factor.
+        loop_value (float): Weight of the self-loops.
+        pruning_threshold (float): Threshold below which matrix entries are removed.
+        pruning_frequency (int): Prune every pruning_frequency iterations.
+        iterations (int): Maximum number of iterations.
 
     Returns:
         None
@@ -78,30 +344,38 @@ def cluster_network(filepath, saving_folder_path):
     percent = prefix_list[-2].split("_")[-1]
     algorithm = "MCL"
 
-    # Read the weighted edgelist and create a graph
-    G = nx.read_weighted_edgelist(filepath, create_using=nx.Graph(), nodetype=str)
-    nodeslist = list(G.nodes)
-
-    # Convert the graph to a numpy array
-    matrix = nx.to_numpy_array(G)
+    # Read the weighted edgelist, without building a graph
+    edges = graph_io.read_edgelist(filepath)
+    nodeslist = edges.nodes
 
-    # Run MCL clustering algorithm
-    result = mcl.run_mcl(matrix)
+    # Convert the edges to a sparse matrix
+    matrix = sparse.edges_to_csr(len(nodeslist), edges.sources, edges.targets, edges.weights)
 
-    # Retrieve clusters
-    clusters = mcl.get_clusters(result)
+    # Run MCL clustering algorithm and retrieve clusters
+    inflations = list(inflation) if isinstance(inflation, (list, tuple)) else [inflation]
+    results = sweep_inflation(
+        matrix,
+        inflations,
+        expansion=expansion,
+        loop_value=loop_value,
+        iterations=iterations,
+        pruning_threshold=pruning_threshold,
+        pruning_frequency=pruning_frequency,
+    )
 
-    # Generate a new filename
-    original_name = os.path.basename(filepath)
-    file_name, file_ext = os.path.splitext(original_name)
-    new_filename = f"{file_name}_{organism}_{algorithm}.txt"
-    saving_file_path = os.path.join(saving_folder_path, new_filename)
+    for inflation_value, clusters in results.items():
+        # Generate a new filename
+        original_name = os.path.basename(filepath)
+        file_name, file_ext = os.path.splitext(original_name)
+        suffix = f"_I{inflation_value}" if len(inflations) > 1 else ""
+        new_filename = f"{file_name}_{organism}_{algorithm}{suffix}.txt"
+        saving_file_path = os.path.join(saving_folder_path, new_filename)
 
-    # Translate node IDs in clusters
-    translated_clusters = translate_node_ids(clusters, nodeslist)
+        # Translate node IDs in clusters
+        translated_clusters = translate_node_ids(clusters, nodeslist)
 
-    # Save clustering results to a file
-    with open(saving_file_path, "w") as f:
-        for cluster in translated_clusters:
-            if len(cluster) >= 3:
-                f.write(str(tuple(cluster)) + "\n")
+        # Save clustering results to a file
+        with open(saving_file_path, "w") as f:
+            for cluster in translated_clusters:
+                if len(cluster) >= 3:
+                    f.write(str(tuple(cluster)) + "\n")
@@ -1,6 +1,15 @@
 import networkx as nx
+import numpy as np
 import os
 
+import graph_io
+from similarity import sparse
+
+# Absolute difference under which weighted coefficients tie when the nodes are
+# ordered, so that coefficients equal under nx.clustering, but summed in another
+# order here, tie
+COEFFICIENT_TOLERANCE = 1e-12
+
 
 def clust_coef(G, nodes=None, weight=None):
     """
@@ -23,6 +32,83 @@ def clust_coef(G, nodes=None, weight=None):
     return c
 
 
+def clustering_coefficients(G, weight=None):
+    """
+    Calculate the clustering coefficients of all nodes at once, from sparse triangle counts.
+
+    The coefficients are the ones of nx.clustering: self-loops are ignored, and
+    on a weighted graph every triangle counts with the geometric mean of its
+    edge weights, normalized by the largest weight of the graph. The
+    triangles through node i are counted as sum_j (C @ C)_ij * C_ij over its
+    neighbors j, where C holds the cube roots of the normalized weights (1 when
+    unweighted), so the product is only evaluated for adjacent pairs.
+
+    Args:
+        G (networkx.Graph): The input graph.
+        weight (str or None): Attribute name for edge weights. If None, unweighted.
+
+    Returns:
+        numpy.ndarray: Clustering coefficient of every node, in the order of G.nodes().
+    """
+    nodes = list(G.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = list(G.edges(data=weight, default=1))
+
+    sources = np.fromiter((index[u] for u, v, w in edges), dtype=np.int64, count=len(edges))
+    targets = np.fromiter((index[v] for u, v, w in edges), dtype=np.int64, count=len(edges))
+
+    weights = None
+    if weight is not None and edges:
+        weights = np.fromiter((w for u, v, w in edges), dtype=np.float64, count=len(edges))
+        weights = np.cbrt(weights / weights.max())
+
+    # Self-loops are dropped from the arrays, and zero-weight edges are kept as
+    # explicit zeros, since they still count in the degrees
+    loops = sources == targets
+    adjacency = sparse.edges_to_csr(
+        len(nodes),
+        sources[~loops],
+        targets[~loops],
+        None if weights is None else weights[~loops],
+    )
+
+    rows = np.repeat(np.arange(len(nodes), dtype=np.int64), np.diff(adjacency.indptr))
+    cols = adjacency.indices.astype(np.int64)
+    paths = sparse.chunked_product_scores(adjacency, adjacency, rows, cols)
+    triangles = np.bincount(rows, weights=paths * adjacency.data, minlength=len(nodes))
+
+    degrees = np.diff(adjacency.indptr).astype(np.float64)
+    possible = degrees * (degrees - 1)
+
+    return np.divide(
+        triangles, possible, out=np.zeros(len(nodes)), where=(triangles != 0) & (possible != 0)
+    )
+
+
+def coefficient_order(coefficients, tolerance=0.0):
+    """
+    Order nodes by decreasing clustering coefficient, ties broken by node order.
+
+    Args:
+        coefficients (numpy.ndarray): Clustering coefficient of every node.
+        tolerance (float): Coefficients that differ by at most this much from the
+            next larger one tie with it.
+
+    Returns:
+        numpy.ndarray: Node indices, in the order the nodes are visited.
+    """
+    order = np.argsort(-coefficients, kind="stable")
+    if tolerance == 0 or len(order) == 0:
+        return order
+
+    # Runs of coefficients close to the previous larger one form a group, whose
+    # nodes are then ordered by index
+    values = coefficients[order]
+    starts = np.concatenate([[True], ~np.isclose(values[1:], values[:-1], rtol=0, atol=tolerance)])
+    groups = np.cumsum(starts)
+    return order[np.lexsort((order, groups))]
+
+
 def clustCoef_clusterin(G, weight="weight"):
     """
     Perform clustering of nodes in a graph based on clustering coefficients.
@@ -31,6 +117,13 @@ def clustCoef_clusterin(G, weight="weight"):
     coefficients. It iteratively identifies nodes with the highest coefficient,
     adds them to a cluster, and continues until all nodes are clustered.
 
+    The graph never changes, so the coefficients are computed once, and the
+    nodes are visited in decreasing order of coefficient, skipping the ones
+    already clustered. Ties are broken by the order of G.nodes(). Unweighted
+    coefficients are ratios of exact integer counts, so equal ones are equal
+    floats, while weighted ones tie within COEFFICIENT_TOLERANCE so that
+    rounding errors do not break the ties.
+
     Args:
         G (networkx.Graph): The input graph.
         weight (str): Attribute name for edge weights.
@@ -38,20 +131,27 @@ def clustCoef_clusterin(G, weight="weight"):
     Returns:
         list: List of clusters, where each cluster is a list of node names.
     """
-    if nx.is_weighted(G):
+    if nx.is_weighted(G, weight=weight):
         weight_attribute = weight
     else:
         weight_attribute = None
 
+    nodes = list(G.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+
+    coefficients = clustering_coefficients(G, weight_attribute)
+    tolerance = 0.0 if weight_attribute is None else COEFFICIENT_TOLERANCE
+    order = coefficient_order(coefficients, tolerance)
+
     clusters = []
-    nodes_remaining = list(G.nodes())
+    clustered = np.zeros(len(nodes), dtype=bool)
 
-    while nodes_remaining:
-        v_cc = clust_coef(G, nodes_remaining, weight_attribute)
-        sorted_coef = sorted(v_cc.items(), key=lambda item: item[1], reverse=True)
-        v = sorted_coef[0][0]
+    for i in order.tolist():
+        if clustered[i]:
+            continue
+        v = nodes[i]
         first_neigh_v = list(G.neighbors(v)) + [v]
-        nodes_remaining = list(set(nodes_remaining) - set(first_neigh_v))
+        clustered[[index[node] for node in first_neigh_v]] = True
         clusters.append(first_neigh_v)
 
     return clusters
@@ -73,7 +173,7 @@ def cluster_network(file_path, saving_folder_path):
     """
     try:
         # Read the weighted edgelist and create a graph
-        G = nx.read_weighted_edgelist(file_path, create_using=nx.Graph(), nodetype=str)
+        G = graph_io.read_graph(file_path)
 
         # Apply clustering algorithm
         clusters = clustCoef_clusterin(G)
@@ -87,7 +187,7 @@ def cluster_network(file_path, saving_folder_path):
         algorithm = "wcc"
 
         # Generate a new filename
-        new_filename = f"{file_name}_{organism}_{algorithm}{file_ext}"
+        new_filename = f"{file_name}_{organism}_{algorithm}.txt"
         saving_file_path = os.path.join(saving_folder_path, new_filename)
 
         # Write clusters to the file
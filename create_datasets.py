@@ -1,8 +1,31 @@
+import argparse
+import functools
+import hashlib
+import json
 import math
 import os
 import random
+import time
 
 import networkx as nx
+import numpy as np
+
+import graph_io
+import instrumentation
+import selection
+
+# Percentage edge removal list
+PERCENTAGES = [10, 15, 20, 50]
+
+# Represent the number of graphs generated with removed edges from a single set
+REPLICATES = 10
+
+# Record of the generated replicates, used to resume an interrupted run
+MANIFEST_PATH = os.path.join("data", "manifest.json")
+
+# Output formats of the reduced graphs and removed edge sets: text edgelists
+# and / or binary graph files (see graph_io.write_binary_graph)
+OUTPUT_FORMATS = {"text": ".txt", "binary": graph_io.GRAPH_EXTENSION}
 
 
 def read_networks():
@@ -32,6 +55,13 @@ def read_networks():
         print("A new network folder has been created. Please add network txt files and start again.")
 
 
+def network_name(filename):
+    """
+    Short name of a network file, e.g. 'EcoliCong' for 'ppi_networks/Ecoli_Cong_Graph_ribosomal.txt'.
+    """
+    return "".join(filename.split("/")[1].split("_")[0:2])
+
+
 def create_training_data_folders(filename, percentage):
     """
     Create folders for storing training data.
@@ -48,120 +78,698 @@ def create_training_data_folders(filename, percentage):
     a_path = os.path.join(root_data_path, "A")
     b_path = os.path.join(root_data_path, "B")
 
-    # Check if root_data_path exists, if not, create necessary folders
-    if not os.path.exists(root_data_path):
-        os.mkdir(root_data_path)
-        os.mkdir(a_path)
-        os.mkdir(b_path)
-
-    # Create folder A containing reduced network
+    # Create folder A containing reduced network, keeping it if it already exists
     # Generate folder name based on filename and percentage
-    foldername_a = "".join(filename.split("/")[1].split("_")[0:2]) + "_" + str(percentage) + "%"
+    foldername_a = network_name(filename) + "_" + str(percentage) + "%"
     reduced_network_folder_path_a = os.path.join(a_path, foldername_a)
-    os.mkdir(reduced_network_folder_path_a)
+    os.makedirs(reduced_network_folder_path_a, exist_ok=True)
 
     # Create folder B containing removed edges (similar to folder A)
-    foldername_b = "".join(filename.split("/")[1].split("_")[0:2]) + "_" + str(percentage) + "%"
+    foldername_b = network_name(filename) + "_" + str(percentage) + "%"
     reduced_network_folder_path_b = os.path.join(b_path, foldername_b)
-    os.mkdir(reduced_network_folder_path_b)
+    os.makedirs(reduced_network_folder_path_b, exist_ok=True)
 
     return reduced_network_folder_path_a, reduced_network_folder_path_b
 
 
-def edge_removal(G, percent, number_of_components, i):
+class SpanningForest:
+    """
+    Spanning forest of a graph, kept up to date while edges are removed.
+
+    Removing an edge that is not in the forest never changes the connectivity
+    of the graph, so it needs no check at all. Only when a forest edge is
+    removed, the smaller of the two trees it splits is searched for a
+    replacement edge; if there is none, the edge is a bridge and is kept.
+
+    Args:
+    - G (networkx.Graph): The input graph. It is not modified.
     """
-    Reduce the graph by removing edges.
+
+    def __init__(self, G):
+        self.adjacency = {node: set(G.neighbors(node)) - {node} for node in G.nodes()}
+        self.tree = {node: set() for node in G.nodes()}
+
+        for component in nx.connected_components(G):
+            root = next(iter(component))
+            for u, v in nx.bfs_edges(G, root):
+                self.tree[u].add(v)
+                self.tree[v].add(u)
+
+    def _smaller_side(self, u, v):
+        """
+        Explore the trees of u and v in lockstep and return the node set of the
+        one that is exhausted first.
+        """
+        seen = ({u}, {v})
+        stacks = ([u], [v])
+        while True:
+            for side in (0, 1):
+                if not stacks[side]:
+                    return seen[side]
+                node = stacks[side].pop()
+                for neighbor in self.tree[node]:
+                    if neighbor not in seen[side]:
+                        seen[side].add(neighbor)
+                        stacks[side].append(neighbor)
+
+    def remove_edge(self, u, v):
+        """
+        Remove the edge (u, v) unless it is a bridge of the current graph.
+
+        Returns:
+        - removed (bool): Whether the edge was removed.
+        """
+        if v not in self.tree[u]:
+            self.adjacency[u].discard(v)
+            self.adjacency[v].discard(u)
+            return True
+
+        self.tree[u].discard(v)
+        self.tree[v].discard(u)
+        self.adjacency[u].discard(v)
+        self.adjacency[v].discard(u)
+
+        # Any edge leaving the smaller tree reconnects the two trees
+        side = self._smaller_side(u, v)
+        for node in side:
+            for neighbor in self.adjacency[node]:
+                if neighbor not in side:
+                    self.tree[node].add(neighbor)
+                    self.tree[neighbor].add(node)
+                    return True
+
+        # No replacement: the edge is a bridge, put it back
+        self.tree[u].add(v)
+        self.tree[v].add(u)
+        self.adjacency[u].add(v)
+        self.adjacency[v].add(u)
+        return False
+
+
+def removal_sequence(G, percent, i, rng=None):
+    """
+    Draw the sequence of edges removed from a graph.
+
+    Edges are drawn uniformly at random among the edges that are not bridges of
+    the current graph, so the number of connected components never changes.
+    Connectivity is tracked incrementally with a SpanningForest instead of
+    copying the graph for every draw. An edge found to be a bridge is dropped
+    from the candidates for good, since removing edges can never turn a bridge
+    back into a non-bridge.
+
+    Every prefix of the sequence is itself distributed like a sequence drawn
+    for a smaller percentage, which is what the nested mode relies on.
 
     Args:
     - G (networkx.Graph): The input graph.
     - percent (float): Percentage of edges to be removed.
-    - number_of_components (int): Number of components expected after edge removal.
     - i (int): Iteration number.
+    - rng (random.Random or None): Source of randomness. None uses the global
+      random module.
 
     Returns:
-    - Current_graph (networkx.Graph): The final reduced graph.
-    - removed_set (networkx.Graph): Set of removed edges.
+    - removed_edges (list): The removed edges, in removal order.
+
+    Raises:
+    - ValueError: If fewer than the requested number of edges can be removed
+      without disconnecting the graph.
     """
+    if rng is None:
+        rng = random
+
     nx.freeze(G)
+    bridges = {frozenset(edge) for edge in nx.bridges(G)}  # Get the edges that are bridges
+
+    # Removing the bridges from the edge list
+    edge_list = [(u, v) for u, v in G.edges() if frozenset((u, v)) not in bridges]
+
+    edge_remove_number = number_of_edges_to_remove(G, percent)  # Total edges to remove
+
+    forest = SpanningForest(G)
+    removed_edges = []  # Contains the final removed edges, in removal order
+    progress = instrumentation.Progress(edge_remove_number, f"Generating graph {percent}%: {i + 1}")
+
+    while len(removed_edges) != edge_remove_number:
+        if not edge_list:
+            raise ValueError(
+                f"Only {len(removed_edges)} of {edge_remove_number} edges can be removed "
+                "without disconnecting the graph."
+            )
+
+        # Select a random edge from the candidate list and take it out of the list
+        index = rng.randrange(len(edge_list))
+        random_e = edge_list[index]
+        edge_list[index] = edge_list[-1]
+        edge_list.pop()
+
+        if forest.remove_edge(*random_e):
+            removed_edges.append(random_e)
+            progress.update()
+
+    return removed_edges
+
+
+def number_of_edges_to_remove(G, percent):
+    """
+    Number of edges removed from G for a given percentage.
+    """
     e = nx.number_of_edges(G)  # Number of edges in the original graph
-    bridges = set(nx.bridges(G))  # Get the edges that are bridges
-    edgeset = set(G.edges())  # Use sets for faster lookup
+    return math.floor((percent * e) / 100)
 
-    # Removing the bridges from the edge set
-    edge_list = edgeset - bridges  # Candidate set
 
-    edge_remove_number = math.floor((percent * e) / 100)  # Total edges to remove
+def reduce_graph(G, removed_edges):
+    """
+    Split a graph into the reduced graph and the graph of its removed edges.
 
-    removed_set = set()  # Contains the final removed set
+    Returns:
+    - Current_graph (networkx.Graph): G without the removed edges.
+    - removed_set (networkx.Graph): Set of removed edges.
+    """
     Current_graph = G.copy()  # Graph containing the final reduced graph
+    Current_graph.remove_edges_from(removed_edges)
 
-    while len(removed_set) != edge_remove_number:
-        print(
-            f"Generating graph {percent}%: {i + 1}... {math.floor(len(removed_set) * 100 / edge_remove_number)}%"
-        )
+    removed_set = nx.Graph(removed_edges)  # Convert removed edge list to a graph
 
-        G_temp = Current_graph.copy()  # Copy the current graph
+    return Current_graph, removed_set
 
-        random_e = random.sample(edge_list, 1)[0]  # Select a random edge from the candidate set
 
-        G_temp.remove_edges_from([random_e])  # Remove the sampled edge
+def edge_removal(G, percent, number_of_components, i, rng=None):
+    """
+    Reduce the graph by removing edges.
 
-        total_components = nx.number_connected_components(G_temp)  # Get total components
+    See removal_sequence for how the edges are drawn.
 
-        if total_components == number_of_components:  # If component numbers remain equal
-            removed_set.add(random_e)  # Add edge to removed_set
-            edge_list.remove(random_e)  # Remove the edge from the candidate set
-            Current_graph = G_temp  # Update current_graph with the reduced graph
+    Args:
+    - G (networkx.Graph): The input graph.
+    - percent (float): Percentage of edges to be removed.
+    - number_of_components (int): Number of components expected after edge removal.
+      Removing non-bridge edges always preserves the components of G.
+    - i (int): Iteration number.
+    - rng (random.Random or None): Source of randomness. None uses the global
+      random module.
 
-    removed_set = nx.Graph(list(removed_set))  # Convert removed edge set to a graph
+    Returns:
+    - Current_graph (networkx.Graph): The final reduced graph.
+    - removed_set (networkx.Graph): Set of removed edges.
 
-    return Current_graph, removed_set
+    Raises:
+    - ValueError: If fewer than the requested number of edges can be removed
+      without disconnecting the graph.
+    """
+    return reduce_graph(G, removal_sequence(G, percent, i, rng=rng))
 
 
-def main():
+def replicate_seed(base_seed, network_filename, percentage, replicate):
     """
-    Perform edge removal and create reduced graphs along with removed edge sets.
+    Derive the seed of one replicate from the base seed of a run.
+
+    The seed only depends on the base seed, the network file name, the
+    percentage and the replicate number, so a replicate can be regenerated on
+    its own and comes out identical whatever the order or the number of
+    workers.
+
+    Args:
+    - base_seed (int): Base seed of the run.
+    - network_filename (str): Path to the network file.
+    - percentage (int): Percentage of edges removed.
+    - replicate (int): Replicate number, starting from 0.
 
-    Reads network files, generates reduced graphs, and stores results in output files.
+    Returns:
+    - seed (int): The seed of the replicate.
     """
-    # Percentage edge removal list
-    percentages = [10, 15, 20, 50]
+    key = f"{base_seed}:{os.path.basename(network_filename)}:{percentage}:{replicate}"
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
 
-    # Represent the number of graphs generated with removed edges from a single set
-    replicates = 10
 
-    network_filenames = read_networks()
+@functools.lru_cache(maxsize=None)
+def load_network(network_filename):
+    """
+    Read and freeze a network, once per process.
 
-    for network_filename in network_filenames:
-        G = nx.read_weighted_edgelist(network_filename, create_using=nx.Graph(), nodetype=str)
+    Returns:
+    - G (networkx.Graph): The frozen network.
+    - components (int): Number of connected components of the network.
+    - edges (graph_io.EdgeList): The edges of G as arrays, in the order of G.edges().
+    - edge_ids (dict): Edges of G mapped to their position in edges.
+    """
+    with instrumentation.stage("load_network", network=network_filename):
+        G = graph_io.read_graph(network_filename)
         # Freezing original graph
         nx.freeze(G)
-        # Get the number of components
-        components = nx.number_connected_components(G)
 
+        edges = graph_io.EdgeList.from_networkx(G)
+        edge_ids = {edge: k for k, edge in enumerate(G.edges())}
+
+        return G, nx.number_connected_components(G), edges, edge_ids
+
+
+def replicate_filepaths(percentage, i, a_path, b_path, output_format="text"):
+    """
+    Paths of the reduced graph and removed edges files of a replicate.
+    """
+    extension = OUTPUT_FORMATS[output_format]
+    reduced_network_filename = f"{i + 1}_{percentage}%_reduced_graph{extension}"
+    removed_edges_filename = f"{i + 1}_{percentage}%_removed_edges{extension}"
+
+    reduced_network_filepath = os.path.join(a_path, reduced_network_filename)
+    removed_edges_filepath = os.path.join(b_path, removed_edges_filename)
+
+    return reduced_network_filepath, removed_edges_filepath
+
+
+def write_replicate(edges, removed_ids, percentage, i, a_path, b_path, output_formats=("text",)):
+    """
+    Store a reduced graph and its removed edge set as edgelist and / or binary graph files.
+
+    The reduced graph is written straight from the edge arrays, in the same
+    format and order as nx.write_weighted_edgelist(), without building it.
+    Binary graph files store the node ids of the network vocabulary (see
+    graph_io.vocabulary_ids) instead of the node names.
+
+    Args:
+    - edges (graph_io.EdgeList): The edges of the original graph.
+    - removed_ids (numpy.ndarray): Positions in edges of the removed edges, in removal order.
+    - percentage (int): Percentage of edges removed.
+    - i (int): Replicate number, starting from 0.
+    - a_path (str): Folder of the reduced graphs.
+    - b_path (str): Folder of the removed edges.
+    - output_formats (tuple): Formats to write, keys of OUTPUT_FORMATS.
+
+    Returns:
+    - checksums (dict): Output file paths mapped to the hash of their contents.
+    """
+    kept = np.ones(len(edges), dtype=bool)
+    kept[removed_ids] = False
+    kept_weights = None if edges.weights is None else edges.weights[kept]
+
+    write_functions = {"text": graph_io.write_edgelist, "binary": graph_io.write_binary_graph}
+
+    checksums = {}
+    for output_format in output_formats:
+        reduced_network_filepath, removed_edges_filepath = replicate_filepaths(
+            percentage, i, a_path, b_path, output_format
+        )
+        write = write_functions[output_format]
+
+        nodes, sources, targets = edges.nodes, edges.sources, edges.targets
+        if output_format == "binary":
+            # Node ids of the binary files index the vocabulary of the source network
+            vocabulary_path = graph_io.default_vocabulary_path(reduced_network_filepath)
+            ids = graph_io.vocabulary_ids(vocabulary_path, edges.nodes)
+            nodes = graph_io.load_vocabulary(vocabulary_path)[0]
+            if not np.array_equal(ids, np.arange(len(ids))):
+                sources, targets = ids[sources], ids[targets]
+
+        # Store output graph and removed edge set as edgelist output file
+        write(reduced_network_filepath, nodes, sources[kept], targets[kept], kept_weights)
+        write(removed_edges_filepath, nodes, sources[removed_ids], targets[removed_ids])
+
+        for path in (reduced_network_filepath, removed_edges_filepath):
+            checksums[path] = graph_io.file_hash(path)
+
+    return checksums
+
+
+def generate_replicate(
+    network_filename, percentage, i, seed, a_path, b_path, output_formats=("text",)
+):
+    """
+    Generate one reduced graph and its removed edge set, and store them as edgelist files.
+
+    Args:
+    - network_filename (str): Path to the network file.
+    - percentage (int): Percentage of edges removed.
+    - i (int): Replicate number, starting from 0.
+    - seed (int): Seed of the replicate (see replicate_seed).
+    - a_path (str): Folder of the reduced graphs.
+    - b_path (str): Folder of the removed edges.
+    - output_formats (tuple): Formats to write, keys of OUTPUT_FORMATS.
+
+    Returns:
+    - checksums (dict): The percentage mapped to the checksums of its output files.
+    """
+    details = {"network": network_filename, "percentage": percentage, "replicate": i + 1}
+    with instrumentation.stage("generate", **details):
+        G, components, edges, edge_ids = load_network(network_filename)
+
+        # Remove edges from the graph
+        with instrumentation.stage("removal_sequence", **details):
+            removed_edges = removal_sequence(G, percentage, i, rng=random.Random(seed))
+        removed_ids = np.array([edge_ids[edge] for edge in removed_edges], dtype=np.int64)
+
+        with instrumentation.stage("write_replicate", **details):
+            checksums = write_replicate(
+                edges, removed_ids, percentage, i, a_path, b_path, output_formats
+            )
+
+    return {percentage: checksums}
+
+
+def generate_nested_replicate(
+    network_filename, percentages, i, seed, folder_paths, output_formats=("text",)
+):
+    """
+    Generate one replicate for several percentages from a single removal sequence.
+
+    The sequence is drawn once, for the largest percentage, and every smaller
+    percentage removes a prefix of it, so the removed edge sets are nested.
+    Each set on its own has the same distribution as one drawn independently.
+
+    Args:
+    - network_filename (str): Path to the network file.
+    - percentages (list): Percentages of edges removed.
+    - i (int): Replicate number, starting from 0.
+    - seed (int): Seed of the replicate, derived for the largest percentage, so
+      that its set is the same as in the non-nested mode.
+    - folder_paths (dict): Percentages mapped to their (a_path, b_path) folders.
+    - output_formats (tuple): Formats to write, keys of OUTPUT_FORMATS.
+
+    Returns:
+    - checksums (dict): Percentages mapped to the checksums of their output files.
+    """
+    details = {"network": network_filename, "percentage": max(percentages), "replicate": i + 1}
+    with instrumentation.stage("generate", nested=True, **details):
+        G, components, edges, edge_ids = load_network(network_filename)
+
+        with instrumentation.stage("removal_sequence", **details):
+            sequence = removal_sequence(G, max(percentages), i, rng=random.Random(seed))
+        sequence_ids = np.array([edge_ids[edge] for edge in sequence], dtype=np.int64)
+
+        checksums = {}
         for percentage in percentages:
-            # Create training data folders
-            a_path, b_path = create_training_data_folders(network_filename, percentage)
+            removed_ids = sequence_ids[: number_of_edges_to_remove(G, percentage)]
+
+            a_path, b_path = folder_paths[percentage]
+            with instrumentation.stage("write_replicate", **dict(details, percentage=percentage)):
+                checksums[percentage] = write_replicate(
+                    edges, removed_ids, percentage, i, a_path, b_path, output_formats
+                )
+
+    return checksums
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """
+    Load the manifest of the generated replicates.
+
+    A missing or unreadable manifest is treated as empty, so every replicate is
+    generated again.
 
-            for i in range(replicates):
-                reduced_network_filename = f"{i + 1}_{percentage}%_reduced_graph.txt"
-                removed_edges_filename = f"{i + 1}_{percentage}%_removed_edges.txt"
+    Returns:
+    - manifest (dict): The base seed of the run and the record of every replicate.
+    """
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get("replicates"), dict):
+            return manifest
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    return {"base_seed": None, "replicates": {}}
+
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    """
+    Write the manifest, replacing the previous one atomically.
+    """
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def manifest_key(a_path, percentage, i):
+    """
+    Key of a replicate in the manifest, e.g. 'EcoliCong_10%/1_10%'.
+    """
+    return f"{os.path.basename(a_path)}/{i + 1}_{percentage}%"
+
+
+def is_complete(record, expected, filepaths):
+    """
+    Check that a replicate was generated with the expected settings and that its
+    output files are still intact.
+
+    Args:
+    - record (dict or None): The manifest record of the replicate.
+    - expected (dict): Network hash, percentage, seed and mode the replicate should have.
+    - filepaths (tuple): Paths of its output files.
+
+    Returns:
+    - complete (bool): Whether the replicate can be skipped.
+    """
+    if record is None or any(record.get(name) != value for name, value in expected.items()):
+        return False
+
+    checksums = record.get("outputs", {})
+    for path in filepaths:
+        if path not in checksums or not os.path.exists(path):
+            return False
+        if graph_io.file_hash(path) != checksums[path]:
+            return False
+
+    return True
+
+
+def create_datasets(
+    percentages=PERCENTAGES,
+    replicates=REPLICATES,
+    seed=None,
+    workers=1,
+    nested=False,
+    manifest_path=MANIFEST_PATH,
+    output_formats=("text",),
+    filters=None,
+):
+    """
+    Perform edge removal and create reduced graphs along with removed edge sets.
 
-                reduced_network_filepath = os.path.join(a_path, reduced_network_filename)
-                removed_edges_filepath = os.path.join(b_path, removed_edges_filename)
+    Every (network, percentage, replicate) is an independent job with its own
+    seed derived from the base seed, so the output does not depend on the
+    number of workers. In nested mode, one job covers all percentages of a
+    (network, replicate).
 
-                # Making a copy of the original graph
-                G_temp = G.copy()
+    Every generated replicate is recorded in a manifest with the hash of the
+    source network, its percentage, its seed and the checksums of its output
+    files. A rerun skips the replicates that are complete and intact, and only
+    generates the missing or corrupted ones.
 
-                # Call "edge_removal" function to remove edges from the graph
-                output_graph_and_edges = edge_removal(G_temp, percentage, components, i)
+    Args:
+    - percentages (list): Percentages of edges to remove.
+    - replicates (int): Number of replicates per network and percentage.
+    - seed (int or None): Base seed of the run. None reuses the base seed of the
+      manifest, or draws a random one.
+    - workers (int): Number of worker processes.
+    - nested (bool): Whether to draw a single removal sequence per replicate and
+      emit the smaller percentages as its prefixes (see generate_nested_replicate).
+    - manifest_path (str): Path to the manifest.
+    - output_formats (tuple): Formats to write, keys of OUTPUT_FORMATS. Binary graph
+      files refer to the node vocabulary of their network, in data/vocabulary, which
+      the rankings share.
+    - filters (dict or None): Only generate the selected networks, percentages and
+      replicates (see selection.matches).
 
-                reduced_graph = output_graph_and_edges[0]
-                removed_edges = output_graph_and_edges[1]
+    Returns:
+    - failed_jobs (list): Jobs that raised an exception.
+    """
+    network_filenames = read_networks()
+    if not network_filenames:
+        return []
+
+    network_filenames = [
+        network_filename
+        for network_filename in network_filenames
+        if selection.matches(network=network_name(network_filename), filters=filters)
+    ]
+    percentages = [
+        percentage
+        for percentage in percentages
+        if selection.matches(percentage=percentage, filters=filters)
+    ]
+    replicate_numbers = [
+        i for i in range(replicates) if selection.matches(replicate=i + 1, filters=filters)
+    ]
+    if not percentages:
+        return []
+
+    manifest = load_manifest(manifest_path)
+    if seed is None:
+        # Resume with the base seed of the previous run
+        seed = manifest["base_seed"]
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    manifest["base_seed"] = seed
+    print(f"Base seed: {seed}")
+
+    # Largest networks first, so that they do not end up running last
+    network_filenames = sorted(network_filenames, key=lambda path: -os.path.getsize(path))
+
+    jobs = []
+    skipped = 0
+    for network_filename in network_filenames:
+        network_hash = graph_io.file_hash(network_filename)
 
-                # Store output graph and removed edge set as edgelist output file
-                nx.write_weighted_edgelist(reduced_graph, reduced_network_filepath)
-                nx.write_weighted_edgelist(removed_edges, removed_edges_filepath)
+        # One vocabulary per source network, indexed by its binary graph files and
+        # its rankings. It is only extended, so the ids of earlier runs stay valid.
+        edges = load_network(network_filename)[2]
+        vocabulary_path = os.path.join(
+            "data", graph_io.VOCABULARY_FOLDER, f"{network_name(network_filename)}.txt"
+        )
+        graph_io.vocabulary_ids(vocabulary_path, edges.nodes)
+
+        # Create training data folders
+        folder_paths = {
+            percentage: create_training_data_folders(network_filename, percentage)
+            for percentage in percentages
+        }
+
+        if nested:
+            groups = [
+                (percentages, i, replicate_seed(seed, network_filename, max(percentages), i))
+                for i in replicate_numbers
+            ]
+        else:
+            groups = [
+                ([percentage], i, replicate_seed(seed, network_filename, percentage, i))
+                for percentage in percentages
+                for i in replicate_numbers
+            ]
+
+        for group_percentages, i, replicate_seed_value in groups:
+            # Manifest records expected for every percentage of the job
+            records = {}
+            for percentage in group_percentages:
+                a_path, b_path = folder_paths[percentage]
+                expected = {
+                    "network": network_filename,
+                    "network_hash": network_hash,
+                    "percentage": percentage,
+                    "seed": replicate_seed_value,
+                    "nested": nested,
+                }
+                filepaths = tuple(
+                    path
+                    for output_format in output_formats
+                    for path in replicate_filepaths(percentage, i, a_path, b_path, output_format)
+                )
+                records[percentage] = (manifest_key(a_path, percentage, i), expected, filepaths)
+
+            if all(
+                is_complete(manifest["replicates"].get(key), expected, filepaths)
+                for key, expected, filepaths in records.values()
+            ):
+                skipped += len(records)
+                continue
+
+            if nested:
+                job = (
+                    network_filename,
+                    percentages,
+                    i,
+                    replicate_seed_value,
+                    folder_paths,
+                    output_formats,
+                )
+            else:
+                a_path, b_path = folder_paths[group_percentages[0]]
+                job = (
+                    network_filename,
+                    group_percentages[0],
+                    i,
+                    replicate_seed_value,
+                    a_path,
+                    b_path,
+                    output_formats,
+                )
+            jobs.append((job, records))
+
+    if skipped:
+        print(f"Skipping {skipped} complete replicates")
+
+    def record(records, checksums):
+        for percentage, (key, expected, filepaths) in records.items():
+            manifest["replicates"][key] = dict(expected, outputs=checksums[percentage])
+        save_manifest(manifest, manifest_path)
+
+    job_function = generate_nested_replicate if nested else generate_replicate
+    save_manifest(manifest, manifest_path)
+
+    # With a single worker the jobs run in this process, with the same failure
+    # isolation as on the pool
+    failed_jobs = []
+    job_arguments = [job for job, _ in jobs]
+    for index, checksums, error in instrumentation.run_jobs(job_function, job_arguments, workers):
+        job, records = jobs[index]
+        if error is None:
+            record(records, checksums)
+        else:
+            print(f"Failed to generate {job[0]}, replicate {job[2] + 1}:\n{error}")
+            failed_jobs.append(job)
+
+    print(f"{len(jobs) - len(failed_jobs)} of {len(jobs)} jobs completed")
+
+    return failed_jobs
+
+
+def add_arguments(parser):
+    """
+    Add the options of the dataset generation to a command-line parser.
+    """
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Base seed. Every replicate gets a seed derived from it, so a run can be "
+        "reproduced exactly. When omitted, the base seed of data/manifest.json is reused, "
+        "or a random one is drawn and printed.",
+    )
+    parser.add_argument(
+        "--nested",
+        action="store_true",
+        help="Draw one removal sequence per replicate and emit the smaller percentages as "
+        "its prefixes, so the removed edge sets are nested.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["text", "binary", "both"],
+        default="text",
+        help="Write the reduced graphs and removed edges as text edgelists, as binary graph "
+        "files with a node vocabulary per network, or both. The Java clusterers "
+        "(ClusterONE, IMHRC) need the text files.",
+    )
+    selection.add_arguments(parser, filter_methods=False)
+    instrumentation.add_arguments(parser)
+
+
+def run(args):
+    """
+    Generate the datasets from parsed command-line arguments, and write the run report.
+    """
+    instrumentation.configure(args)
+
+    started = time.time()
+    output_formats = ("text", "binary") if args.format == "both" else (args.format,)
+    failed_jobs = create_datasets(
+        seed=args.seed,
+        workers=args.workers,
+        nested=args.nested,
+        output_formats=output_formats,
+        filters=selection.filters_from_args(args),
+    )
+    print(f"Report: {instrumentation.write_report('create_datasets', started)}")
+
+    return failed_jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create reduced networks and removed edge sets.")
+    add_arguments(parser)
+    run(parser.parse_args())
 
 
-main()
+if __name__ == "__main__":
+    main()
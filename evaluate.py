@@ -0,0 +1,319 @@
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+from scipy.stats import rankdata
+
+import graph_io
+import instrumentation
+import selection
+from similarity import rankings
+
+# Folder of the held-out edges written by create_datasets.py
+REMOVED_EDGES_PATH = "data/B"
+
+# Folder of the reduced networks the rankings were computed on
+REDUCED_NETWORKS_PATH = "data/A"
+
+# Folder of the rankings written by rank_method_I.py
+RANKED_EDGES_PATH = "ranked_edges"
+
+# Folder of the evaluation tables
+EVALUATION_PATH = "evaluation"
+
+# Cut-offs of the precision@k metric
+PRECISION_AT_K = [10, 50, 100, 500, 1000]
+
+
+def pair_keys(sources, targets, n_nodes):
+    """
+    Encode undirected node-id pairs as single int64 keys.
+
+    Args:
+        sources (numpy.ndarray): Ids of the first node of each pair.
+        targets (numpy.ndarray): Ids of the second node of each pair.
+        n_nodes (int): Number of ids, used as the base of the encoding.
+
+    Returns:
+        numpy.ndarray: One key per pair, equal for (u, v) and (v, u).
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    return np.minimum(sources, targets) * n_nodes + np.maximum(sources, targets)
+
+
+def read_edge_pairs(filepath):
+    """
+    Read the node pairs of an edgelist or binary graph file, ignoring any edge data.
+
+    Args:
+        filepath (str): Path to the graph file.
+
+    Returns:
+        list: (source, target) tuples of node names.
+    """
+    edges = graph_io.read_edgelist(filepath)
+    names = np.asarray(edges.nodes, dtype=object)
+    return list(zip(names[edges.sources].tolist(), names[edges.targets].tolist()))
+
+
+def graph_filepath(folder_path, stem):
+    """
+    Path of the text or, if there is no text file, binary graph file of a network.
+    """
+    text_path = os.path.join(folder_path, f"{stem}.txt")
+    binary_path = os.path.join(folder_path, f"{stem}{graph_io.GRAPH_EXTENSION}")
+    return binary_path if not os.path.exists(text_path) and os.path.exists(binary_path) else text_path
+
+
+def evaluate_ranking(records, positive_keys, n_nodes, n_candidates, k_values=PRECISION_AT_K):
+    """
+    Compute precision@k, AUPR and AUROC of a ranking against held-out edges.
+
+    Pairs that do not appear in the ranking are treated as tied below every
+    ranked pair, so that rankings restricted to a hop radius are evaluated
+    against the full set of non-adjacent pairs.
+
+    Args:
+        records (numpy.ndarray): Ranking records, best first.
+        positive_keys (numpy.ndarray): Unique pair keys of the held-out edges.
+        n_nodes (int): Base of the pair keys.
+        n_candidates (int): Number of non-adjacent pairs of the reduced network.
+        k_values (list): Cut-offs of the precision@k metric.
+
+    Returns:
+        dict: Metric names mapped to their values.
+    """
+    keys = pair_keys(records["source"], records["target"], n_nodes)
+    labels = np.isin(keys, positive_keys)
+    scores = np.asarray(records["score"], dtype=np.float64)
+
+    n_positives = len(positive_keys)
+    n_negatives = max(n_candidates - n_positives, 0)
+    ranked_positives = int(labels.sum())
+    ranked_negatives = len(labels) - ranked_positives
+
+    metrics = {}
+
+    # Precision among the k best-ranked pairs
+    hits = np.cumsum(labels)
+    for k in k_values:
+        metrics[f"precision@{k}"] = hits[min(k, len(hits)) - 1] / k if len(hits) else 0.0
+
+    # Area under the precision-recall curve, as average precision
+    if n_positives:
+        ranks = np.flatnonzero(labels) + 1
+        metrics["aupr"] = float(np.sum(hits[labels] / ranks) / n_positives)
+    else:
+        metrics["aupr"] = float("nan")
+
+    # Area under the ROC curve, from the Mann-Whitney U statistic of the ranked
+    # pairs plus the unranked pairs tied below them
+    if n_positives and n_negatives:
+        unranked_positives = n_positives - ranked_positives
+        unranked_negatives = max(n_negatives - ranked_negatives, 0)
+
+        score_ranks = rankdata(scores)
+        u_ranked = score_ranks[labels].sum() - ranked_positives * (ranked_positives + 1) / 2
+        u_statistic = (
+            u_ranked
+            + ranked_positives * unranked_negatives
+            + 0.5 * unranked_positives * unranked_negatives
+        )
+        metrics["auroc"] = float(u_statistic / (n_positives * n_negatives))
+    else:
+        metrics["auroc"] = float("nan")
+
+    return metrics
+
+
+def evaluate_file(ranking_path, removed_edges_path, reduced_graph_path, vocabulary_path):
+    """
+    Evaluate one ranking file against the matching removed-edges file.
+
+    Returns:
+        dict: Metric names mapped to their values.
+    """
+    vocabulary = graph_io.load_vocabulary(vocabulary_path)[0]
+    index = {node: i for i, node in enumerate(vocabulary)}
+
+    # Held-out nodes missing from the vocabulary get ids past its end
+    removed_pairs = read_edge_pairs(removed_edges_path)
+    for pair in removed_pairs:
+        for node in pair:
+            index.setdefault(node, len(index))
+
+    n_nodes = len(index)
+    sources = np.fromiter((index[u] for u, v in removed_pairs), dtype=np.int64)
+    targets = np.fromiter((index[v] for u, v in removed_pairs), dtype=np.int64)
+    positive_keys = np.unique(pair_keys(sources, targets, n_nodes))
+
+    # The vocabulary is shared by every replicate of the network, so the nodes
+    # are counted on the reduced network itself
+    reduced_graph = graph_io.read_edgelist(reduced_graph_path)
+    n_graph_nodes = len(reduced_graph.nodes)
+    n_candidates = n_graph_nodes * (n_graph_nodes - 1) // 2 - len(reduced_graph)
+
+    # Sorted rankings are memory-mapped, unsorted ones are ranked when read
+    flags, count = rankings.read_ranking_header(ranking_path)
+    if flags & rankings.FLAG_SORTED:
+        records = rankings.open_ranking(ranking_path)
+    else:
+        records = rankings.read_ranking(ranking_path)
+    return evaluate_ranking(records, positive_keys, n_nodes, n_candidates)
+
+
+def get_evaluation_jobs(ranked_root, filters=None):
+    """
+    Match every ranking file with its removed-edges and reduced-network files.
+
+    Args:
+        ranked_root (str): Folder of the rankings.
+        filters (dict or None): Only match the selected networks, percentages,
+            replicates and methods (see selection.matches).
+
+    Returns:
+        list: (method, folder, replicate, percentage, ranking_path, removed_edges_path,
+            reduced_graph_path, vocabulary_path) tuples.
+    """
+    jobs = []
+    pattern = re.compile(r"^(\d+)_(\d+)%_reduced_graph_(\w+)\.rank$")
+
+    for method in sorted(os.listdir(ranked_root)):
+        method_path = os.path.join(ranked_root, method)
+        if not os.path.isdir(method_path):
+            continue
+
+        for folder in sorted(os.listdir(method_path)):
+            for ranking_name in sorted(os.listdir(os.path.join(method_path, folder))):
+                match = pattern.match(ranking_name)
+                if match is None:
+                    continue
+                replicate, percentage, _ = match.groups()
+
+                network = selection.parse_folder_name(folder)[0]
+                if not selection.matches(
+                    network, int(percentage), int(replicate), method, filters
+                ):
+                    continue
+
+                prefix = f"{replicate}_{percentage}%"
+                reduced_graph_path = graph_filepath(
+                    os.path.join(REDUCED_NETWORKS_PATH, folder), f"{prefix}_reduced_graph"
+                )
+                jobs.append(
+                    (
+                        method,
+                        folder,
+                        int(replicate),
+                        int(percentage),
+                        os.path.join(method_path, folder, ranking_name),
+                        graph_filepath(
+                            os.path.join(REMOVED_EDGES_PATH, folder), f"{prefix}_removed_edges"
+                        ),
+                        reduced_graph_path,
+                        graph_io.default_vocabulary_path(reduced_graph_path),
+                    )
+                )
+
+    return jobs
+
+
+def evaluate_job(*job):
+    with instrumentation.stage(f"evaluate/{job[0]}", file=job[4]):
+        return evaluate_file(*job[4:])
+
+
+def write_summary_tables(results, evaluation_root):
+    """
+    Write one table per (method, percentage), with the mean and standard
+    deviation of every metric across the replicates of each network.
+
+    Args:
+        results (list): (job, metrics) tuples.
+        evaluation_root (str): Folder of the evaluation tables.
+    """
+    os.makedirs(evaluation_root, exist_ok=True)
+
+    metric_names = list(results[0][1].keys()) if results else []
+    groups = {}
+    for job, metrics in results:
+        method, folder, replicate, percentage = job[:4]
+        groups.setdefault((method, percentage), {}).setdefault(folder, []).append(metrics)
+
+    for (method, percentage), folders in sorted(groups.items()):
+        table_path = os.path.join(evaluation_root, f"{method}_{percentage}%.tsv")
+
+        with open(table_path, "w") as f:
+            header = ["network", "replicates"]
+            for name in metric_names:
+                header += [f"{name}_mean", f"{name}_std"]
+            f.write("\t".join(header) + "\n")
+
+            for folder, replicate_metrics in sorted(folders.items()):
+                row = [folder, str(len(replicate_metrics))]
+                for name in metric_names:
+                    values = np.array([metrics[name] for metrics in replicate_metrics])
+                    row += [f"{np.mean(values):.6g}", f"{np.std(values):.6g}"]
+                f.write("\t".join(row) + "\n")
+
+        print(f"Wrote {table_path}")
+
+
+def evaluate(
+    workers=1, ranked_root=RANKED_EDGES_PATH, evaluation_root=EVALUATION_PATH, filters=None
+):
+    jobs = get_evaluation_jobs(ranked_root, filters)
+
+    results = []
+    for index, metrics, error in instrumentation.run_jobs(evaluate_job, jobs, workers):
+        job = jobs[index]
+        if error is None:
+            results.append((job, metrics))
+        else:
+            print(f"Failed to evaluate {job[4]}:\n{error}")
+
+    write_summary_tables(results, evaluation_root)
+
+    return results
+
+
+def add_arguments(parser):
+    """
+    Add the options of the evaluation to a command-line parser.
+    """
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--rankings", default=RANKED_EDGES_PATH, help="Folder of the rankings.")
+    parser.add_argument("--output", default=EVALUATION_PATH, help="Folder of the summary tables.")
+    selection.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+
+
+def run(args):
+    """
+    Evaluate the rankings from parsed command-line arguments, and write the run report.
+    """
+    instrumentation.configure(args)
+
+    started = time.time()
+    results = evaluate(
+        workers=args.workers,
+        ranked_root=args.rankings,
+        evaluation_root=args.output,
+        filters=selection.filters_from_args(args),
+    )
+    print(f"Report: {instrumentation.write_report('evaluate', started)}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate rankings against the held-out edges.")
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+import functools
+import hashlib
+import os
+import struct
+
+import networkx as nx
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Lookup table of the bytes that separate the tokens of an edgelist line, as in bytes.split()
+WHITESPACE_TABLE = np.zeros(256, dtype=bool)
+WHITESPACE_TABLE[list(b" \t\n\r\x0b\x0c")] = True
+
+# Layout of a binary graph file: a fixed-size header followed by the source ids,
+# the target ids and, for weighted graphs, the weights of all edges
+GRAPH_EXTENSION = ".graph"
+GRAPH_MAGIC = b"PPIGRAPH"
+GRAPH_VERSION = 1
+GRAPH_HEADER = struct.Struct("<8sIIQQ20s4x")  # magic, version, flags, nodes, edges, vocabulary hash
+GRAPH_ID_DTYPE = np.dtype("<i4")
+GRAPH_WEIGHT_DTYPE = np.dtype("<f4")
+
+# Header flag set when the file stores edge weights
+FLAG_WEIGHTED = 1
+
+# Folder, next to data/A and data/B, of the node vocabularies of the source
+# networks, shared by the binary graph files and the rankings of every network
+VOCABULARY_FOLDER = "vocabulary"
+
+
+def file_hash(filepath, chunk_size=1 << 20):
+    """
+    Compute the SHA-1 hex digest of a file's contents.
+
+    Args:
+        filepath (str): Path to the file.
+        chunk_size (int): Number of bytes read at once.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EdgeList:
+    """
+    Edges of a network as integer node-id arrays.
+
+    This is the parsed form of an edgelist file shared by all pipeline stages.
+    Scorers and clusterers that work on matrices use the arrays directly; the
+    NetworkX graph is only built if a caller asks for it.
+
+    Args:
+        nodes (list): Node names, in order of first appearance in the file.
+        sources (numpy.ndarray): Integer ids of the first node of each edge.
+        targets (numpy.ndarray): Integer ids of the second node of each edge.
+        weights (numpy.ndarray or None): Weight of each edge. None for files
+            without a weight column.
+    """
+
+    def __init__(self, nodes, sources, targets, weights=None):
+        # Arrays are kept as given, so memory-mapped int32 / float32 arrays are not copied
+        self.nodes = nodes if isinstance(nodes, list) else list(nodes)
+        self.sources = np.asarray(sources)
+        self.targets = np.asarray(targets)
+        self.weights = None if weights is None else np.asarray(weights)
+        self._graph = None
+
+    def __len__(self):
+        return len(self.sources)
+
+    @classmethod
+    def from_networkx(cls, G):
+        """
+        Convert a NetworkX graph, keeping the order of G.nodes() and G.edges().
+
+        Args:
+            G (networkx.Graph): The input graph.
+
+        Returns:
+            EdgeList: The edges of the graph.
+        """
+        nodes = list(G.nodes())
+        index = {node: i for i, node in enumerate(nodes)}
+        edges = list(G.edges(data="weight"))
+
+        sources = np.fromiter((index[u] for u, v, w in edges), dtype=np.int64, count=len(edges))
+        targets = np.fromiter((index[v] for u, v, w in edges), dtype=np.int64, count=len(edges))
+
+        weights = None
+        if any(w is not None for u, v, w in edges):
+            weights = np.fromiter(
+                (1.0 if w is None else w for u, v, w in edges), dtype=np.float64, count=len(edges)
+            )
+
+        edge_list = cls(nodes, sources, targets, weights)
+        edge_list._graph = G
+        return edge_list
+
+    @property
+    def graph(self):
+        """
+        The NetworkX graph, built from the arrays on first access.
+        """
+        if self._graph is None:
+            self._graph = to_networkx(self.nodes, self.sources, self.targets, self.weights)
+        return self._graph
+
+    def to_dense(self):
+        """
+        Build the dense weighted adjacency matrix, like nx.to_numpy_array(self.graph).
+
+        Returns:
+            numpy.ndarray: The adjacency matrix.
+        """
+        weights = np.ones(len(self)) if self.weights is None else self.weights
+
+        matrix = np.zeros((len(self.nodes), len(self.nodes)))
+        matrix[self.sources, self.targets] = weights
+        matrix[self.targets, self.sources] = weights
+        return matrix
+
+
+def to_networkx(nodes, sources, targets, weights=None):
+    """
+    Build a NetworkX graph from integer edge arrays.
+
+    Nodes are added first, in the given order, and edges in array order, so a
+    graph built from read_edgelist() is identical to the one read by
+    nx.read_weighted_edgelist(), iteration order included.
+
+    Returns:
+        networkx.Graph: The graph.
+    """
+    G = nx.Graph()
+    G.add_nodes_from(nodes)
+
+    names = np.asarray(nodes, dtype=object)
+    sources = names[sources].tolist()
+    targets = names[targets].tolist()
+    if weights is None:
+        G.add_edges_from(zip(sources, targets))
+    else:
+        G.add_weighted_edges_from(zip(sources, targets, np.asarray(weights).tolist()))
+
+    return G
+
+
+def _tokenize_lines(text):
+    """
+    Split the text of an edgelist file line by line, for files with comments
+    or rows of different lengths.
+    """
+    rows = []
+    for line in text.splitlines():
+        tokens = line.split(b"#", 1)[0].split()
+        if tokens:
+            rows.append(tokens[:3])
+
+    has_weights = any(len(row) > 2 for row in rows)
+    for row in rows:
+        if len(row) < 2:
+            raise ValueError(f"Invalid edgelist line: {b' '.join(row).decode()!r}")
+        if has_weights and len(row) == 2:
+            row.append(b"1.0")
+
+    n_columns = 3 if has_weights else 2
+    tokens = np.array([token for row in rows for token in row], dtype=bytes)
+    return tokens, n_columns
+
+
+def read_edgelist(filepath):
+    """
+    Parse an edgelist file with 2 (source target) or 3 (source target weight) columns.
+
+    Binary graph files (GRAPH_EXTENSION) are memory-mapped instead, see
+    read_binary_graph().
+
+    The whole file is tokenized at once with NumPy instead of line by line,
+    and node names are interned into integer ids. The result matches
+    nx.read_weighted_edgelist(): nodes are numbered in order of first
+    appearance, and a repeated edge keeps its first position and its last
+    weight.
+
+    Args:
+        filepath (str): Path to the edgelist file.
+
+    Returns:
+        EdgeList: The parsed edges.
+    """
+    if filepath.endswith(GRAPH_EXTENSION):
+        return read_binary_graph(filepath)
+
+    with open(filepath, "rb") as f:
+        text = f.read()
+
+    # Count the tokens of every line without splitting the file into lines
+    data = np.frombuffer(text, dtype=np.uint8)
+    space = WHITESPACE_TABLE[data]
+    token_starts = ~space
+    token_starts[1:] &= space[:-1]
+    line_ids = np.cumsum(data == ord("\n"))
+    tokens_per_line = np.bincount(line_ids[token_starts])
+    tokens_per_line = tokens_per_line[tokens_per_line > 0]
+
+    # Fast path for plain files where every line has the same number of tokens
+    n_columns = int(tokens_per_line[0]) if len(tokens_per_line) else 2
+    if b"#" not in text and n_columns in (2, 3) and np.all(tokens_per_line == n_columns):
+        tokens = np.array(text.split(), dtype=bytes)
+    else:
+        tokens, n_columns = _tokenize_lines(text)
+
+    tokens = tokens.reshape(-1, n_columns)
+    n_edges = len(tokens)
+
+    # Intern node names, numbering them in order of first appearance
+    endpoints = tokens[:, :2].ravel()
+    names, first_index, inverse = np.unique(endpoints, return_index=True, return_inverse=True)
+    order = np.argsort(first_index, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    ids = rank[inverse.ravel()].reshape(n_edges, 2)
+
+    nodes = np.char.decode(names[order], "utf-8").tolist()
+    sources, targets = ids[:, 0], ids[:, 1]
+    weights = tokens[:, 2].astype(np.float64) if n_columns == 3 else None
+
+    # Merge repeated edges in either direction, as nx.Graph does
+    keys = np.minimum(sources, targets) * len(nodes) + np.maximum(sources, targets)
+    unique_keys, first_edge = np.unique(keys, return_index=True)
+    if len(unique_keys) < n_edges:
+        if weights is not None:
+            _, last_from_end = np.unique(keys[::-1], return_index=True)
+            last_weights = weights[n_edges - 1 - last_from_end]
+        first_edge_order = np.argsort(first_edge, kind="stable")
+        keep = first_edge[first_edge_order]
+        sources, targets = sources[keep], targets[keep]
+        if weights is not None:
+            weights = last_weights[first_edge_order]
+
+    return EdgeList(nodes, sources, targets, weights)
+
+
+def read_graph(filepath):
+    """
+    Read an edgelist file into a NetworkX graph, like nx.read_weighted_edgelist().
+    """
+    return read_edgelist(filepath).graph
+
+
+def write_edgelist(filepath, nodes, sources, targets, weights=None):
+    """
+    Write integer edge arrays as an edgelist file.
+
+    The output is formatted like nx.write_weighted_edgelist(): one
+    'source target weight' line per edge, or 'source target' without weights.
+
+    Args:
+        filepath (str): Path to the edgelist file.
+        nodes (list): Node names, where nodes[i] is the node with integer id i.
+        sources (numpy.ndarray): Integer ids of the first node of each edge.
+        targets (numpy.ndarray): Integer ids of the second node of each edge.
+        weights (numpy.ndarray or None): Weight of each edge.
+    """
+    names = np.asarray(nodes, dtype=object)
+    columns = [names[sources].tolist(), names[targets].tolist()]
+    if weights is not None:
+        columns.append(map(str, np.asarray(weights, dtype=np.float64).tolist()))
+
+    with open(filepath, "w", encoding="utf-8") as f:
+        for line in map(" ".join, zip(*columns)):
+            f.write(line)
+            f.write("\n")
+
+
+def vocabulary_hash(nodes):
+    """
+    Compute the SHA-1 digest of a node vocabulary, as stored in its file.
+    """
+    digest = hashlib.sha1()
+    for node in nodes:
+        digest.update(f"{node}\n".encode("utf-8"))
+    return digest.digest()
+
+
+def default_vocabulary_path(filepath):
+    """
+    Path of the vocabulary of a graph file laid out like create_datasets.py
+    output, data/<A or B>/<network>_<percentage>%/<file>, which is
+    data/vocabulary/<network>.txt.
+    """
+    folder_path = os.path.dirname(os.path.abspath(filepath))
+    data_path = os.path.dirname(os.path.dirname(folder_path))
+    network = os.path.basename(folder_path).rsplit("_", 1)[0]
+    return os.path.join(data_path, VOCABULARY_FOLDER, f"{network}.txt")
+
+
+def write_vocabulary(vocabulary_path, nodes):
+    """
+    Write the node vocabulary of a network, one node name per line.
+
+    The file is written under a temporary name and moved into place, so that
+    concurrent readers never see a partial vocabulary.
+    """
+    os.makedirs(os.path.dirname(vocabulary_path) or ".", exist_ok=True)
+
+    temp_path = f"{vocabulary_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for node in nodes:
+            f.write(f"{node}\n")
+    os.replace(temp_path, vocabulary_path)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_vocabulary(vocabulary_path, modified_time, size):
+    with open(vocabulary_path, "r", encoding="utf-8") as f:
+        nodes = [line.rstrip("\n") for line in f]
+    return nodes, vocabulary_hash(nodes)
+
+
+def load_vocabulary(vocabulary_path):
+    """
+    Load a node vocabulary, one node name per line.
+
+    The vocabulary is read once per process while the file is unchanged. The
+    file is only ever extended (see vocabulary_ids), so its size changes with
+    every write, even within the resolution of its modification time. The
+    returned list is shared between the callers and must not be modified.
+
+    Returns:
+        tuple: The node names, where the node with id i is on line i, and the
+            SHA-1 digest of the vocabulary.
+
+    Raises:
+        FileNotFoundError: If the vocabulary does not exist.
+    """
+    stat = os.stat(vocabulary_path)
+    return _load_vocabulary(vocabulary_path, stat.st_mtime_ns, stat.st_size)
+
+
+class _FileLock:
+    """
+    Lock on a file next to a path, so that concurrent workers extend a vocabulary one at a time.
+
+    The lock is held on the open file rather than by its existence, so it is
+    released by the operating system when a worker dies, and the lock file left
+    behind never blocks the next runs.
+    """
+
+    def __init__(self, path):
+        self.path = f"{path}.lock"
+
+    def __enter__(self):
+        self.file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            # Locks the first byte, retrying for about 10 seconds before raising an OSError
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+
+
+def _current_vocabulary(vocabulary_path):
+    # Checked against the file every time, since other workers may extend it
+    try:
+        return load_vocabulary(vocabulary_path)[0]
+    except FileNotFoundError:
+        return []
+
+
+def vocabulary_ids(vocabulary_path, nodes):
+    """
+    Map node names to their ids in a shared vocabulary, extending it if needed.
+
+    Nodes missing from the vocabulary are appended to it, so the ids of the
+    existing nodes never change and all rankings written against the vocabulary
+    stay valid. create_datasets.py writes the vocabulary of a network with all
+    its nodes, so the rankings of its replicates never extend it, and the
+    binary graph files, which record its digest, stay valid as well.
+
+    Args:
+        vocabulary_path (str): Path to the vocabulary file.
+        nodes (list): Node names to map.
+
+    Returns:
+        numpy.ndarray: The vocabulary id of every node, as int32.
+    """
+    vocabulary = _current_vocabulary(vocabulary_path)
+    index = {node: i for i, node in enumerate(vocabulary)}
+
+    if any(node not in index for node in nodes):
+        os.makedirs(os.path.dirname(vocabulary_path) or ".", exist_ok=True)
+        with _FileLock(vocabulary_path):
+            # Re-read, another worker may have extended it in the meantime
+            vocabulary = _current_vocabulary(vocabulary_path)
+            index = {node: i for i, node in enumerate(vocabulary)}
+
+            new_nodes = [node for node in dict.fromkeys(nodes) if node not in index]
+            for node in new_nodes:
+                index[node] = len(index)
+
+            write_vocabulary(vocabulary_path, vocabulary + new_nodes)
+
+    return np.fromiter((index[node] for node in nodes), dtype=np.int32, count=len(nodes))
+
+
+def write_binary_graph(filepath, nodes, sources, targets, weights=None):
+    """
+    Write integer edge arrays as a binary graph file.
+
+    The node names are not stored in the file: the ids refer to the vocabulary
+    of the source network (see write_vocabulary), whose digest is recorded in
+    the header. Ids are stored as int32 and weights as float32.
+
+    Args:
+        filepath (str): Path to the binary graph file.
+        nodes (list): The vocabulary, where nodes[i] is the node with integer id i.
+        sources (numpy.ndarray): Integer ids of the first node of each edge.
+        targets (numpy.ndarray): Integer ids of the second node of each edge.
+        weights (numpy.ndarray or None): Weight of each edge.
+    """
+    flags = 0 if weights is None else FLAG_WEIGHTED
+    header = GRAPH_HEADER.pack(
+        GRAPH_MAGIC, GRAPH_VERSION, flags, len(nodes), len(sources), vocabulary_hash(nodes)
+    )
+
+    temp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(np.asarray(sources, dtype=GRAPH_ID_DTYPE).tobytes())
+        f.write(np.asarray(targets, dtype=GRAPH_ID_DTYPE).tobytes())
+        if weights is not None:
+            f.write(np.asarray(weights, dtype=GRAPH_WEIGHT_DTYPE).tobytes())
+    os.replace(temp_path, filepath)
+
+
+def read_binary_graph(filepath, vocabulary_path=None):
+    """
+    Memory-map a binary graph file written by write_binary_graph().
+
+    The edge arrays are read-only views of the file, nothing is copied or
+    parsed. Nodes are numbered like the vocabulary, so every node of the
+    source network is part of the graph, with or without edges.
+
+    Args:
+        filepath (str): Path to the binary graph file.
+        vocabulary_path (str or None): Path to the vocabulary. None uses
+            default_vocabulary_path(filepath).
+
+    Returns:
+        EdgeList: The edges, with int32 ids and float32 weights.
+
+    Raises:
+        ValueError: If the file is not a binary graph file, or was written
+            against another vocabulary.
+    """
+    with open(filepath, "rb") as f:
+        header = f.read(GRAPH_HEADER.size)
+
+    if len(header) != GRAPH_HEADER.size:
+        raise ValueError(f"'{filepath}' is not a binary graph file.")
+
+    magic, version, flags, n_nodes, n_edges, digest = GRAPH_HEADER.unpack(header)
+    if magic != GRAPH_MAGIC or version != GRAPH_VERSION:
+        raise ValueError(f"'{filepath}' is not a binary graph file of version {GRAPH_VERSION}.")
+
+    if vocabulary_path is None:
+        vocabulary_path = default_vocabulary_path(filepath)
+    nodes, vocabulary_digest = load_vocabulary(vocabulary_path)
+    if vocabulary_digest != digest or len(nodes) != n_nodes:
+        raise ValueError(f"'{filepath}' was not written against the vocabulary '{vocabulary_path}'.")
+
+    if n_edges == 0:
+        empty = np.zeros(0, dtype=GRAPH_ID_DTYPE)
+        weights = np.zeros(0, dtype=GRAPH_WEIGHT_DTYPE) if flags & FLAG_WEIGHTED else None
+        return EdgeList(nodes, empty, empty, weights)
+
+    def array(dtype, offset):
+        return np.memmap(filepath, dtype=dtype, mode="r", offset=offset, shape=(n_edges,))
+
+    id_bytes = n_edges * GRAPH_ID_DTYPE.itemsize
+    sources = array(GRAPH_ID_DTYPE, GRAPH_HEADER.size)
+    targets = array(GRAPH_ID_DTYPE, GRAPH_HEADER.size + id_bytes)
+    weights = None
+    if flags & FLAG_WEIGHTED:
+        weights = array(GRAPH_WEIGHT_DTYPE, GRAPH_HEADER.size + 2 * id_bytes)
+
+    return EdgeList(nodes, sources, targets, weights)
@@ -0,0 +1,414 @@
+import contextlib
+import cProfile
+import json
+import os
+import platform
+import re
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Environment variable selecting the profilers, e.g. PPI_PROFILE=cprofile,tracemalloc.
+# It is inherited by the worker processes, so their stages are profiled as well.
+PROFILE_ENV = "PPI_PROFILE"
+
+# Profilers that can be enabled
+PROFILERS = ("cprofile", "tracemalloc")
+
+# Folder of the run reports and of the profiles of their stages, which can be
+# moved with the REPORTS_ENV environment variable
+REPORTS_PATH = "reports"
+REPORTS_ENV = "PPI_REPORT_DIR"
+
+# Number of allocation sites recorded per stage when tracemalloc is enabled
+TRACEMALLOC_TOP_SITES = 10
+
+# Stage records of this process that have not been reported yet
+_records = []
+
+# Open stages of every thread of this process, innermost last
+_local = threading.local()
+
+
+def enabled_profilers():
+    """
+    Profilers enabled through the PROFILE_ENV environment variable.
+
+    Returns:
+        set: Names of the enabled profilers, among PROFILERS.
+    """
+    names = {name.strip().lower() for name in os.environ.get(PROFILE_ENV, "").split(",")}
+    return names & set(PROFILERS)
+
+
+def max_rss_bytes():
+    """
+    Peak resident set size of this process so far, or None where it is unavailable.
+    """
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def reports_path():
+    """
+    Folder of the run reports, from REPORTS_ENV or REPORTS_PATH.
+    """
+    return os.environ.get(REPORTS_ENV) or REPORTS_PATH
+
+
+def _open_stages():
+    if not hasattr(_local, "open_stages"):
+        _local.open_stages = []
+    return _local.open_stages
+
+
+def _profile_path(name):
+    slug = re.sub(r"[^\w.%-]+", "_", name).strip("_")
+    return os.path.join(reports_path(), "profiles", f"{slug}-{os.getpid()}-{time.time_ns()}.prof")
+
+
+@contextlib.contextmanager
+def stage(name, **details):
+    """
+    Time a stage of the pipeline.
+
+    The wall-clock and CPU time of the stage and the peak memory of the process
+    are recorded, together with the given details, and reported by the next
+    write_report() or collect() call of this process. When enabled through
+    PROFILE_ENV, the outermost stage of a process is also run under cProfile,
+    with the profile dumped to the 'profiles' folder of the reports, and
+    tracemalloc records the peak Python allocations of every stage.
+
+    Args:
+        name (str): Name of the stage, e.g. 'rank/cn'.
+        **details: JSON-serializable values describing the stage, e.g. the input file.
+
+    Yields:
+        dict: The record of the stage, which can be extended with more details.
+    """
+    profilers = enabled_profilers()
+    open_stages = _open_stages()
+    outermost = not open_stages
+
+    record = {"name": name, "pid": os.getpid(), "started": time.time(), **details}
+
+    profiler = None
+    if "cprofile" in profilers and outermost:
+        profiler = cProfile.Profile()
+
+    if "tracemalloc" in profilers:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # The peak of the enclosing stage is carried over, since it is reset here
+        if open_stages:
+            open_stages[-1]["python_peak"] = max(
+                open_stages[-1]["python_peak"], tracemalloc.get_traced_memory()[1]
+            )
+        tracemalloc.reset_peak()
+
+    state = {"python_peak": 0}
+    open_stages.append(state)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+        record["wall_seconds"] = time.perf_counter() - wall_start
+        record["cpu_seconds"] = time.process_time() - cpu_start
+        record["max_rss_bytes"] = max_rss_bytes()
+
+        open_stages.pop()
+        if tracemalloc.is_tracing():
+            python_peak = max(state["python_peak"], tracemalloc.get_traced_memory()[1])
+            record["python_peak_bytes"] = python_peak
+            if open_stages:
+                open_stages[-1]["python_peak"] = max(open_stages[-1]["python_peak"], python_peak)
+            if outermost:
+                statistics = tracemalloc.take_snapshot().statistics("lineno")
+                record["top_allocations"] = [
+                    {"site": str(statistic.traceback), "bytes": statistic.size}
+                    for statistic in statistics[:TRACEMALLOC_TOP_SITES]
+                ]
+
+        if profiler is not None:
+            profile_path = _profile_path(name)
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+            profiler.dump_stats(profile_path)
+            record["profile"] = profile_path
+
+        _records.append(record)
+
+
+def collect():
+    """
+    Take the stage records of this process that have not been reported yet.
+
+    Worker processes return them along with the result of their job, and the
+    parent process hands them to merge().
+
+    Returns:
+        list: The stage records.
+    """
+    records = list(_records)
+    _records.clear()
+    return records
+
+
+def merge(records):
+    """
+    Add stage records collected in another process to the records of this process.
+    """
+    _records.extend(records)
+
+
+def run_job(function, *args, **kwargs):
+    """
+    Run a job of a sweep, returning its failure instead of raising it.
+
+    A failed job is reported back instead of stopping the whole sweep, and the
+    stage records of the job are sent back with its outcome, for merge().
+
+    Returns:
+        tuple: (result of the function or None, traceback or None, stage records).
+    """
+    try:
+        return function(*args, **kwargs), None, collect()
+    except Exception:
+        return None, traceback.format_exc(), collect()
+
+
+def _run_isolated(function, job, options):
+    # In a worker process of its own, so that a crash only fails this job
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(run_job, function, *job, **options).result()
+        except Exception:
+            return None, traceback.format_exc(), []
+
+
+def run_jobs(function, jobs, workers=1, **options):
+    """
+    Run the jobs of a sweep on a pool of worker processes, yielding them as they complete.
+
+    A job raising an exception is reported as failed (see run_job()). A worker
+    process dying, e.g. killed when out of memory, breaks the whole pool and
+    every job still pending on it: those jobs are run again once the pool is
+    done, each in a worker process of its own, so that only the job that
+    crashed fails. The stage records of the jobs are merged into the records of
+    this process.
+
+    Args:
+        function (callable): Module-level function running a job.
+        jobs (list): Tuples of positional arguments of the function, one per job.
+        workers (int): Number of worker processes. 1 runs the jobs in this process.
+        **options: Keyword arguments of the function, shared by every job.
+
+    Yields:
+        tuple: (index of the job in jobs, result of the function or None,
+            traceback or None).
+    """
+    if workers <= 1:
+        for index, job in enumerate(jobs):
+            result, error, records = run_job(function, *job, **options)
+            merge(records)
+            yield index, result, error
+        return
+
+    broken = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_job, function, *job, **options): index
+            for index, job in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            try:
+                result, error, records = future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+                continue
+            except Exception:
+                # E.g. a result that cannot be sent back
+                yield futures[future], None, traceback.format_exc()
+                continue
+            merge(records)
+            yield futures[future], result, error
+
+    if not broken:
+        return
+
+    print(f"A worker process died, running {len(broken)} jobs again in their own processes")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_run_isolated, function, jobs[index], options): index
+            for index in broken
+        }
+        for future in as_completed(futures):
+            result, error, records = future.result()
+            merge(records)
+            yield futures[future], result, error
+
+
+class Progress:
+    """
+    Rate-limited progress reporting.
+
+    update() is cheap enough to call on every item of a hot loop, and only
+    prints when at least `interval` seconds have passed since the previous
+    report, or when the work is done.
+
+    Args:
+        total (int): Number of items to process.
+        description (str): Text printed in front of the progress.
+        interval (float): Minimum number of seconds between two reports.
+    """
+
+    def __init__(self, total, description, interval=1.0):
+        self.total = total
+        self.description = description
+        self.interval = interval
+        self.done = 0
+        self.start = time.perf_counter()
+        self.next_report = self.start
+
+    def update(self, count=1):
+        """
+        Record that `count` more items were processed.
+        """
+        self.done += count
+        if self.done >= self.total or time.perf_counter() >= self.next_report:
+            self.report()
+
+    def report(self):
+        now = time.perf_counter()
+        percent = 100 * self.done // self.total if self.total else 100
+        elapsed = now - self.start
+        print(f"{self.description}... {percent}% ({self.done}/{self.total}, {elapsed:.1f}s)")
+        self.next_report = now + self.interval
+
+
+def summarize(records):
+    """
+    Aggregate stage records by stage name.
+
+    Returns:
+        dict: Stage names mapped to their count, total and maximum wall-clock
+            time, total CPU time and peak memory.
+    """
+    summary = {}
+    for record in records:
+        entry = summary.setdefault(
+            record["name"],
+            {"count": 0, "wall_seconds": 0.0, "max_wall_seconds": 0.0, "cpu_seconds": 0.0},
+        )
+        entry["count"] += 1
+        entry["wall_seconds"] += record["wall_seconds"]
+        entry["max_wall_seconds"] = max(entry["max_wall_seconds"], record["wall_seconds"])
+        entry["cpu_seconds"] += record["cpu_seconds"]
+        for key in ("max_rss_bytes", "python_peak_bytes"):
+            if record.get(key) is not None:
+                entry[key] = max(entry.get(key, 0), record[key])
+
+    return summary
+
+
+def write_report(command, started, report_dir=None):
+    """
+    Write the machine-readable report of a run, with every stage recorded in
+    this process or merged from its workers.
+
+    The report is written to <report_dir>/<command>-<timestamp>-<pid>.json.
+
+    Args:
+        command (str): Name of the command, e.g. 'rank_method_I'.
+        started (float): Start time of the run, from time.time().
+        report_dir (str or None): Folder of the reports. None uses reports_path().
+
+    Returns:
+        str: Path to the report.
+    """
+    if report_dir is None:
+        report_dir = reports_path()
+
+    records = collect()
+    finished = time.time()
+
+    report = {
+        "command": command,
+        "argv": sys.argv,
+        "started": started,
+        "finished": finished,
+        "wall_seconds": finished - started,
+        "cpu_seconds": time.process_time(),
+        "max_rss_bytes": max_rss_bytes(),
+        "profilers": sorted(enabled_profilers()),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "summary": summarize(records),
+        "stages": records,
+    }
+
+    os.makedirs(report_dir, exist_ok=True)
+    timestamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+    report_path = os.path.join(report_dir, f"{command}-{timestamp}-{os.getpid()}.json")
+
+    temp_path = f"{report_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    os.replace(temp_path, report_path)
+
+    return report_path
+
+
+def add_arguments(parser):
+    """
+    Add the --profile and --report-dir options to a command-line parser.
+    """
+    parser.add_argument(
+        "--profile",
+        action="append",
+        choices=PROFILERS,
+        default=[],
+        help=f"Profile every job with cProfile and / or tracemalloc (repeatable). "
+        f"Can also be enabled with the {PROFILE_ENV} environment variable.",
+    )
+    parser.add_argument(
+        "--report-dir",
+        default=None,
+        help=f"Folder of the timing report written at the end of the run "
+        f"(default: ${REPORTS_ENV} or '{REPORTS_PATH}').",
+    )
+
+
+def configure(args):
+    """
+    Enable the profilers and the report folder requested on the command line, for
+    this process and its workers.
+    """
+    if args.report_dir:
+        os.environ[REPORTS_ENV] = args.report_dir
+    if args.profile:
+        profilers = enabled_profilers() | set(args.profile)
+        os.environ[PROFILE_ENV] = ",".join(sorted(profilers))
@@ -1,6 +1,49 @@
+import argparse
+import functools
+import importlib
 import os
+import shutil
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from clustering_module import ap, clusterone, imhrc, mcl, wcc
+import graph_io
+import instrumentation
+import result_cache
+import selection
+from clustering_module import jvm
+
+# Clustering algorithms and the modules implementing them. A module, and the
+# backend it depends on (scikit-learn, Java), is only imported when its
+# algorithm runs.
+CLUSTERING_MODULES = {
+    "ap": "clustering_module.ap",
+    "imhrc": "clustering_module.imhrc",
+    "clusterone": "clustering_module.clusterone",
+    "mcl": "clustering_module.mcl",
+    "wcc": "clustering_module.wcc",
+}
+
+# Folder of the reduced networks
+DATA_FOLDER = "data/A"
+
+# Files implementing the clustering algorithms besides their modules, relative to
+# this folder. A change to any of them invalidates the cached results of the algorithm.
+CLUSTERING_SOURCES = {
+    "ap": ["graph_io.py", "similarity/sparse.py"],
+    "imhrc": ["clustering_module/jvm.py", "clustering_module/imhrc/IMHRC-V1.jar"],
+    "clusterone": ["clustering_module/jvm.py", "clustering_module/ClusterONE-v1.0.jar"],
+    "mcl": ["graph_io.py"],
+    "wcc": ["graph_io.py", "similarity/sparse.py"],
+}
+
+# Clustering algorithms that can read binary graph files, the others need text edgelists
+BINARY_CLUSTERING_ALGORITHMS = {"ap", "mcl", "wcc"}
+
+# Clustering algorithms that run in Java processes, each in its own workspace, so
+# that several of them can run at once. They are scheduled on a pool of threads
+# waiting on the processes, the other algorithms on a pool of worker processes.
+JAVA_CLUSTERING_ALGORITHMS = {"imhrc", "clusterone"}
 
 
 def get_reduced_networks_folders(data_folder):
@@ -23,6 +66,147 @@ def get_reduced_networks_folders(data_folder):
     return folders
 
 
+def get_reduced_network_files(folder_path, binary=False):
+    """
+    Get the reduced network files of a folder, one per network.
+
+    Args:
+        folder_path (str): Path to the reduced network folder.
+        binary (bool): Whether to prefer binary graph files over text edgelists.
+
+    Returns:
+        list: File names in the folder.
+    """
+    file_names = set(os.listdir(folder_path))
+    extensions = [graph_io.GRAPH_EXTENSION, ".txt"] if binary else [".txt"]
+
+    networks = {}
+    for file_name in file_names:
+        stem, ext = os.path.splitext(file_name)
+        if ext in extensions and (
+            stem not in networks
+            or extensions.index(ext) < extensions.index(os.path.splitext(networks[stem])[1])
+        ):
+            networks[stem] = file_name
+
+    return list(networks.values())
+
+
+def clustering_function(clustering_algorithm, name="cluster_network"):
+    """
+    Import the module of a clustering algorithm and return its cluster_network
+    function, or another function of the module by name.
+    """
+    return getattr(importlib.import_module(CLUSTERING_MODULES[clustering_algorithm]), name)
+
+
+def clustering_cache_key(clustering_algorithm, file_path, options=None):
+    """
+    Key of the cached results of a clustering algorithm on a network file.
+
+    The names of the result files derive from the name and folder of the
+    network file, which are part of the key along with its contents.
+    """
+    module = importlib.import_module(CLUSTERING_MODULES[clustering_algorithm])
+    root = os.path.dirname(os.path.abspath(__file__))
+    version = result_cache.source_version(
+        module.__file__,
+        *(os.path.join(root, path) for path in CLUSTERING_SOURCES[clustering_algorithm]),
+    )
+    name = os.path.join(
+        os.path.basename(os.path.dirname(file_path)), os.path.basename(file_path)
+    )
+    return result_cache.result_key(
+        f"cluster/{clustering_algorithm}", version, file_path, {"name": name, **(options or {})}
+    )
+
+
+def cluster_file(clustering_algorithm, cluster_network, file_path, saving_folder_path, **options):
+    """
+    Apply a clustering algorithm to a network file, timing it as a stage of the run.
+
+    Results are reused from the result cache when the network file, the
+    algorithm and its options did not change.
+    """
+    with instrumentation.stage(f"cluster/{clustering_algorithm}", file=file_path) as record:
+        if not result_cache.enabled():
+            cluster_network(file_path, saving_folder_path, **options)
+            return
+
+        _, record["cached"] = result_cache.cached(
+            clustering_cache_key(clustering_algorithm, file_path, options),
+            saving_folder_path,
+            lambda folder: cluster_network(file_path, folder, **options),
+        )
+
+
+def cluster_files(clustering_algorithm, cluster_networks, jobs):
+    """
+    Apply a Java clustering algorithm to a batch of network files in one Java
+    process, timing the batch as a stage of the run.
+
+    Only the networks missing from the result cache are clustered.
+
+    Returns:
+        list: (job, traceback) tuples of the jobs that failed.
+    """
+    with instrumentation.stage(
+        f"cluster/{clustering_algorithm}/batch", files=len(jobs)
+    ) as record:
+        if not result_cache.enabled():
+            return cluster_networks(jobs)
+
+        keys = {job: clustering_cache_key(clustering_algorithm, job[0]) for job in jobs}
+        missed_jobs = [job for job in jobs if result_cache.restore(keys[job], job[1]) is None]
+        record["cached"] = len(jobs) - len(missed_jobs)
+
+        # The missed networks are clustered to staging folders, then cached
+        staging_folders = {job: result_cache.staging_folder() for job in missed_jobs}
+        try:
+            failures = cluster_networks(
+                [(job[0], staging_folders[job]) for job in missed_jobs]
+            )
+            failed_files = {file_path for (file_path, _), _ in failures}
+            for job in missed_jobs:
+                if job[0] not in failed_files:
+                    result_cache.commit(keys[job], staging_folders[job], job[1])
+        finally:
+            for folder in staging_folders.values():
+                shutil.rmtree(folder, ignore_errors=True)
+
+        saving_folders = {job[0]: job[1] for job in missed_jobs}
+        return [
+            ((file_path, saving_folders[file_path]), error)
+            for (file_path, _), error in failures
+        ]
+
+
+def cluster_batch(clustering_algorithm, jobs):
+    """
+    Apply a Java clustering algorithm to a batch of network files in one Java
+    process, then rerun the networks that failed in the batch with a Java
+    process each, as without batching.
+
+    Returns:
+        list: (job, traceback) tuples of the jobs that failed on their own as well.
+    """
+    try:
+        failures = cluster_files(
+            clustering_algorithm, clustering_function(clustering_algorithm, "cluster_networks"), jobs
+        )
+    except Exception:
+        failures = [(job, traceback.format_exc()) for job in jobs]
+
+    failed_jobs = []
+    for job, _ in failures:
+        try:
+            cluster_file(clustering_algorithm, clustering_function(clustering_algorithm), *job)
+        except Exception:
+            failed_jobs.append((job, traceback.format_exc()))
+
+    return failed_jobs
+
+
 def create_cluster_filepath(clustering_algorithm):
     """
     Create a filepath for saving clustering results based on the clustering algorithm.
@@ -45,38 +229,28 @@ def create_cluster_filepath(clustering_algorithm):
     return working_path
 
 
-def main():
+def get_clustering_jobs(clustering_algorithms, data_folder=DATA_FOLDER, filters=None):
     """
-    Execute clustering algorithms on reduced networks in a specified folder.
+    Expand the clustering jobs of every algorithm, reduced network folder and replicate.
 
-    This function iterates over available clustering algorithms and applies them
-    to reduced networks in the specified data folder. The results are saved in
-    folders corresponding to each clustering algorithm.
+    The saving folder of every job, clustered_networks/<algorithm>/<network folder>,
+    is created.
 
     Args:
-        None
+        clustering_algorithms (list): Algorithms to run, keys of CLUSTERING_MODULES.
+        data_folder (str): Folder of the reduced networks.
+        filters (dict or None): Only cluster the selected networks, percentages and
+            replicates (see selection.matches).
 
     Returns:
-        None
-    """
-    # Define clustering functions and corresponding algorithms
-    clustering_functions = {
-        "ap": ap.cluster_network,
-        "imhrc": imhrc.cluster_network,
-        "clusterone": clusterone.cluster_network,
-        "mcl": mcl.cluster_network,
-        "wcc": wcc.cluster_network,
-    }
-
-    # List of available clustering algorithms
-    clustering_algorithms = list(clustering_functions.keys())
-
-    # Data folder path
-    data_folder = "data/A"
-
+        list: (clustering_algorithm, file_path, saving_folder_path) tuples, the
+            largest networks first.
+    """
     # Get a list of reduced network folder names
     reduced_network_folder_names = get_reduced_networks_folders(data_folder)
 
+    jobs = []
+
     # Iterate over clustering algorithms
     for clustering_algorithm in clustering_algorithms:
         # Create a path for saving clustering results
@@ -84,30 +258,319 @@ def main():
 
         # Iterate over reduced network folders
         for folder_name in sorted(reduced_network_folder_names):
-            # Change to the current directory
-            os.chdir(".")
-
             # Create a path for saving clustering results for the current network folder
             saving_folder_path = os.path.join(cluster_folder_path, folder_name)
             os.makedirs(saving_folder_path, exist_ok=True)
 
             # Get a list of reduced network files in the current folder
-            reduced_networks_file_list = [
-                network
-                for network in os.listdir(os.path.join(data_folder, folder_name))
-                if network.endswith(".txt")
-            ]
+            reduced_networks_file_list = get_reduced_network_files(
+                os.path.join(data_folder, folder_name),
+                binary=clustering_algorithm in BINARY_CLUSTERING_ALGORITHMS,
+            )
 
             # Iterate over reduced network files
             for reduced_network_filename in sorted(reduced_networks_file_list):
                 # Create a full file path for the current reduced network file
                 file_path = os.path.join(data_folder, folder_name, reduced_network_filename)
+                if not selection.is_selected(file_path, filters):
+                    continue
+
+                jobs.append((clustering_algorithm, file_path, saving_folder_path))
+
+    # Largest networks first, so that the longest jobs do not start last
+    return sorted(jobs, key=lambda job: -os.path.getsize(job[1]))
+
+
+def cpu_budgets(workers, java_workers, python_jobs=True, java_jobs=True):
+    """
+    Size the pool of the Python clusterers and the pool of the Java clusterers.
 
-                # Apply the selected clustering algorithm to the current network file
-                clustering_functions[clustering_algorithm](file_path, saving_folder_path)
+    A budget left to None takes the CPUs left by the other one, or half of the
+    CPUs when both are None and both kinds of jobs are scheduled.
 
-                break
-            break
+    Args:
+        workers (int or None): Number of worker processes of the Python clusterers.
+        java_workers (int or None): Maximum number of Java processes running at once.
+        python_jobs (bool): Whether Python clustering jobs are scheduled.
+        java_jobs (bool): Whether Java clustering jobs are scheduled.
+
+    Returns:
+        tuple: (workers, java_workers).
+    """
+    cpus = os.cpu_count() or 1
+
+    if workers is None and java_workers is None and python_jobs and java_jobs:
+        workers = max(1, cpus // 2)
+    if workers is None:
+        workers = max(1, cpus - java_workers) if java_workers and java_jobs else cpus
+    if java_workers is None:
+        java_workers = max(1, cpus - workers) if python_jobs else cpus
+
+    return workers, java_workers
+
+
+def cluster_job(clustering_algorithm, file_path, saving_folder_path, options):
+    cluster_file(
+        clustering_algorithm,
+        clustering_function(clustering_algorithm),
+        file_path,
+        saving_folder_path,
+        **options,
+    )
+
+
+def submit_java_jobs(executor, jobs, workers, batch_size=1, options=None):
+    """
+    Submit Java clustering jobs to a thread pool, largest networks first.
+
+    Every network starts its own Java process, unless batches are requested
+    and the batch driver can be compiled. Networks that fail in a batch are
+    rerun with a Java process each (see cluster_batch()).
+
+    Args:
+        executor (ThreadPoolExecutor): The pool of the Java clusterers.
+        jobs (list): (clustering_algorithm, file_path, saving_folder_path) tuples,
+            the largest networks first.
+        workers (int): Size of the pool.
+        batch_size (int): Maximum number of networks clustered by one Java
+            process. 1 starts a Java process per network.
+        options (dict or None): Keyword arguments of the clustering algorithms.
+
+    Returns:
+        dict: Futures mapped to the jobs they run. The futures of batches return
+            their failed (file_path, saving_folder_path) jobs with a traceback.
+    """
+    if options is None:
+        options = {}
+
+    batched = batch_size > 1 and jvm.driver_folder() is not None
+
+    units = []
+    for clustering_algorithm in dict.fromkeys(job[0] for job in jobs):
+        algorithm_jobs = [job[1:] for job in jobs if job[0] == clustering_algorithm]
+
+        if batched:
+            for batch in jvm.split_batches(algorithm_jobs, workers, batch_size):
+                units.append(
+                    (cluster_batch, [clustering_algorithm, batch], clustering_algorithm, batch)
+                )
+        else:
+            cluster_network = functools.partial(
+                cluster_file,
+                clustering_algorithm,
+                clustering_function(clustering_algorithm),
+                **options.get(clustering_algorithm, {}),
+            )
+            for job in algorithm_jobs:
+                units.append((cluster_network, job, clustering_algorithm, [job]))
+
+    # Batches keep the order of their jobs, so their first network is their largest
+    units.sort(key=lambda unit: -os.path.getsize(unit[3][0][0]))
+
+    futures = {}
+    for function, arguments, clustering_algorithm, unit_jobs in units:
+        future = executor.submit(function, *arguments)
+        futures[future] = [(clustering_algorithm, *job) for job in unit_jobs]
+
+    return futures
+
+
+def perform_clustering(
+    clustering_algorithms=None,
+    data_folder=DATA_FOLDER,
+    filters=None,
+    options=None,
+    workers=None,
+    java_workers=None,
+    java_batch_size=1,
+):
+    """
+    Execute clustering algorithms on reduced networks in a specified folder.
+
+    Every selected (algorithm, network, replicate) job is scheduled at once, the
+    largest networks first. The Python clusterers run on a pool of worker
+    processes, and the Java clusterers on a separate pool of threads waiting on
+    their Java processes, so both pools keep their share of the CPUs busy. The
+    results are saved in clustered_networks/<algorithm>/<network folder>.
+
+    Args:
+        clustering_algorithms (list or None): Algorithms to run, keys of
+            CLUSTERING_MODULES. None runs all of them.
+        data_folder (str): Folder of the reduced networks.
+        filters (dict or None): Only cluster the selected networks, percentages and
+            replicates (see selection.matches).
+        options (dict or None): Clustering algorithms mapped to the keyword
+            arguments of their cluster_network function, e.g. {"ap": {"mode": "sparse"}}.
+        workers (int or None): Number of worker processes of the Python
+            clusterers. 1 runs them in this process. None shares the CPUs with
+            the Java clusterers (see cpu_budgets).
+        java_workers (int or None): Maximum number of Java clusterer processes
+            running at once. None shares the CPUs with the Python clusterers.
+        java_batch_size (int): Maximum number of networks clustered by one Java
+            process. 1 starts a Java process per network.
+
+    Returns:
+        list: (clustering_algorithm, file_path, traceback) tuples of the jobs that failed.
+    """
+    # List of requested clustering algorithms
+    if clustering_algorithms is None:
+        clustering_algorithms = list(CLUSTERING_MODULES.keys())
+
+    if options is None:
+        options = {}
+
+    jobs = get_clustering_jobs(clustering_algorithms, data_folder, filters)
+    java_jobs = [job for job in jobs if job[0] in JAVA_CLUSTERING_ALGORITHMS]
+    python_jobs = [job for job in jobs if job[0] not in JAVA_CLUSTERING_ALGORITHMS]
+
+    workers, java_workers = cpu_budgets(
+        workers, java_workers, python_jobs=bool(python_jobs), java_jobs=bool(java_jobs)
+    )
+
+    progress = instrumentation.Progress(len(jobs), "Clustering")
+    failed_jobs = []
+
+    def report(clustering_algorithm, file_path, error):
+        print(f"Failed to cluster {file_path} with {clustering_algorithm}:\n{error}")
+        failed_jobs.append((clustering_algorithm, file_path, error))
+
+    with ThreadPoolExecutor(max_workers=java_workers) as java_executor:
+        # The Java jobs start first, their processes run while the Python jobs
+        # run on their pool, or in this process when there is a single worker
+        java_futures = submit_java_jobs(
+            java_executor, java_jobs, java_workers, java_batch_size, options
+        )
+
+        python_job_arguments = [(*job, options.get(job[0], {})) for job in python_jobs]
+        for index, _, error in instrumentation.run_jobs(
+            cluster_job, python_job_arguments, workers
+        ):
+            clustering_algorithm, file_path, _ = python_jobs[index]
+            if error is not None:
+                report(clustering_algorithm, file_path, error)
+            progress.update()
+
+        for future in as_completed(java_futures):
+            unit_jobs = java_futures[future]
+            clustering_algorithm = unit_jobs[0][0]
+            try:
+                failures = future.result() or []
+            except Exception:
+                error = traceback.format_exc()
+                failures = [(job[1:], error) for job in unit_jobs]
+            for (file_path, _), error in failures:
+                report(clustering_algorithm, file_path, error)
+            progress.update(len(unit_jobs))
+
+    print(f"{len(jobs) - len(failed_jobs)} of {len(jobs)} jobs completed")
+
+    return failed_jobs
+
+
+def add_arguments(parser):
+    """
+    Add the options of the clustering to a command-line parser.
+    """
+    parser.add_argument(
+        "--data-folder", default=DATA_FOLDER, help="Folder of the reduced networks."
+    )
+    parser.add_argument(
+        "--ap-mode",
+        choices=["dense", "sparse"],
+        default="dense",
+        help="Pass the affinity propagation messages between all node pairs, or only along "
+        "the edges, with memory that scales with the number of edges.",
+    )
+    parser.add_argument(
+        "--mcl-inflation",
+        type=float,
+        nargs="+",
+        default=[2.0],
+        help="MCL inflation parameter. Several values are clustered in one sweep that shares "
+        "the parsed network and its first expansion, and saved with an '_I<inflation>' suffix.",
+    )
+    parser.add_argument(
+        "--mcl-pruning-threshold",
+        type=float,
+        default=0.001,
+        help="Threshold below which MCL matrix entries are pruned (0 disables pruning).",
+    )
+    parser.add_argument(
+        "--mcl-loop-value", type=float, default=1.0, help="Weight of the MCL self-loops."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes of the AP, MCL and WCC clusterers, 1 running them "
+        "in the main process (default: the CPUs left by --java-workers, or half of them).",
+    )
+    parser.add_argument(
+        "--java-workers",
+        type=int,
+        default=None,
+        help="Maximum number of ClusterONE / IMHRC processes running at once "
+        "(default: the CPUs left by --workers, or half of them).",
+    )
+    parser.add_argument(
+        "--java-batch-size",
+        type=int,
+        default=1,
+        help="Experimental: maximum number of networks clustered by one ClusterONE / IMHRC "
+        f"process, e.g. {jvm.BATCH_SIZE}, when javac is available to build the batch driver. "
+        "Networks that fail in a batch are rerun with a process each (default: 1, a process "
+        "per network).",
+    )
+    selection.add_arguments(parser, methods=list(CLUSTERING_MODULES))
+    result_cache.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+
+
+def clustering_options(args):
+    """
+    Keyword arguments of every clustering algorithm, from the parsed command-line arguments.
+    """
+    inflation = args.mcl_inflation[0] if len(args.mcl_inflation) == 1 else args.mcl_inflation
+    return {
+        "ap": {"mode": args.ap_mode},
+        "mcl": {
+            "inflation": inflation,
+            "pruning_threshold": args.mcl_pruning_threshold,
+            "loop_value": args.mcl_loop_value,
+        },
+    }
+
+
+def run(args):
+    """
+    Cluster the reduced networks from parsed command-line arguments, and write the run report.
+    """
+    instrumentation.configure(args)
+    result_cache.configure(args)
+
+    started = time.time()
+    failed_jobs = perform_clustering(
+        clustering_algorithms=args.methods or None,
+        data_folder=args.data_folder,
+        filters=selection.filters_from_args(args),
+        options=clustering_options(args),
+        workers=args.workers,
+        java_workers=args.java_workers,
+        java_batch_size=args.java_batch_size,
+    )
+    if result_cache.enabled():
+        # Bound the cache once per run, including the results of this run
+        result_cache.evict()
+    print(f"Report: {instrumentation.write_report('perform_clustering', started)}")
+
+    return failed_jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster the reduced networks.")
+    add_arguments(parser)
+    run(parser.parse_args())
 
 
-main()
+if __name__ == "__main__":
+    main()
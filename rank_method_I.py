@@ -1,21 +1,53 @@
+import argparse
 import os
+import shutil
+import time
 
-import networkx as nx
+import numpy as np
 
-from similarity import cn, jc, l3, pa, ra
+import graph_io
+import instrumentation
+import result_cache
+import selection
+from similarity import cn, jc, l3, pa, ra, rankings, sparse
+from similarity.prepared import load_prepared
 
+# Define similarity functions and corresponding algorithms. Every function
+# returns the scored pairs as arrays, which are ranked when they are written.
+SIMILARITY_FUNCTIONS = {
+    "cn": cn.cn_scores,
+    "jc": jc.jc_scores,
+    "pa": pa.pa_scores,
+    "ra": ra.ra_scores,
+    "l3": l3.l3_scores,
+}
 
-def get_folders(path):
-    folders = [folder for folder in os.listdir(path) if os.path.isdir(os.path.join(path, folder))]
-    return folders
+# Hop radius beyond which a similarity method only produces zero scores.
+# None means that every non-adjacent pair can have a non-zero score.
+SIMILARITY_RADIUS = {"cn": 2, "jc": 2, "pa": None, "ra": 2, "l3": 3}
+
+# Similarity functions that can score row blocks under a memory budget
+BLOCKED_SIMILARITY_FUNCTIONS = {
+    "cn": cn.cn_score_blocks,
+    "jc": jc.jc_score_blocks,
+    "ra": ra.ra_score_blocks,
+}
 
+# Folder of the prepared graphs cached between runs
+PREPARED_CACHE_PATH = "data/.prepared"
 
-def get_complement(filepath):
-    G = nx.read_weighted_edgelist(filepath, create_using=nx.Graph(), nodetype=str)
-    # Get the complement of the graph
-    complement_G = nx.complement(G)
+# Folder of the ranked edges written by parallel runs
+RANKED_EDGES_PATH = "ranked_edges"
 
-    return G, complement_G
+# Files of a cached ranking: the ranking, and a copy of the vocabulary it was
+# written against
+CACHED_RANKING = "ranking.rank"
+CACHED_VOCABULARY = "vocabulary.txt"
+
+
+def get_folders(path):
+    folders = [folder for folder in os.listdir(path) if os.path.isdir(os.path.join(path, folder))]
+    return folders
 
 
 def viewdict(filepath, dictionary):
@@ -25,41 +57,390 @@ def viewdict(filepath, dictionary):
     print("\n")
 
 
-def rank_edges():
+def get_ranking_paths(graph_full_path, similarity_algorithm, saving_root):
+    # ranked_edges/<algorithm>/<network folder>/<file>_<algorithm>.rank, against the
+    # node vocabulary of the network in data/vocabulary/<network>.txt
+    folder = os.path.basename(os.path.dirname(graph_full_path))
+    file_name, file_ext = os.path.splitext(os.path.basename(graph_full_path))
+    saving_folder_path = os.path.join(saving_root, similarity_algorithm, folder)
+    os.makedirs(saving_folder_path, exist_ok=True)
+
+    ranking_path = os.path.join(saving_folder_path, f"{file_name}_{similarity_algorithm}.rank")
+    vocabulary_path = graph_io.default_vocabulary_path(graph_full_path)
+
+    return ranking_path, vocabulary_path
+
+
+def ranking_method(similarity_algorithm, weighted=False):
+    # Weighted rankings are stored apart, under a 'w' prefixed method name
+    return f"w{similarity_algorithm}" if weighted else similarity_algorithm
+
+
+def ranking_cache_key(
+    graph_full_path, similarity_algorithm, include_zero_scores, top_k, memory_budget, weighted
+):
+    # Rankings are invalidated by any change to the ranking code, the similarity
+    # package or the graph reader
+    similarity_folder = os.path.dirname(os.path.abspath(sparse.__file__))
+    version = result_cache.source_version(
+        os.path.abspath(__file__),
+        os.path.abspath(graph_io.__file__),
+        *sorted(
+            os.path.join(similarity_folder, name)
+            for name in os.listdir(similarity_folder)
+            if name.endswith(".py")
+        ),
+    )
+    return result_cache.result_key(
+        f"rank/{similarity_algorithm}",
+        version,
+        graph_full_path,
+        {
+            "include_zero_scores": include_zero_scores,
+            "top_k": top_k,
+            "memory_budget": memory_budget,
+            "weighted": weighted,
+        },
+    )
+
+
+def place_ranking(entry, graph_full_path, method, saving_root):
+    # Write a cached ranking against the vocabulary of its network, linking it
+    # when its node ids are unchanged
+    ranking_path, vocabulary_path = get_ranking_paths(graph_full_path, method, saving_root)
+    nodes = graph_io.load_vocabulary(os.path.join(entry, CACHED_VOCABULARY))[0]
+    ids = graph_io.vocabulary_ids(vocabulary_path, nodes)
+
+    if np.array_equal(ids, np.arange(len(ids))):
+        result_cache.place(os.path.join(entry, CACHED_RANKING), ranking_path)
+    else:
+        rankings.remap_ranking(os.path.join(entry, CACHED_RANKING), ranking_path, ids)
+
+
+def restore_ranking(key, graph_full_path, method, saving_root):
+    """
+    Write a ranking from the result cache.
+
+    Returns:
+        bool: Whether the ranking was cached.
+    """
+    found = result_cache.lookup(key)
+    if found is None:
+        return False
+
+    try:
+        place_ranking(found[0], graph_full_path, method, saving_root)
+    except FileNotFoundError:
+        return False  # Evicted in the meantime
+
+    return True
+
+
+def rank_cached(key, prepared_graph, graph_full_path, similarity_algorithm, saving_root, **options):
+    # Rank to a staging folder, cache the ranking with a copy of the vocabulary
+    # of the network, then place the ranking in the output folder
+    method = ranking_method(similarity_algorithm, options["weighted"])
+    staging_root = result_cache.staging_folder()
+    try:
+        rank_prepared(
+            prepared_graph,
+            graph_full_path,
+            similarity_algorithm,
+            options["include_zero_scores"],
+            staging_root,
+            options["top_k"],
+            options["memory_budget"],
+            options["weighted"],
+        )
+
+        ranking_path, vocabulary_path = get_ranking_paths(graph_full_path, method, staging_root)
+        vocabulary_copy = os.path.join(staging_root, CACHED_VOCABULARY)
+        if os.path.exists(vocabulary_path):
+            shutil.copyfile(vocabulary_path, vocabulary_copy)
+        else:
+            # Networks without nodes leave the vocabulary unwritten
+            open(vocabulary_copy, "w").close()
+
+        entry = result_cache.store(
+            key, {CACHED_RANKING: ranking_path, CACHED_VOCABULARY: vocabulary_copy}
+        )
+    finally:
+        shutil.rmtree(staging_root, ignore_errors=True)
+
+    place_ranking(entry, graph_full_path, method, saving_root)
+
+
+def rank_file(
+    graph_full_path,
+    similarity_algorithms,
+    include_zero_scores=False,
+    saving_root=None,
+    top_k=None,
+    memory_budget=None,
+    weighted=False,
+):
+    options = {
+        "include_zero_scores": include_zero_scores,
+        "top_k": top_k,
+        "memory_budget": memory_budget,
+        "weighted": weighted,
+    }
+
+    # Rankings written to files are reused from the result cache when the graph,
+    # the ranking code and the options did not change
+    keys = {}
+    if saving_root is not None and result_cache.enabled():
+        keys = {
+            similarity_algorithm: ranking_cache_key(graph_full_path, similarity_algorithm, **options)
+            for similarity_algorithm in similarity_algorithms
+        }
+
+    missed_algorithms = []
+    for similarity_algorithm in similarity_algorithms:
+        if similarity_algorithm in keys:
+            with instrumentation.stage(
+                f"restore/{similarity_algorithm}", file=graph_full_path
+            ) as record:
+                record["hit"] = restore_ranking(
+                    keys[similarity_algorithm],
+                    graph_full_path,
+                    ranking_method(similarity_algorithm, weighted),
+                    saving_root,
+                )
+            if record["hit"]:
+                continue
+        missed_algorithms.append(similarity_algorithm)
+
+    if not missed_algorithms:
+        return
+
+    # Parse the graph once and share it between all similarity algorithms
+    with instrumentation.stage("prepare", file=graph_full_path):
+        prepared_graph = load_prepared(graph_full_path, cache_dir=PREPARED_CACHE_PATH)
+
+    for similarity_algorithm in missed_algorithms:
+        with instrumentation.stage(f"rank/{similarity_algorithm}", file=graph_full_path):
+            if similarity_algorithm in keys:
+                rank_cached(
+                    keys[similarity_algorithm],
+                    prepared_graph,
+                    graph_full_path,
+                    similarity_algorithm,
+                    saving_root,
+                    **options,
+                )
+                continue
+
+            rank_prepared(
+                prepared_graph,
+                graph_full_path,
+                similarity_algorithm,
+                include_zero_scores,
+                saving_root,
+                top_k,
+                memory_budget,
+                weighted,
+            )
+
+
+def rank_prepared(
+    prepared_graph,
+    graph_full_path,
+    similarity_algorithm,
+    include_zero_scores,
+    saving_root,
+    top_k,
+    memory_budget,
+    weighted,
+):
+    complement_graph = prepared_graph.candidates(
+        radius=SIMILARITY_RADIUS[similarity_algorithm],
+        include_zero_scores=include_zero_scores,
+    )
+
+    if saving_root is not None:
+        method = ranking_method(similarity_algorithm, weighted)
+        ranking_path, vocabulary_path = get_ranking_paths(graph_full_path, method, saving_root)
+
+    if memory_budget is not None and similarity_algorithm in BLOCKED_SIMILARITY_FUNCTIONS:
+        # Within the radius, the blocks generate their own candidate pairs
+        nodes, blocks = BLOCKED_SIMILARITY_FUNCTIONS[similarity_algorithm](
+            prepared_graph,
+            complement_graph if include_zero_scores else None,
+            memory_budget=memory_budget,
+            weighted=weighted,
+        )
+
+        if saving_root is not None and top_k is None:
+            # Stream every block to disk instead of holding the full ranking
+            rankings.write_ranking_blocks(ranking_path, vocabulary_path, nodes, blocks)
+            return
+
+        scored_pairs = (nodes, *sparse.select_blocks(blocks, top_k=top_k))
+    else:
+        scored_pairs = SIMILARITY_FUNCTIONS[similarity_algorithm](
+            prepared_graph, complement_graph, weighted=weighted
+        )
+
+    if saving_root is None:
+        print(similarity_algorithm, graph_full_path)
+        viewdict(graph_full_path, sparse.rank_scores(*scored_pairs, top_k=top_k))
+    else:
+        rankings.write_ranking(ranking_path, vocabulary_path, *scored_pairs, top_k=top_k)
+
+
+def get_reduced_graph_files(data_path_a):
+    # One file per reduced network, the memory-mappable binary graph when both
+    # the binary and the text file exist
+    graph_files = []
+    for folder in sorted(get_folders(data_path_a)):
+        folder_path = os.path.join(data_path_a, folder)
+        file_names = set(os.listdir(folder_path))
+        for file_name in sorted(file_names):
+            stem, ext = os.path.splitext(file_name)
+            if ext == ".txt" and stem + graph_io.GRAPH_EXTENSION in file_names:
+                continue
+            if ext not in (".txt", graph_io.GRAPH_EXTENSION):
+                continue
+            graph_files.append(os.path.join(folder_path, file_name))
+    return graph_files
+
+
+def rank_edges(
+    similarity_algorithms=None,
+    include_zero_scores=False,
+    workers=1,
+    saving_root=None,
+    top_k=None,
+    memory_budget=None,
+    weighted=False,
+    filters=None,
+):
     data_path_a = "data/A"
     data_path_b = "data/B"
-    data_folders = sorted(get_folders(data_path_a))
-
-    # Define similarity functions and corresponding algorithms
-    similarity_functions = {
-        "cn": cn.calculate_cn,
-        "jc": jc.calculate_jc,
-        "pa": pa.calculate_pa,
-        "ra": ra.calculate_ra,
-        "l3": l3.calculate_l3,
+    graph_files = [
+        graph_full_path
+        for graph_full_path in get_reduced_graph_files(data_path_a)
+        if selection.is_selected(graph_full_path, filters)
+    ]
+
+    # List of requested similarity algorithms
+    if similarity_algorithms is None:
+        similarity_algorithms = list(SIMILARITY_FUNCTIONS.keys())
+
+    options = {
+        "include_zero_scores": include_zero_scores,
+        "saving_root": saving_root,
+        "top_k": top_k,
+        "memory_budget": memory_budget,
+        "weighted": weighted,
     }
 
-    # List of available clustering algorithms
-    similarity_algorithms = list(similarity_functions.keys())
+    if workers <= 1:
+        for graph_full_path in graph_files:
+            rank_file(graph_full_path, similarity_algorithms, **options)
+        return []
 
-    for similarity_algorithm in similarity_algorithms:
-        for folder in data_folders:
-            folder_path = os.path.join(data_path_a, folder)
-            a_reduced_graph_files = os.listdir(folder_path)
+    # Schedule one job per file, largest networks first, so that every
+    # algorithm shares the graph parsed once by its job
+    jobs = [
+        (graph_full_path, similarity_algorithms)
+        for graph_full_path in sorted(graph_files, key=lambda path: -os.path.getsize(path))
+    ]
+
+    failed_jobs = []
+    for index, _, error in instrumentation.run_jobs(rank_file, jobs, workers, **options):
+        path = jobs[index][0]
+        if error is None:
+            print(f"Ranked {path}")
+        else:
+            print(f"Failed to rank {path}:\n{error}")
+            failed_jobs.append(path)
+
+    print(f"{len(jobs) - len(failed_jobs)} of {len(jobs)} jobs completed")
+
+    return failed_jobs
+
+
+def add_arguments(parser):
+    """
+    Add the options of the edge ranking to a command-line parser.
+    """
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes. With more than one worker, every file is ranked "
+        "with every algorithm by one job on a process pool, which writes its rankings to the "
+        "output folder.",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help=f"Folder for the ranked edges (default: print them, or '{RANKED_EDGES_PATH}' "
+        "when running with several workers). Only rankings written to a folder are cached, "
+        "printed rankings are always recomputed.",
+    )
+    parser.add_argument(
+        "--include-zero-scores",
+        action="store_true",
+        help="Score every non-adjacent pair instead of the pairs within each method's radius.",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=None, help="Only keep the k best-scoring pairs of a ranking."
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=None,
+        help="Score CN, JC and RA in row blocks that fit in this many bytes. Without --top-k, "
+        "every block is streamed to an unsorted ranking file.",
+    )
+    parser.add_argument(
+        "--weighted",
+        action="store_true",
+        help="Use the edge weights of the networks (e.g. STRING confidences) in every score.",
+    )
+    selection.add_arguments(parser, methods=list(SIMILARITY_FUNCTIONS))
+    result_cache.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+
+
+def run(args):
+    """
+    Rank the edges from parsed command-line arguments, and write the run report.
+    """
+    instrumentation.configure(args)
+    result_cache.configure(args)
 
-            for file_path in sorted(a_reduced_graph_files):
-                graph_full_path = os.path.join(folder_path, file_path)
-                graph, complement_graph = get_complement(graph_full_path)
+    started = time.time()
+    saving_root = args.output
+    if saving_root is None and args.workers > 1:
+        saving_root = RANKED_EDGES_PATH
 
-                print(similarity_algorithm, graph_full_path)
+    failed_jobs = rank_edges(
+        similarity_algorithms=args.methods or None,
+        include_zero_scores=args.include_zero_scores,
+        workers=args.workers,
+        saving_root=saving_root,
+        top_k=args.top_k,
+        memory_budget=args.memory_budget,
+        weighted=args.weighted,
+        filters=selection.filters_from_args(args),
+    )
+    if result_cache.enabled():
+        # Bound the cache once per run, including the results of this run
+        result_cache.evict()
+    print(f"Report: {instrumentation.write_report('rank_method_I', started)}")
 
-                ranked_edges = similarity_functions[similarity_algorithm](graph, complement_graph)
+    return failed_jobs
 
-                viewdict(graph_full_path, ranked_edges)
 
-                # break
-            break
-        break
+def main():
+    parser = argparse.ArgumentParser(description="Rank candidate edges of the reduced networks.")
+    add_arguments(parser)
+    run(parser.parse_args())
 
 
-rank_edges()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import graph_io
+
+# Folder of the cached results, which can be moved with the CACHE_ENV environment
+# variable. It is inherited by the worker processes, like CACHE_SIZE_ENV.
+CACHE_PATH = "data/.results"
+CACHE_ENV = "PPI_CACHE_DIR"
+
+# Size bound of the cache in bytes, which can be changed with the CACHE_SIZE_ENV
+# environment variable. A size of 0 disables the cache.
+CACHE_SIZE = 4 << 30
+CACHE_SIZE_ENV = "PPI_CACHE_SIZE"
+
+# Bump when the layout of the entries changes
+CACHE_FORMAT_VERSION = 1
+
+# File of an entry listing its result files. Its modification time is the last
+# use of the entry, which the eviction goes by.
+MANIFEST_NAME = "manifest.json"
+
+# Digests of the input files, by (path, size, modification time)
+_input_digests = {}
+
+
+def cache_path():
+    """
+    Folder of the cached results, from CACHE_ENV or CACHE_PATH.
+    """
+    return os.environ.get(CACHE_ENV) or CACHE_PATH
+
+
+def cache_size():
+    """
+    Size bound of the cache in bytes, from CACHE_SIZE_ENV or CACHE_SIZE.
+    """
+    return int(os.environ.get(CACHE_SIZE_ENV) or CACHE_SIZE)
+
+
+def enabled():
+    """
+    Whether results are cached.
+    """
+    return cache_size() > 0
+
+
+def input_digest(filepath):
+    """
+    SHA-1 digest of an input file, computed once per version of the file in this process.
+    """
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+    if key not in _input_digests:
+        _input_digests[key] = graph_io.file_hash(filepath)
+    return _input_digests[key]
+
+
+@functools.lru_cache(maxsize=None)
+def source_version(*paths):
+    """
+    Version of an algorithm, as the digest of the files implementing it.
+
+    Any change to the sources or jars of an algorithm invalidates its cached
+    results, without a version number to maintain by hand.
+
+    Args:
+        *paths (str): Paths to the source files and jars of the algorithm.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(graph_io.file_hash(path).encode("ascii"))
+    return digest.hexdigest()
+
+
+def result_key(algorithm, version, input_path, params=None):
+    """
+    Key of the results of an algorithm on an input file.
+
+    Args:
+        algorithm (str): Name of the algorithm, e.g. 'cluster/mcl'.
+        version (str): Version of the algorithm, e.g. from source_version().
+        input_path (str): Path to the input graph, keyed by the hash of its contents.
+        params (dict or None): JSON-serializable parameters of the algorithm.
+
+    Returns:
+        str: The hex digest of the key.
+    """
+    key = {
+        "format": CACHE_FORMAT_VERSION,
+        "algorithm": algorithm,
+        "version": version,
+        "input": input_digest(input_path),
+        "params": params or {},
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(cache_path(), key[:2], key)
+
+
+def _unique_suffix():
+    # Temporary names unique to a thread, since the Java clusterers run on threads
+    return f"{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+def lookup(key):
+    """
+    Find a cache entry and mark it as used.
+
+    The result files are checked against their recorded digests, since they are
+    hard-linked into the output folders, where they could be overwritten in
+    place. Damaged entries are removed.
+
+    Args:
+        key (str): Key of the entry, from result_key().
+
+    Returns:
+        tuple or None: (entry folder, result file names), or None on a miss.
+    """
+    entry = _entry_path(key)
+    manifest_path = os.path.join(entry, MANIFEST_NAME)
+
+    try:
+        with open(manifest_path, "r") as f:
+            files = json.load(f)["files"]
+        for name, digest in files.items():
+            if graph_io.file_hash(os.path.join(entry, name)) != digest:
+                raise ValueError(f"Damaged cache entry '{entry}'.")
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError):
+        shutil.rmtree(entry, ignore_errors=True)
+        return None
+
+    try:
+        os.utime(manifest_path)
+    except OSError:
+        return None  # Evicted in the meantime
+
+    return entry, list(files)
+
+
+def place(source, destination):
+    """
+    Hard-link a cached file to a destination, or copy it where links are not
+    supported, replacing any existing file.
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return  # Placed by a previous run
+
+    temp_path = f"{destination}.{_unique_suffix()}"
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+
+
+def restore(key, destination_folder):
+    """
+    Place the cached results of a key in a folder.
+
+    Returns:
+        list or None: Paths to the placed files, or None on a miss.
+    """
+    found = lookup(key)
+    if found is None:
+        return None
+
+    entry, names = found
+    os.makedirs(destination_folder, exist_ok=True)
+    try:
+        for name in names:
+            place(os.path.join(entry, name), os.path.join(destination_folder, name))
+    except FileNotFoundError:
+        return None  # Evicted in the meantime
+
+    return [os.path.join(destination_folder, name) for name in names]
+
+
+def staging_folder():
+    """
+    Create an empty folder for the results of a computation, on the file system of the cache.
+    """
+    os.makedirs(cache_path(), exist_ok=True)
+    return tempfile.mkdtemp(prefix="staging-", dir=cache_path())
+
+
+def store(key, files):
+    """
+    Move result files into the entry of a key.
+
+    The entry is only published once complete. If another process stored the
+    same key in the meantime, its entry is kept. The cache is not evicted here,
+    but once at the end of a run (see evict()).
+
+    Args:
+        key (str): Key of the entry, from result_key().
+        files (dict): Names of the result files in the entry, mapped to their current paths.
+
+    Returns:
+        str: The entry folder.
+    """
+    entry = _entry_path(key)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+
+    temp_entry = f"{entry}.{_unique_suffix()}"
+    os.makedirs(temp_entry)
+    digests = {}
+    for name, path in files.items():
+        os.replace(path, os.path.join(temp_entry, name))
+        digests[name] = graph_io.file_hash(os.path.join(temp_entry, name))
+
+    with open(os.path.join(temp_entry, MANIFEST_NAME), "w") as f:
+        json.dump({"files": digests, "created": time.time()}, f, indent=2)
+
+    try:
+        os.rename(temp_entry, entry)
+    except OSError:
+        # Stored concurrently by another process
+        shutil.rmtree(temp_entry, ignore_errors=True)
+
+    return entry
+
+
+def commit(key, folder, destination_folder):
+    """
+    Cache the result files written to a staging folder and place them in their
+    destination folder.
+
+    Returns:
+        list: Paths to the placed files.
+    """
+    files = {name: os.path.join(folder, name) for name in sorted(os.listdir(folder))}
+    entry = store(key, files)
+
+    os.makedirs(destination_folder, exist_ok=True)
+    for name in files:
+        place(os.path.join(entry, name), os.path.join(destination_folder, name))
+
+    return [os.path.join(destination_folder, name) for name in files]
+
+
+def cached(key, destination_folder, compute):
+    """
+    Place the cached results of a key in a folder, computing them on a miss.
+
+    Args:
+        key (str): Key of the results, from result_key().
+        destination_folder (str): Folder of the result files.
+        compute (callable): Called with a staging folder, where it writes the
+            result files on a miss.
+
+    Returns:
+        tuple: (paths to the result files, whether they were cached).
+    """
+    paths = restore(key, destination_folder)
+    if paths is not None:
+        return paths, True
+
+    folder = staging_folder()
+    try:
+        compute(folder)
+        return commit(key, folder, destination_folder), False
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def evict(limit=None):
+    """
+    Remove the least recently used entries until the cache fits in its size bound.
+
+    Every entry is scanned, so this is called once at the end of a run rather
+    than after every stored result: the cache can exceed its bound by the
+    results of one run in the meantime.
+
+    Files still linked from an output folder only free their space once the
+    output is removed as well.
+
+    Args:
+        limit (int or None): Size bound in bytes. None uses cache_size().
+
+    Returns:
+        int: Size of the remaining entries, in bytes.
+    """
+    if limit is None:
+        limit = cache_size()
+
+    root = cache_path()
+    if not os.path.isdir(root):
+        return 0
+
+    entries = []
+    total = 0
+    for shard in os.scandir(root):
+        if not shard.is_dir() or len(shard.name) != 2:
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                last_use = os.stat(os.path.join(entry.path, MANIFEST_NAME)).st_mtime
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+            except OSError:
+                continue  # Being stored or evicted by another process
+            entries.append((last_use, size, entry.path))
+            total += size
+
+    for last_use, size, path in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+    return total
+
+
+def add_arguments(parser):
+    """
+    Add the --cache-dir, --cache-size and --no-cache options to a command-line parser.
+    """
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help=f"Folder of the cached results (default: ${CACHE_ENV} or '{CACHE_PATH}').",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=None,
+        help=f"Size bound of the cached results in bytes, the least recently used being "
+        f"evicted at the end of the run (default: ${CACHE_SIZE_ENV} or {CACHE_SIZE}).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Recompute every result instead of reusing the cached ones.",
+    )
+
+
+def configure(args):
+    """
+    Set the cache folder and size requested on the command line, for this process and its workers.
+    """
+    if args.cache_dir:
+        os.environ[CACHE_ENV] = args.cache_dir
+    if args.cache_size is not None:
+        os.environ[CACHE_SIZE_ENV] = str(args.cache_size)
+    if args.no_cache:
+        os.environ[CACHE_SIZE_ENV] = "0"
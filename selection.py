@@ -0,0 +1,128 @@
+import os
+import re
+
+# The generated networks are stored as <network>_<percentage>%/<replicate>_<percentage>%_*,
+# e.g. data/A/EcoliCong_10%/3_10%_reduced_graph.txt
+FOLDER_PATTERN = re.compile(r"^(.+)_(\d+)%$")
+FILE_PATTERN = re.compile(r"^(\d+)_(\d+)%_")
+
+
+def parse_folder_name(folder_name):
+    """
+    Split the name of a network folder, e.g. 'EcoliCong_10%', into its network and percentage.
+
+    Returns:
+        tuple: (network, percentage), with percentage None if the name does not match.
+    """
+    match = FOLDER_PATTERN.match(folder_name)
+    if match is None:
+        return folder_name, None
+    return match.group(1), int(match.group(2))
+
+
+def parse_replicate(file_name):
+    """
+    Replicate number of a generated file, e.g. 3 for '3_10%_reduced_graph.txt', or None.
+    """
+    match = FILE_PATTERN.match(file_name)
+    return None if match is None else int(match.group(1))
+
+
+def matches(network=None, percentage=None, replicate=None, method=None, filters=None):
+    """
+    Check a network, percentage, replicate and method against filters.
+
+    Args:
+        network (str or None): Network name, compared case-insensitively.
+        percentage (int or None): Percentage of removed edges.
+        replicate (int or None): Replicate number, starting from 1.
+        method (str or None): Name of the similarity or clustering method.
+        filters (dict or None): Lists of accepted values under the keys 'networks',
+            'percentages', 'replicates' and 'methods'. A missing or empty list
+            accepts every value.
+
+    Returns:
+        bool: Whether every value is accepted.
+    """
+    filters = filters or {}
+    values = {
+        "networks": None if network is None else network.lower(),
+        "percentages": percentage,
+        "replicates": replicate,
+        "methods": method,
+    }
+
+    for key, value in values.items():
+        accepted = filters.get(key)
+        if not accepted or value is None:
+            continue
+        if key == "networks":
+            accepted = [name.lower() for name in accepted]
+        if value not in accepted:
+            return False
+
+    return True
+
+
+def is_selected(filepath, filters=None, method=None):
+    """
+    Check a generated file, e.g. 'data/A/EcoliCong_10%/3_10%_reduced_graph.txt', against filters.
+
+    See matches() for the filters.
+    """
+    network, percentage = parse_folder_name(os.path.basename(os.path.dirname(filepath)))
+    replicate = parse_replicate(os.path.basename(filepath))
+    return matches(network, percentage, replicate, method, filters)
+
+
+def add_arguments(parser, filter_methods=True, methods=None):
+    """
+    Add the --network, --percentage, --replicate and --method filters to a command-line parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser.
+        filter_methods (bool): Whether to add the --method filter.
+        methods (list or None): Choices of --method. None accepts any method name.
+    """
+    parser.add_argument(
+        "--network",
+        dest="networks",
+        action="append",
+        default=[],
+        help="Only process this network, e.g. EcoliCong (repeatable).",
+    )
+    parser.add_argument(
+        "--percentage",
+        dest="percentages",
+        type=int,
+        action="append",
+        default=[],
+        help="Only process this percentage of removed edges (repeatable).",
+    )
+    parser.add_argument(
+        "--replicate",
+        dest="replicates",
+        type=int,
+        action="append",
+        default=[],
+        help="Only process this replicate, starting from 1 (repeatable).",
+    )
+    if filter_methods:
+        parser.add_argument(
+            "--method",
+            dest="methods",
+            action="append",
+            choices=methods,
+            default=[],
+            help="Only run this method (repeatable).",
+        )
+
+
+def filters_from_args(args):
+    """
+    Filters of matches() from the parsed command-line arguments.
+    """
+    return {
+        key: getattr(args, key, [])
+        for key in ("networks", "percentages", "replicates", "methods")
+    }
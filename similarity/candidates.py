@@ -0,0 +1,133 @@
+import numpy as np
+
+from similarity import sparse
+
+
+class CandidatePairs:
+    """
+    Streaming generator of candidate node pairs for link prediction.
+
+    Instead of building the complement graph, the candidate pairs are generated
+    in blocks of rows of the adjacency matrix. By default only the non-adjacent
+    pairs within `radius` hops of each other are produced: common neighbors,
+    Jaccard and resource allocation are zero beyond 2 hops, and L3 is zero beyond
+    3 hops. With include_zero_scores=True every non-adjacent pair (the full
+    complement) is produced, for evaluations that need the zero-score pairs too.
+
+    A CandidatePairs object can be passed to the similarity functions in place
+    of the complement graph: like a NetworkX graph it provides an edges() method,
+    and it also exposes the pairs as integer node-id arrays.
+
+    Args:
+        graph (networkx.Graph or PreparedGraph): The original graph.
+        radius (int): Maximum hop distance between the nodes of a candidate pair.
+        include_zero_scores (bool): Whether to produce all non-adjacent pairs,
+            regardless of their hop distance.
+        block_size (int): Number of adjacency rows expanded at once.
+        pairs (tuple or None): Precomputed (rows, cols) arrays of the candidate
+            pairs, in row-major order, e.g. loaded from a PreparedGraph cache.
+    """
+
+    def __init__(self, graph, radius=2, include_zero_scores=False, block_size=1024, pairs=None):
+        if radius < 2 and not include_zero_scores:
+            raise ValueError("The radius of candidate pairs must be at least 2.")
+
+        adjacency, self.nodes, _ = sparse.graph_to_csr(graph)
+        self.adjacency = sparse.without_self_loops(adjacency)
+        self.radius = radius
+        self.include_zero_scores = include_zero_scores
+        self.block_size = block_size
+        self.pairs = pairs
+
+    def _block_pairs(self, start, stop):
+        """
+        Compute the candidate pairs (i, j), i < j, for the rows start <= i < stop.
+        """
+        block = self.adjacency[start:stop]
+        n_nodes = self.adjacency.shape[0]
+
+        if self.include_zero_scores:
+            # Every pair that is neither an edge nor on or below the diagonal
+            mask = np.arange(n_nodes)[None, :] > np.arange(start, stop)[:, None]
+            block_coo = block.tocoo()
+            mask[block_coo.row, block_coo.col] = False
+            local_rows, cols = np.nonzero(mask)
+            return local_rows.astype(np.int64) + start, cols.astype(np.int64)
+
+        # Nodes reachable within `radius` hops of every row of the block
+        frontier = block.copy()
+        reach = block.copy()
+        for _ in range(self.radius - 1):
+            frontier = frontier @ self.adjacency
+            frontier.data[:] = 1.0
+            reach = reach + frontier
+        reach = reach.tocsr()
+        reach.sum_duplicates()
+
+        reach_coo = reach.tocoo()
+        rows = reach_coo.row.astype(np.int64) + start
+        cols = reach_coo.col.astype(np.int64)
+
+        # Keep the upper triangle and drop existing edges
+        upper = cols > rows
+        rows, cols = rows[upper], cols[upper]
+        adjacent = sparse.lookup(self.adjacency, rows, cols) != 0
+
+        return rows[~adjacent], cols[~adjacent]
+
+    def block(self, start, stop):
+        """
+        Return the candidate pairs (i, j) with start <= i < stop.
+
+        Returns:
+            tuple: Arrays (rows, cols) with the integer node ids of the pairs.
+        """
+        if self.pairs is None:
+            return self._block_pairs(start, stop)
+
+        rows, cols = self.pairs
+        lo, hi = np.searchsorted(rows, [start, stop])
+        return rows[lo:hi], cols[lo:hi]
+
+    def iter_blocks(self):
+        """
+        Yield the candidate pairs block by block.
+
+        Yields:
+            tuple: Arrays (rows, cols) with the integer node ids of the pairs in a
+                block, in row-major order.
+        """
+        n_nodes = self.adjacency.shape[0]
+        for start in range(0, n_nodes, self.block_size):
+            stop = min(start + self.block_size, n_nodes)
+            yield self.block(start, stop)
+
+    def pair_arrays(self):
+        """
+        Return all candidate pairs as integer node-id arrays.
+
+        Returns:
+            tuple: Arrays (rows, cols), where nodes[rows[i]] and nodes[cols[i]] are
+                the nodes of the i-th candidate pair.
+        """
+        if self.pairs is not None:
+            return self.pairs
+
+        blocks = list(self.iter_blocks())
+        if not blocks:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        rows = np.concatenate([rows for rows, cols in blocks])
+        cols = np.concatenate([cols for rows, cols in blocks])
+        return rows, cols
+
+    def edges(self):
+        """
+        Yield the candidate pairs as (source, target) tuples of node names.
+        """
+        for rows, cols in self.iter_blocks():
+            for r, c in zip(rows.tolist(), cols.tolist()):
+                yield self.nodes[r], self.nodes[c]
+
+    def __iter__(self):
+        return self.edges()
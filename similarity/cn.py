@@ -1,4 +1,7 @@
 import networkx as nx
+import numpy as np
+
+from similarity import sparse
 
 
 def calculate_paths_of_length_2(graph):
@@ -26,7 +29,78 @@ def calculate_paths_of_length_2(graph):
     return paths
 
 
-def calculate_cn(graph, complement):
+def cn_scores(graph, complement, weighted=False):
+    """
+    Compute Common Neighbors scores for the candidate pairs that have a common neighbor.
+
+    Parameters:
+    - graph (NetworkX Graph): The original graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - weighted (bool): Whether to use the edge weights, scoring every common neighbor z
+      by w_xz * w_zy (the entries of W @ W) instead of 1.
+
+    Returns:
+    - nodes (list): Node names, where nodes[i] is the node with integer id i.
+    - rows (numpy.ndarray): Integer ids of the first node of each scored pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each scored pair.
+    - scores (numpy.ndarray): Number of common neighbors of each pair, or their weighted
+      sum if weighted.
+    """
+    adjacency, nodes, degrees = sparse.graph_to_csr(graph, weighted=weighted)
+    rows, cols = sparse.candidate_pairs(complement, nodes)
+
+    # Paths of length 2 between non-adjacent nodes are the entries of A @ A
+    common_neighbors = sparse.common_neighbors_matrix(adjacency)
+    scores = sparse.lookup(common_neighbors, rows, cols)
+    if not weighted:
+        scores = scores.astype(np.int64)
+
+    # Only pairs connected by a path of length 2 are scored
+    connected = scores != 0
+    rows, cols, scores = rows[connected], cols[connected], scores[connected]
+
+    return nodes, rows, cols, scores
+
+
+def cn_score_blocks(graph, complement=None, memory_budget=None, weighted=False):
+    """
+    Compute Common Neighbors scores block by block, with a bounded memory footprint.
+
+    The adjacency is processed in blocks of rows whose sparse products fit in the
+    memory budget, so peak memory does not grow with the size of the graph.
+
+    Parameters:
+    - graph (NetworkX Graph): The original graph.
+    - complement (NetworkX Graph, CandidatePairs or None): The candidate pairs. None scores
+      every pair of nodes 2 hops apart, without generating the candidates up front.
+    - memory_budget (int or None): Memory budget of a block, in bytes. None uses
+      sparse.DEFAULT_MEMORY_BUDGET.
+    - weighted (bool): Whether to use the edge weights, scoring every common neighbor z
+      by w_xz * w_zy (the entries of W @ W) instead of 1.
+
+    Returns:
+    - nodes (list): Node names, where nodes[i] is the node with integer id i.
+    - blocks (generator): Arrays (rows, cols, scores) of the scored pairs of every block.
+    """
+    adjacency, nodes, degrees = sparse.graph_to_csr(graph, weighted=weighted)
+
+    def blocks():
+        for rows, cols, values in sparse.blocked_product_scores(
+            adjacency, adjacency, nodes, complement, memory_budget
+        ):
+            scores = values if weighted else np.rint(values).astype(np.int64)
+
+            # Only pairs connected by a path of length 2 are scored
+            connected = scores != 0
+            yield rows[connected], cols[connected], scores[connected]
+
+    return nodes, blocks()
+
+
+def calculate_cn(
+    graph, complement, top_k=None, per_node_k=None, memory_budget=None, weighted=False
+):
     """
     Calculate the Common Neighbors (CN) score for edges in the complement of a graph.
 
@@ -35,20 +109,30 @@ def calculate_cn(graph, complement):
 
     Parameters:
     - graph (NetworkX Graph): The original graph.
-    - complement (NetworkX Graph): The complement graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - top_k (int or None): Number of best-scoring pairs to return. None returns all pairs.
+    - per_node_k (int or None): If given, only return the pairs that are among the
+      per_node_k best-scoring pairs of one of their nodes.
+    - memory_budget (int or None): If given, score the pairs in blocks of adjacency rows
+      whose products fit in this many bytes, keeping only the running top_k or per_node_k
+      selection between blocks (see cn_score_blocks).
+    - weighted (bool): Whether to use the edge weights, scoring every common neighbor z
+      by w_xz * w_zy (the entries of W @ W) instead of 1.
 
     Returns:
     - ranked_edges (dict): A dictionary containing edges from the complement graph as keys
       and their corresponding CN scores as values. The dictionary is sorted in descending
       order based on the CN scores.
     """
-    results = {}
-    all_paths = calculate_paths_of_length_2(graph)
-
-    for edge in complement.edges():
-        if edge in all_paths:
-            results[edge] = len(all_paths[edge])
+    if memory_budget is not None:
+        nodes, blocks = cn_score_blocks(
+            graph, complement, memory_budget=memory_budget, weighted=weighted
+        )
+        rows, cols, scores = sparse.select_blocks(blocks, top_k=top_k, per_node_k=per_node_k)
+    else:
+        nodes, rows, cols, scores = cn_scores(graph, complement, weighted=weighted)
 
-    ranked_edges = dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+    ranked_edges = sparse.rank_scores(nodes, rows, cols, scores, top_k=top_k, per_node_k=per_node_k)
 
     return ranked_edges
@@ -1,5 +1,7 @@
 import networkx as nx
 
+from similarity import sparse
+
 
 def calculate_jaccard_index(graph, source, target):
     """
@@ -24,25 +26,103 @@ def calculate_jaccard_index(graph, source, target):
     return jaccard
 
 
-def calculate_jc(graph, complement):
+def jc_scores(graph, complement, weighted=False):
+    """
+    Compute Jaccard scores for the candidate pairs of a graph.
+
+    Parameters:
+    - graph (NetworkX Graph): The original graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - weighted (bool): Whether to use the edge weights, in the weighted Jaccard index
+      sum_k min(W_ik, W_jk) / sum_k max(W_ik, W_jk) (see sparse.weighted_jaccard_scores).
+
+    Returns:
+    - nodes (list): Node names, where nodes[i] is the node with integer id i.
+    - rows (numpy.ndarray): Integer ids of the first node of each scored pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each scored pair.
+    - scores (numpy.ndarray): Jaccard index of each pair.
+    """
+    adjacency, nodes, _ = sparse.graph_to_csr(graph, weighted=weighted)
+    rows, cols = sparse.candidate_pairs(complement, nodes)
+
+    if weighted:
+        scores = sparse.weighted_jaccard_scores(adjacency, rows, cols)
+    else:
+        scores = sparse.jaccard_scores(adjacency, rows, cols)
+
+    return nodes, rows, cols, scores
+
+
+def jc_score_blocks(graph, complement=None, memory_budget=None, weighted=False):
+    """
+    Compute Jaccard scores block by block, with a bounded memory footprint.
+
+    The adjacency is processed in blocks of rows whose sparse products fit in the
+    memory budget, so peak memory does not grow with the size of the graph.
+
+    Parameters:
+    - graph (NetworkX Graph): The original graph.
+    - complement (NetworkX Graph, CandidatePairs or None): The candidate pairs. None scores
+      every pair of nodes 2 hops apart, without generating the candidates up front.
+    - memory_budget (int or None): Memory budget of a block, in bytes. None uses
+      sparse.DEFAULT_MEMORY_BUDGET.
+    - weighted (bool): Whether to use the edge weights, in the weighted Jaccard index
+      sum_k min(W_ik, W_jk) / sum_k max(W_ik, W_jk) (see sparse.weighted_jaccard_scores).
+
+    Returns:
+    - nodes (list): Node names, where nodes[i] is the node with integer id i.
+    - blocks (generator): Arrays (rows, cols, scores) of the scored pairs of every block.
+    """
+    adjacency, nodes, _ = sparse.graph_to_csr(graph, weighted=weighted)
+
+    def blocks():
+        # The blocked products only supply the candidate pairs in the weighted mode
+        for rows, cols, intersection in sparse.blocked_product_scores(
+            adjacency, adjacency, nodes, complement, memory_budget
+        ):
+            if weighted:
+                yield rows, cols, sparse.weighted_jaccard_scores(adjacency, rows, cols)
+            else:
+                yield rows, cols, sparse.jaccard_from_intersection(
+                    adjacency, rows, cols, intersection
+                )
+
+    return nodes, blocks()
+
+
+def calculate_jc(
+    graph, complement, top_k=None, per_node_k=None, memory_budget=None, weighted=False
+):
     """
     Calculate Jaccard scores for edges in the complement of a graph.
 
     Parameters:
     - graph (NetworkX Graph): The original graph.
-    - complement (NetworkX Graph): The complement graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - top_k (int or None): Number of best-scoring pairs to return. None returns all pairs.
+    - per_node_k (int or None): If given, only return the pairs that are among the
+      per_node_k best-scoring pairs of one of their nodes.
+    - memory_budget (int or None): If given, score the pairs in blocks of adjacency rows
+      whose products fit in this many bytes, keeping only the running top_k or per_node_k
+      selection between blocks (see jc_score_blocks).
+    - weighted (bool): Whether to use the edge weights, in the weighted Jaccard index
+      sum_k min(W_ik, W_jk) / sum_k max(W_ik, W_jk) (see sparse.weighted_jaccard_scores).
 
     Returns:
     - ranked_edges (dict): A dictionary containing edges from the complement graph as keys
       and their corresponding Jaccard scores as values. The dictionary is sorted in descending
       order based on the Jaccard scores.
     """
-    results = {}
-
-    for edge in complement.edges():
-        source, target = edge
-        results[edge] = calculate_jaccard_index(graph=graph, source=source, target=target)
+    if memory_budget is not None:
+        nodes, blocks = jc_score_blocks(
+            graph, complement, memory_budget=memory_budget, weighted=weighted
+        )
+        rows, cols, scores = sparse.select_blocks(blocks, top_k=top_k, per_node_k=per_node_k)
+    else:
+        nodes, rows, cols, scores = jc_scores(graph, complement, weighted=weighted)
 
-    ranked_edges = dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+    ranked_edges = sparse.rank_scores(nodes, rows, cols, scores, top_k=top_k, per_node_k=per_node_k)
 
     return ranked_edges
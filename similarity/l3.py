@@ -1,4 +1,11 @@
 import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+from similarity import sparse
+
+# Available scoring modes for calculate_l3
+L3_MODES = ("paths", "raw", "normalized")
 
 
 def paths_of_length_3(graph, source, target):
@@ -18,25 +25,122 @@ def paths_of_length_3(graph, source, target):
     return num_paths
 
 
-def calculate_l3(graph, complement):
+def l3_left_factor(adjacency, mode):
+    """
+    Build the rows of the left factor L of the L3 product L @ A for the given mode.
+
+    L holds the 2-hop products, so it is not built as a whole: the returned
+    function computes the rows of L for a chunk of nodes, which are multiplied
+    by A and dropped before the next chunk.
+
+    Parameters:
+    - adjacency (scipy.sparse.csr_array): Binary or weighted adjacency matrix without
+      self-loops.
+    - mode (str): One of L3_MODES.
+        - "paths": L = A + A @ A, counting the simple paths of length 2 and 3
+          between non-adjacent nodes (the behavior of paths_of_length_3).
+        - "raw": L = A @ A, counting the paths of length 3 only.
+        - "normalized": L = A @ D^-1/2 @ A @ D^-1/2, the degree-normalized L3 score,
+          where every path u-a-b-v is weighted by 1 / sqrt(k_a * k_b).
+
+    Returns:
+    - left_rows (callable): Function returning the rows of L for an array of row
+      indices, as a scipy.sparse.csr_array.
+    """
+    if mode == "paths":
+
+        def left_rows(rows):
+            return sp.csr_array(adjacency[rows] + adjacency[rows] @ adjacency)
+
+    elif mode == "raw":
+
+        def left_rows(rows):
+            return sp.csr_array(adjacency[rows] @ adjacency)
+
+    elif mode == "normalized":
+        degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+        inverse_sqrt = np.divide(
+            1.0, np.sqrt(degrees), out=np.zeros_like(degrees), where=degrees != 0
+        )
+        scaling = sp.diags_array(inverse_sqrt)
+
+        def left_rows(rows):
+            return sp.csr_array(adjacency[rows] @ scaling @ adjacency @ scaling)
+
+    else:
+        raise ValueError(f"Unknown L3 mode '{mode}'. Expected one of {L3_MODES}.")
+
+    return left_rows
+
+
+def l3_scores(graph, complement, mode="paths", chunk_size=1024, weighted=False):
+    """
+    Compute L3 scores for the candidate pairs of a graph.
+
+    Parameters:
+    - graph (NetworkX Graph): The original graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - mode (str): Scoring mode, one of L3_MODES (see l3_left_factor).
+    - chunk_size (int): Number of source nodes whose scores are computed at once.
+    - weighted (bool): Whether to use the edge weights: every path is weighted by the
+      product of its edge weights, and the "normalized" mode divides by the square roots
+      of the node strengths instead of the degrees.
+
+    Returns:
+    - nodes (list): Node names, where nodes[i] is the node with integer id i.
+    - rows (numpy.ndarray): Integer ids of the first node of each scored pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each scored pair.
+    - scores (numpy.ndarray): L3 score of each pair.
+    """
+    adjacency, nodes, degrees = sparse.graph_to_csr(graph, weighted=weighted)
+    rows, cols = sparse.candidate_pairs(complement, nodes)
+
+    # Simple paths never use self-loops
+    adjacency = sparse.without_self_loops(adjacency)
+    left = l3_left_factor(adjacency, mode)
+
+    scores = sparse.chunked_product_scores(left, adjacency, rows, cols, chunk_size=chunk_size)
+    if mode != "normalized" and not weighted:
+        scores = np.rint(scores).astype(np.int64)
+
+    return nodes, rows, cols, scores
+
+
+def calculate_l3(
+    graph, complement, mode="paths", chunk_size=1024, top_k=None, per_node_k=None, weighted=False
+):
     """
     Calculate the number of paths of length 3 between nodes in the complement of a graph.
 
+    Path counts are read from sparse products of the adjacency matrix, computed
+    for chunks of nodes so that neither the 2-hop nor the length-3 products are
+    ever held for all nodes at once.
+
     Parameters:
     - graph (NetworkX Graph): The original graph.
-    - complement (NetworkX Graph): The complement graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - mode (str): Scoring mode, one of L3_MODES (see l3_left_factor). The default
+      "paths" counts simple paths of length 2 and 3, "raw" counts paths of length 3
+      only and "normalized" computes the degree-normalized L3 score.
+    - chunk_size (int): Number of source nodes whose scores are computed at once.
+    - top_k (int or None): Number of best-scoring pairs to return. None returns all pairs.
+    - per_node_k (int or None): If given, only return the pairs that are among the
+      per_node_k best-scoring pairs of one of their nodes.
+    - weighted (bool): Whether to use the edge weights: every path is weighted by the
+      product of its edge weights, and the "normalized" mode divides by the square roots
+      of the node strengths instead of the degrees.
 
     Returns:
     - ranked_edges (dict): A dictionary containing edges from the complement graph as keys
       and the corresponding number of paths of length 3 as values. The dictionary is sorted
       in descending order based on the number of paths.
     """
-    results = {}
-
-    for edge in complement.edges():
-        source, target = edge
-        results[edge] = paths_of_length_3(graph=graph, source=source, target=target)
+    nodes, rows, cols, scores = l3_scores(
+        graph, complement, mode=mode, chunk_size=chunk_size, weighted=weighted
+    )
 
-    ranked_edges = dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+    ranked_edges = sparse.rank_scores(nodes, rows, cols, scores, top_k=top_k, per_node_k=per_node_k)
 
     return ranked_edges
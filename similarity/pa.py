@@ -1,4 +1,7 @@
 import networkx as nx
+import numpy as np
+
+from similarity import sparse
 
 
 def preferential_attachment(graph, source, target):
@@ -20,7 +23,35 @@ def preferential_attachment(graph, source, target):
     return pa_score
 
 
-def calculate_pa(graph, complement):
+def pa_scores(graph, complement, weighted=False):
+    """
+    Compute Preferential Attachment scores for the candidate pairs of a graph.
+
+    Parameters:
+    - graph (NetworkX Graph): The original graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - weighted (bool): Whether to use the edge weights, multiplying the node strengths
+      (weighted degrees) instead of the degrees.
+
+    Returns:
+    - nodes (list): Node names, where nodes[i] is the node with integer id i.
+    - rows (numpy.ndarray): Integer ids of the first node of each scored pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each scored pair.
+    - scores (numpy.ndarray): Preferential Attachment score of each pair.
+    """
+    adjacency, nodes, degrees = sparse.graph_to_csr(graph, weighted=weighted)
+    rows, cols = sparse.candidate_pairs(complement, nodes)
+
+    # Product of the degrees of both nodes, for all pairs at once
+    if not weighted:
+        degrees = degrees.astype(np.int64)
+    scores = degrees[rows] * degrees[cols]
+
+    return nodes, rows, cols, scores
+
+
+def calculate_pa(graph, complement, top_k=None, per_node_k=None, weighted=False):
     """
     Calculate Preferential Attachment scores for edges in the complement of a graph.
 
@@ -29,7 +60,13 @@ def calculate_pa(graph, complement):
 
     Parameters:
     - graph (NetworkX Graph): The original graph.
-    - complement (NetworkX Graph): The complement graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - top_k (int or None): Number of best-scoring pairs to return. None returns all pairs.
+    - per_node_k (int or None): If given, only return the pairs that are among the
+      per_node_k best-scoring pairs of one of their nodes.
+    - weighted (bool): Whether to use the edge weights, multiplying the node strengths
+      (weighted degrees) instead of the degrees.
 
     Returns:
     - ranked_edges (dict): A dictionary containing edges from the complement graph as keys
@@ -37,12 +74,8 @@ def calculate_pa(graph, complement):
       in descending order based on the Preferential Attachment scores.
 
     """
-    results = {}
-
-    for edge in complement.edges():
-        source, target = edge
-        results[edge] = preferential_attachment(graph=graph, source=source, target=target)
+    nodes, rows, cols, scores = pa_scores(graph, complement, weighted=weighted)
 
-    ranked_edges = dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+    ranked_edges = sparse.rank_scores(nodes, rows, cols, scores, top_k=top_k, per_node_k=per_node_k)
 
     return ranked_edges
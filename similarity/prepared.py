@@ -0,0 +1,248 @@
+import os
+
+import numpy as np
+
+import graph_io
+from similarity import sparse
+from similarity.candidates import CandidatePairs
+
+# Bump when the layout of the cached arrays changes
+CACHE_FORMAT_VERSION = 1
+
+# Largest hop radius of the cached candidate pairs
+CANDIDATE_RADIUS = 3
+
+
+class PreparedGraph:
+    """
+    A parsed network together with everything the similarity scorers need.
+
+    The prepared graph holds the node index, the edges as integer arrays, the
+    sparse adjacency (binary, and weighted on demand), the node degrees and the
+    candidate pairs within CANDIDATE_RADIUS hops. It can be passed to every
+    similarity function in place of the NetworkX graph, so that all of them
+    share a single parse of the input file. The NetworkX graph itself is only
+    rebuilt if a caller asks for it.
+
+    Args:
+        nodes (list): Node names, in the order in which they were read.
+        sources (numpy.ndarray): Integer ids of the first node of each edge.
+        targets (numpy.ndarray): Integer ids of the second node of each edge.
+        weights (numpy.ndarray): Weight of each edge.
+        candidate_pairs (tuple or None): Cached (rows, cols, hops) arrays of the
+            candidate pairs within CANDIDATE_RADIUS hops.
+    """
+
+    def __init__(self, nodes, sources, targets, weights, candidate_pairs=None):
+        self.nodes = list(nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        # Arrays are kept as given, so memory-mapped int32 / float32 arrays are not
+        # copied; the sparse matrices built from them hold their own copies
+        self.sources = np.asarray(sources)
+        self.targets = np.asarray(targets)
+        self.weights = np.asarray(weights)
+
+        self.adjacency = sparse.edges_to_csr(len(self.nodes), self.sources, self.targets)
+
+        # Same convention as graph.degree(): a self-loop adds 2 to the degree
+        n_nodes = len(self.nodes)
+        self.degrees = np.bincount(self.sources, minlength=n_nodes).astype(np.float64)
+        self.degrees += np.bincount(self.targets, minlength=n_nodes)
+
+        self._weighted = None
+        self._candidate_pairs = candidate_pairs
+        self._graph = None
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Prepare a NetworkX graph.
+
+        Args:
+            graph (networkx.Graph): The input graph.
+
+        Returns:
+            PreparedGraph: The prepared graph.
+        """
+        nodes = list(graph.nodes())
+        index = {node: i for i, node in enumerate(nodes)}
+        edges = list(graph.edges(data="weight", default=1.0))
+
+        sources = np.fromiter((index[u] for u, v, w in edges), dtype=np.int64, count=len(edges))
+        targets = np.fromiter((index[v] for u, v, w in edges), dtype=np.int64, count=len(edges))
+        weights = np.fromiter((w for u, v, w in edges), dtype=np.float64, count=len(edges))
+
+        prepared = cls(nodes, sources, targets, weights)
+        prepared._graph = graph
+        return prepared
+
+    @classmethod
+    def from_edgelist(cls, edges):
+        """
+        Prepare the edges parsed by graph_io.read_edgelist(), without building a
+        NetworkX graph.
+
+        Args:
+            edges (graph_io.EdgeList): The parsed edges.
+
+        Returns:
+            PreparedGraph: The prepared graph.
+        """
+        weights = np.ones(len(edges)) if edges.weights is None else edges.weights
+        return cls(edges.nodes, edges.sources, edges.targets, weights)
+
+    @property
+    def graph(self):
+        """
+        The NetworkX graph, rebuilt from the edge arrays on first access.
+        """
+        if self._graph is None:
+            self._graph = graph_io.to_networkx(
+                self.nodes, self.sources, self.targets, self.weights
+            )
+        return self._graph
+
+    def to_csr(self, weighted=False):
+        """
+        Return the (adjacency, nodes, degrees) triple of sparse.graph_to_csr().
+
+        The weighted adjacency and the node strengths are built on first use.
+        """
+        if not weighted:
+            return self.adjacency, self.nodes, self.degrees
+
+        if self._weighted is None:
+            n_nodes = len(self.nodes)
+            weighted_adjacency = sparse.edges_to_csr(
+                n_nodes, self.sources, self.targets, self.weights
+            )
+            strengths = np.bincount(self.sources, weights=self.weights, minlength=n_nodes)
+            strengths += np.bincount(self.targets, weights=self.weights, minlength=n_nodes)
+            self._weighted = (weighted_adjacency, strengths)
+
+        weighted_adjacency, strengths = self._weighted
+        return weighted_adjacency, self.nodes, strengths
+
+    def candidate_pair_arrays(self):
+        """
+        Return the cached (rows, cols, hops) arrays of the candidate pairs within
+        CANDIDATE_RADIUS hops, computing them on first use.
+        """
+        if self._candidate_pairs is None:
+            rows, cols = CandidatePairs(self, radius=CANDIDATE_RADIUS).pair_arrays()
+
+            # Pairs with a common neighbor are 2 hops apart, the others 3 hops
+            loop_free = sparse.without_self_loops(self.adjacency)
+            two_hops = sparse.lookup(sparse.common_neighbors_matrix(loop_free), rows, cols) != 0
+            hops = np.where(two_hops, 2, CANDIDATE_RADIUS).astype(np.int8)
+
+            self._candidate_pairs = (rows, cols, hops)
+        return self._candidate_pairs
+
+    def candidates(self, radius=2, include_zero_scores=False):
+        """
+        Get the candidate pairs to score, in place of the complement graph.
+
+        Args:
+            radius (int or None): Maximum hop distance between the nodes of a pair.
+                None means that every non-adjacent pair is a candidate.
+            include_zero_scores (bool): Whether to produce every non-adjacent pair.
+
+        Returns:
+            CandidatePairs: The candidate pairs.
+        """
+        if radius is None or include_zero_scores or radius > CANDIDATE_RADIUS:
+            return CandidatePairs(self, radius=radius or 2, include_zero_scores=True)
+
+        rows, cols, hops = self.candidate_pair_arrays()
+        within = hops <= radius
+        return CandidatePairs(self, radius=radius, pairs=(rows[within], cols[within]))
+
+    def save(self, path):
+        """
+        Save the prepared graph as a compressed .npz file.
+
+        The file is written next to its destination first and then moved into
+        place, so that concurrent readers never see a partial file.
+
+        Args:
+            path (str): Destination path.
+        """
+        rows, cols, hops = self.candidate_pair_arrays()
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=np.array(CACHE_FORMAT_VERSION),
+                nodes=np.array(self.nodes, dtype=str),
+                sources=self.sources,
+                targets=self.targets,
+                weights=self.weights,
+                candidate_rows=rows,
+                candidate_cols=cols,
+                candidate_hops=hops,
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a prepared graph saved with save().
+
+        Args:
+            path (str): Path to the .npz file.
+
+        Returns:
+            PreparedGraph: The prepared graph.
+
+        Raises:
+            ValueError: If the file was written with another cache format version.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != CACHE_FORMAT_VERSION:
+                raise ValueError(f"Unsupported prepared graph version in '{path}'.")
+
+            return cls(
+                data["nodes"].tolist(),
+                data["sources"],
+                data["targets"],
+                data["weights"],
+                candidate_pairs=(
+                    data["candidate_rows"],
+                    data["candidate_cols"],
+                    data["candidate_hops"],
+                ),
+            )
+
+
+def load_prepared(filepath, cache_dir=None):
+    """
+    Parse a weighted edgelist file into a PreparedGraph, using an on-disk cache.
+
+    Cached graphs are keyed by the hash of the file contents, so a re-run skips
+    parsing entirely, and an edited file is never served from a stale entry.
+
+    Args:
+        filepath (str): Path to the weighted edgelist file.
+        cache_dir (str or None): Folder of the cache. None disables the cache.
+
+    Returns:
+        PreparedGraph: The prepared graph.
+    """
+    if cache_dir is None:
+        return PreparedGraph.from_edgelist(graph_io.read_edgelist(filepath))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"{graph_io.file_hash(filepath)}.npz")
+
+    if os.path.exists(cache_path):
+        try:
+            return PreparedGraph.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            pass  # Unreadable or outdated entry, prepare the graph again
+
+    prepared = PreparedGraph.from_edgelist(graph_io.read_edgelist(filepath))
+    prepared.save(cache_path)
+
+    return prepared
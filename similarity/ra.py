@@ -1,5 +1,7 @@
 import networkx as nx
 
+from similarity import sparse
+
 
 def resource_allocation(graph, source, target):
     """
@@ -25,7 +27,69 @@ def resource_allocation(graph, source, target):
     return ra_score
 
 
-def calculate_ra(graph, complement):
+def ra_scores(graph, complement, weighted=False):
+    """
+    Compute Resource Allocation scores for the candidate pairs of a graph.
+
+    Parameters:
+    - graph (NetworkX Graph): The original graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - weighted (bool): Whether to use the edge weights, scoring every common neighbor z
+      by w_xz * w_zy / s_z, where s_z is the strength (weighted degree) of z.
+
+    Returns:
+    - nodes (list): Node names, where nodes[i] is the node with integer id i.
+    - rows (numpy.ndarray): Integer ids of the first node of each scored pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each scored pair.
+    - scores (numpy.ndarray): Resource Allocation score of each pair.
+    """
+    adjacency, nodes, degrees = sparse.graph_to_csr(graph, weighted=weighted)
+    rows, cols = sparse.candidate_pairs(complement, nodes)
+
+    # Sum of inverse degrees of the common neighbors, for all pairs at once
+    resource_allocation_scores = sparse.resource_allocation_matrix(adjacency, degrees)
+    scores = sparse.lookup(resource_allocation_scores, rows, cols)
+
+    return nodes, rows, cols, scores
+
+
+def ra_score_blocks(graph, complement=None, memory_budget=None, weighted=False):
+    """
+    Compute Resource Allocation scores block by block, with a bounded memory footprint.
+
+    The adjacency is processed in blocks of rows whose sparse products fit in the
+    memory budget, so peak memory does not grow with the size of the graph.
+
+    Parameters:
+    - graph (NetworkX Graph): The original graph.
+    - complement (NetworkX Graph, CandidatePairs or None): The candidate pairs. None scores
+      every pair of nodes 2 hops apart, without generating the candidates up front.
+    - memory_budget (int or None): Memory budget of a block, in bytes. None uses
+      sparse.DEFAULT_MEMORY_BUDGET.
+    - weighted (bool): Whether to use the edge weights, scoring every common neighbor z
+      by w_xz * w_zy / s_z, where s_z is the strength (weighted degree) of z.
+
+    Returns:
+    - nodes (list): Node names, where nodes[i] is the node with integer id i.
+    - blocks (generator): Arrays (rows, cols, scores) of the scored pairs of every block.
+    """
+    adjacency, nodes, degrees = sparse.graph_to_csr(graph, weighted=weighted)
+
+    # A @ (D^-1 @ A) sums the inverse degrees of the common neighbors
+    scaled_adjacency = sparse.inverse_degree_scaled(adjacency, degrees)
+
+    def blocks():
+        yield from sparse.blocked_product_scores(
+            adjacency, scaled_adjacency, nodes, complement, memory_budget
+        )
+
+    return nodes, blocks()
+
+
+def calculate_ra(
+    graph, complement, top_k=None, per_node_k=None, memory_budget=None, weighted=False
+):
     """
     Calculate Resource Allocation scores for edges in the complement of a graph.
 
@@ -34,7 +98,16 @@ def calculate_ra(graph, complement):
 
     Parameters:
     - graph (NetworkX Graph): The original graph.
-    - complement (NetworkX Graph): The complement graph.
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or the candidate
+      pairs to score in its place.
+    - top_k (int or None): Number of best-scoring pairs to return. None returns all pairs.
+    - per_node_k (int or None): If given, only return the pairs that are among the
+      per_node_k best-scoring pairs of one of their nodes.
+    - memory_budget (int or None): If given, score the pairs in blocks of adjacency rows
+      whose products fit in this many bytes, keeping only the running top_k or per_node_k
+      selection between blocks (see ra_score_blocks).
+    - weighted (bool): Whether to use the edge weights, scoring every common neighbor z
+      by w_xz * w_zy / s_z, where s_z is the strength (weighted degree) of z.
 
     Returns:
     - ranked_edges (dict): A dictionary containing edges from the complement graph as keys
@@ -46,12 +119,14 @@ def calculate_ra(graph, complement):
     - The Resource Allocation score for an edge is calculated as the sum of the inverse degrees
       of the common neighbors of the source and target nodes.
     """
-    results = {}
-
-    for edge in complement.edges():
-        source, target = edge
-        results[edge] = resource_allocation(graph=graph, source=source, target=target)
-
-    ranked_edges = dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+    if memory_budget is not None:
+        nodes, blocks = ra_score_blocks(
+            graph, complement, memory_budget=memory_budget, weighted=weighted
+        )
+        rows, cols, scores = sparse.select_blocks(blocks, top_k=top_k, per_node_k=per_node_k)
+    else:
+        nodes, rows, cols, scores = ra_scores(graph, complement, weighted=weighted)
+
+    ranked_edges = sparse.rank_scores(nodes, rows, cols, scores, top_k=top_k, per_node_k=per_node_k)
 
     return ranked_edges
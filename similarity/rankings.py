@@ -0,0 +1,244 @@
+import os
+import struct
+
+import numpy as np
+
+import graph_io
+from similarity import sparse
+
+# Layout of a ranking file: a fixed-size header followed by one record per ranked pair
+RANKING_MAGIC = b"PPIRANK\0"
+RANKING_VERSION = 1
+RANKING_HEADER = struct.Struct("<8sIIQ8x")  # magic, version, flags, number of records
+RANKING_RECORD = np.dtype([("source", "<i4"), ("target", "<i4"), ("score", "<f4")])
+
+# Header flag set when the records are sorted by descending score
+FLAG_SORTED = 1
+
+# Number of records converted and written at once
+WRITE_CHUNK_SIZE = 1 << 16
+
+
+class RankingWriter:
+    """
+    Stream ranked pairs to a binary ranking file.
+
+    Records are appended chunk by chunk, and the number of records is written
+    to the header when the writer is closed, so the full ranking never has to
+    be held in memory. The file is written under a temporary name and only
+    moved into place once it is complete.
+
+    Args:
+        path (str): Destination path of the ranking file.
+        sorted_scores (bool): Whether the records are written in ranking order.
+    """
+
+    def __init__(self, path, sorted_scores=True):
+        self.path = path
+        self.temp_path = f"{path}.{os.getpid()}.tmp"
+        self.flags = FLAG_SORTED if sorted_scores else 0
+        self.count = 0
+        self.file = open(self.temp_path, "wb")
+        self.file.write(RANKING_HEADER.pack(RANKING_MAGIC, RANKING_VERSION, self.flags, 0))
+
+    def write(self, sources, targets, scores):
+        """
+        Append ranked pairs, given as vocabulary ids and scores.
+        """
+        records = np.empty(len(sources), dtype=RANKING_RECORD)
+        records["source"] = sources
+        records["target"] = targets
+        records["score"] = scores
+        self.file.write(records.tobytes())
+        self.count += len(records)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(RANKING_HEADER.pack(RANKING_MAGIC, RANKING_VERSION, self.flags, self.count))
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.temp_path)
+
+
+def write_ranking(path, vocabulary_path, nodes, rows, cols, scores, top_k=None, per_node_k=None):
+    """
+    Rank scored pairs and stream them to a binary ranking file.
+
+    Args:
+        path (str): Destination path of the ranking file.
+        vocabulary_path (str): Path to the shared node vocabulary.
+        nodes (list): Node names, where nodes[i] is the node with integer id i.
+        rows (numpy.ndarray): Integer ids of the first node of each pair.
+        cols (numpy.ndarray): Integer ids of the second node of each pair.
+        scores (numpy.ndarray): Score of each pair.
+        top_k (int or None): Number of best pairs to keep. None keeps all pairs.
+        per_node_k (int or None): Number of best pairs to keep for every node.
+
+    Returns:
+        int: Number of ranked pairs written.
+    """
+    ids = graph_io.vocabulary_ids(vocabulary_path, nodes)
+    order = sparse.ranked_order(rows, cols, scores, top_k=top_k, per_node_k=per_node_k)
+
+    with RankingWriter(path) as writer:
+        for start in range(0, len(order), WRITE_CHUNK_SIZE):
+            chunk = order[start : start + WRITE_CHUNK_SIZE]
+            writer.write(ids[rows[chunk]], ids[cols[chunk]], scores[chunk])
+
+    return len(order)
+
+
+def write_ranking_blocks(path, vocabulary_path, nodes, blocks):
+    """
+    Stream scored blocks to an unsorted binary ranking file.
+
+    Every block is written as soon as it is scored, so peak memory is bounded by
+    the size of a block. The file is flagged as unsorted, and read_ranking()
+    selects its best pairs when it is read.
+
+    Args:
+        path (str): Destination path of the ranking file.
+        vocabulary_path (str): Path to the shared node vocabulary.
+        nodes (list): Node names, where nodes[i] is the node with integer id i.
+        blocks (iterable): Arrays (rows, cols, scores) of every block.
+
+    Returns:
+        int: Number of pairs written.
+    """
+    ids = graph_io.vocabulary_ids(vocabulary_path, nodes)
+
+    with RankingWriter(path, sorted_scores=False) as writer:
+        for rows, cols, scores in blocks:
+            writer.write(ids[rows], ids[cols], scores)
+
+    return writer.count
+
+
+def remap_ranking(source_path, path, ids):
+    """
+    Copy a ranking file, mapping the node ids of its records to other ids.
+
+    This moves a ranking to another vocabulary, keeping the order of its
+    records and whether they are sorted.
+
+    Args:
+        source_path (str): Path to the ranking file to copy.
+        path (str): Destination path of the copy.
+        ids (numpy.ndarray): New id of every node id of the source records.
+
+    Returns:
+        int: Number of records copied.
+    """
+    flags, count = read_ranking_header(source_path)
+    records = open_ranking(source_path)
+
+    with RankingWriter(path, sorted_scores=bool(flags & FLAG_SORTED)) as writer:
+        for start in range(0, count, WRITE_CHUNK_SIZE):
+            chunk = records[start : start + WRITE_CHUNK_SIZE]
+            writer.write(ids[chunk["source"]], ids[chunk["target"]], chunk["score"])
+
+    return count
+
+
+def read_ranking_header(path):
+    """
+    Read the header of a ranking file.
+
+    Returns:
+        tuple: (flags, number of records).
+
+    Raises:
+        ValueError: If the file is not a ranking file of a supported version.
+    """
+    with open(path, "rb") as f:
+        header = f.read(RANKING_HEADER.size)
+
+    if len(header) != RANKING_HEADER.size:
+        raise ValueError(f"'{path}' is not a ranking file.")
+
+    magic, version, flags, count = RANKING_HEADER.unpack(header)
+    if magic != RANKING_MAGIC or version != RANKING_VERSION:
+        raise ValueError(f"'{path}' is not a ranking file of version {RANKING_VERSION}.")
+
+    return flags, count
+
+
+def open_ranking(path):
+    """
+    Memory-map the records of a ranking file without reading them.
+
+    Args:
+        path (str): Path to the ranking file.
+
+    Returns:
+        numpy.memmap: Read-only structured array with the fields 'source',
+            'target' and 'score'.
+    """
+    flags, count = read_ranking_header(path)
+    if count == 0:
+        return np.zeros(0, dtype=RANKING_RECORD)
+
+    return np.memmap(
+        path, dtype=RANKING_RECORD, mode="r", offset=RANKING_HEADER.size, shape=(count,)
+    )
+
+
+def read_ranking(path, top_k=None):
+    """
+    Read the top_k best pairs of a ranking file.
+
+    For sorted files only the first top_k records are read from disk. Unsorted
+    files, written block by block, are scanned in chunks while keeping a running
+    selection of the top_k best pairs.
+
+    Args:
+        path (str): Path to the ranking file.
+        top_k (int or None): Number of pairs to read. None reads all pairs.
+
+    Returns:
+        numpy.ndarray: Structured array with the fields 'source', 'target' and 'score',
+            best first.
+    """
+    flags, count = read_ranking_header(path)
+    records = open_ranking(path)
+
+    if flags & FLAG_SORTED:
+        return np.array(records[:top_k])
+
+    chunks = (
+        (
+            records["source"][start : start + WRITE_CHUNK_SIZE].astype(np.int64),
+            records["target"][start : start + WRITE_CHUNK_SIZE].astype(np.int64),
+            np.array(records["score"][start : start + WRITE_CHUNK_SIZE]),
+        )
+        for start in range(0, count, WRITE_CHUNK_SIZE)
+    )
+    sources, targets, scores = sparse.select_blocks(chunks, top_k=top_k)
+    order = sparse.ranked_order(sources, targets, scores)
+
+    selected = np.empty(len(order), dtype=RANKING_RECORD)
+    selected["source"] = sources[order]
+    selected["target"] = targets[order]
+    selected["score"] = scores[order]
+    return selected
+
+
+def ranking_to_dict(records, vocabulary):
+    """
+    Convert ranking records to the ranked dictionary of the calculate_* functions.
+    """
+    return {
+        (vocabulary[source], vocabulary[target]): score
+        for source, target, score in zip(
+            records["source"].tolist(), records["target"].tolist(), records["score"].tolist()
+        )
+    }
@@ -0,0 +1,561 @@
+import numpy as np
+import scipy.sparse as sp
+
+# Default memory budget of blocked scoring, in bytes
+DEFAULT_MEMORY_BUDGET = 512 * 1024**2
+
+# Estimated peak bytes per stored entry of a block product: the CSR entry itself,
+# its COO coordinates, and the filtered pair and score arrays
+BYTES_PER_PRODUCT_ENTRY = 48
+
+
+def edges_to_csr(n_nodes, sources, targets, weights=None):
+    """
+    Build a symmetric CSR adjacency matrix from integer edge arrays.
+
+    Parameters:
+    - n_nodes (int): Number of nodes.
+    - sources (numpy.ndarray): Integer ids of the first node of each edge.
+    - targets (numpy.ndarray): Integer ids of the second node of each edge.
+    - weights (numpy.ndarray or None): Weight of each edge. None builds a binary matrix.
+
+    Returns:
+    - adjacency (scipy.sparse.csr_array): Binary or weighted adjacency matrix with
+      sorted indices.
+    """
+    # int32 ids are kept as they are, they index the matrix without a cast
+    sources = np.asarray(sources)
+    targets = np.asarray(targets)
+    if weights is None:
+        data = np.ones(len(sources), dtype=np.float64)
+    else:
+        data = np.asarray(weights, dtype=np.float64)
+
+    # Symmetrize, counting self-loops only once
+    off_diagonal = sources != targets
+    all_rows = np.concatenate([sources, targets[off_diagonal]])
+    all_cols = np.concatenate([targets, sources[off_diagonal]])
+    all_data = np.concatenate([data, data[off_diagonal]])
+
+    adjacency = sp.csr_array((all_data, (all_rows, all_cols)), shape=(n_nodes, n_nodes))
+    adjacency.sum_duplicates()
+    if weights is None:
+        adjacency.data[:] = 1.0
+
+    return adjacency
+
+
+def graph_to_csr(graph, weighted=False):
+    """
+    Convert a graph to an integer-indexed CSR adjacency matrix.
+
+    Nodes are indexed in the order returned by graph.nodes(), so that
+    scores computed on the matrix can be mapped back to node names. A
+    PreparedGraph is accepted as well, in which case its precomputed
+    adjacency is returned.
+
+    Parameters:
+    - graph (NetworkX Graph or PreparedGraph): The input graph.
+    - weighted (bool): Whether to build the weighted adjacency matrix, from the
+      'weight' attribute of the edges (1 when missing), instead of the binary one.
+
+    Returns:
+    - adjacency (scipy.sparse.csr_array): Binary or weighted adjacency matrix with
+      sorted indices.
+    - nodes (list): Node names, where nodes[i] is the node of row/column i.
+    - degrees (numpy.ndarray): Node degrees as reported by graph.degree(), or node
+      strengths as reported by graph.degree(weight="weight") if weighted.
+    """
+    if hasattr(graph, "to_csr"):
+        return graph.to_csr(weighted=weighted)
+
+    nodes = list(graph.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = list(graph.edges(data="weight", default=1.0))
+
+    sources = np.fromiter((index[u] for u, v, w in edges), dtype=np.int64, count=len(edges))
+    targets = np.fromiter((index[v] for u, v, w in edges), dtype=np.int64, count=len(edges))
+
+    if weighted:
+        weights = np.fromiter((w for u, v, w in edges), dtype=np.float64, count=len(edges))
+        adjacency = edges_to_csr(len(nodes), sources, targets, weights)
+        degree_view = graph.degree(weight="weight")
+    else:
+        adjacency = edges_to_csr(len(nodes), sources, targets)
+        degree_view = graph.degree()
+
+    degrees = np.fromiter((degree_view[node] for node in nodes), dtype=np.float64)
+
+    return adjacency, nodes, degrees
+
+
+def candidate_pairs(complement, nodes):
+    """
+    Map the candidate pairs of a complement graph to integer node-id arrays.
+
+    Parameters:
+    - complement (NetworkX Graph or CandidatePairs): The complement graph, or a
+      CandidatePairs generator used in its place.
+    - nodes (list): Node names as returned by graph_to_csr().
+
+    Returns:
+    - rows (numpy.ndarray): Integer ids of the first node of each pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each pair.
+    """
+    index = {node: i for i, node in enumerate(nodes)}
+
+    if hasattr(complement, "pair_arrays"):
+        rows, cols = complement.pair_arrays()
+        if complement.nodes == nodes:
+            return rows, cols
+
+        # The candidates were indexed with a different node order
+        remap = np.fromiter((index[node] for node in complement.nodes), dtype=np.int64)
+        return remap[rows], remap[cols]
+
+    edges = list(complement.edges())
+
+    rows = np.fromiter((index[u] for u, v in edges), dtype=np.int64, count=len(edges))
+    cols = np.fromiter((index[v] for u, v in edges), dtype=np.int64, count=len(edges))
+
+    return rows, cols
+
+
+def lookup(matrix, rows, cols):
+    """
+    Look up the entries matrix[rows[i], cols[i]] of a sparse matrix.
+
+    Entries that are not stored in the matrix are returned as zeros. The lookup
+    is vectorized with a binary search over the row-major keys of the stored
+    entries, so it never materializes a dense row.
+
+    Parameters:
+    - matrix (scipy.sparse matrix): The matrix to read from.
+    - rows (numpy.ndarray): Row indices.
+    - cols (numpy.ndarray): Column indices.
+
+    Returns:
+    - values (numpy.ndarray): The looked-up values.
+    """
+    matrix = sp.csr_array(matrix)
+    matrix.sum_duplicates()  # also sorts the column indices of every row
+
+    n_cols = matrix.shape[1]
+    stored_rows = np.repeat(np.arange(matrix.shape[0], dtype=np.int64), np.diff(matrix.indptr))
+    stored_keys = stored_rows * n_cols + matrix.indices
+    query_keys = np.asarray(rows, dtype=np.int64) * n_cols + np.asarray(cols, dtype=np.int64)
+
+    positions = np.searchsorted(stored_keys, query_keys)
+    positions = np.minimum(positions, max(len(stored_keys) - 1, 0))
+
+    values = np.zeros(len(query_keys), dtype=matrix.dtype)
+    if len(stored_keys):
+        found = stored_keys[positions] == query_keys
+        values[found] = matrix.data[positions[found]]
+
+    return values
+
+
+def common_neighbors_matrix(adjacency):
+    """
+    Compute the number of common neighbors for all node pairs (A @ A).
+    """
+    return (adjacency @ adjacency).tocsr()
+
+
+def resource_allocation_matrix(adjacency, degrees):
+    """
+    Compute Resource Allocation scores for all node pairs (A @ D^-1 @ A).
+    """
+    return (adjacency @ inverse_degree_scaled(adjacency, degrees)).tocsr()
+
+
+def inverse_degree_scaled(adjacency, degrees):
+    """
+    Scale the rows of the adjacency matrix by the inverse node degrees (D^-1 @ A).
+    """
+    inverse_degrees = np.divide(1.0, degrees, out=np.zeros_like(degrees), where=degrees != 0)
+    return sp.csr_array(sp.diags_array(inverse_degrees) @ adjacency)
+
+
+def jaccard_scores(adjacency, rows, cols):
+    """
+    Compute Jaccard scores for the given node pairs.
+
+    The intersection sizes are read from A @ A, and the union sizes are derived
+    from the neighborhood sizes of both nodes.
+    """
+    intersection = lookup(common_neighbors_matrix(adjacency), rows, cols)
+    return jaccard_from_intersection(adjacency, rows, cols, intersection)
+
+
+def jaccard_from_intersection(adjacency, rows, cols, intersection):
+    """
+    Compute Jaccard scores from the intersection sizes of the given node pairs.
+    """
+    intersection = np.asarray(intersection, dtype=np.float64)
+    neighborhood_sizes = np.diff(adjacency.indptr).astype(np.float64)
+    union = neighborhood_sizes[rows] + neighborhood_sizes[cols] - intersection
+
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union != 0)
+
+
+def weighted_jaccard_scores(adjacency, rows, cols, chunk_size=1 << 20):
+    """
+    Compute weighted Jaccard scores for the given node pairs.
+
+    The score of a pair (i, j) is sum_k min(W_ik, W_jk) / sum_k max(W_ik, W_jk)
+    over the rows of the weighted adjacency W, which is the Jaccard index on a
+    binary adjacency and never exceeds 1. The minima are summed over the
+    neighbors of the node with fewer neighbors, looked up in the row of the
+    other node, and the maxima are the row sums of both nodes minus the minima.
+
+    Parameters:
+    - adjacency (scipy.sparse matrix): Weighted adjacency matrix, with non-negative weights.
+    - rows (numpy.ndarray): Integer ids of the first node of each pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each pair.
+    - chunk_size (int): Number of (pair, neighbor) entries looked up at once.
+
+    Returns:
+    - scores (numpy.ndarray): Weighted Jaccard index of each pair.
+    """
+    adjacency = sp.csr_array(adjacency)
+    adjacency.sum_duplicates()
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+
+    degrees = np.diff(adjacency.indptr)
+    swap = degrees[rows] > degrees[cols]
+    first = np.where(swap, cols, rows)
+    second = np.where(swap, rows, cols)
+    counts = degrees[first]
+    ends = np.cumsum(counts)
+
+    minima = np.zeros(len(rows))
+    start = 0
+    while start < len(rows):
+        # The pairs whose neighbors fit in the chunk, and at least one
+        stop = np.searchsorted(ends, ends[start] - counts[start] + chunk_size, side="right")
+        stop = max(stop, start + 1)
+
+        chunk_counts = counts[start:stop]
+        pairs = np.repeat(np.arange(stop - start), chunk_counts)
+        first_entries = np.cumsum(chunk_counts) - chunk_counts
+        offsets = np.arange(len(pairs)) - np.repeat(first_entries, chunk_counts)
+        positions = np.repeat(adjacency.indptr[first[start:stop]], chunk_counts) + offsets
+
+        other_weights = lookup(adjacency, second[start:stop][pairs], adjacency.indices[positions])
+        minima[start:stop] = np.bincount(
+            pairs,
+            weights=np.minimum(adjacency.data[positions], other_weights),
+            minlength=stop - start,
+        )
+        start = stop
+
+    strengths = np.asarray(adjacency.sum(axis=1), dtype=np.float64).ravel()
+    maxima = strengths[rows] + strengths[cols] - minima
+
+    return np.divide(minima, maxima, out=np.zeros_like(minima), where=maxima > 0)
+
+
+def without_self_loops(adjacency):
+    """
+    Return a copy of the adjacency matrix with its diagonal removed.
+    """
+    adjacency = sp.csr_array(adjacency - sp.diags_array(adjacency.diagonal()))
+    adjacency.eliminate_zeros()
+    return adjacency
+
+
+def chunked_product_scores(left, right, rows, cols, chunk_size=1024):
+    """
+    Look up entries of the product left @ right for the given node pairs.
+
+    The product is computed for chunks of at most chunk_size rows at a time, so
+    only the rows that contain requested pairs are ever materialized. The left
+    factor can be given as a function building its rows, so that it is never
+    held in memory as a whole either.
+
+    Parameters:
+    - left (scipy.sparse matrix or callable): Left factor of the product, or a function
+      returning its rows for an array of row indices.
+    - right (scipy.sparse matrix): Right factor of the product.
+    - rows (numpy.ndarray): Row indices of the requested entries.
+    - cols (numpy.ndarray): Column indices of the requested entries.
+    - chunk_size (int): Number of distinct rows multiplied at once.
+
+    Returns:
+    - values (numpy.ndarray): The requested entries of left @ right.
+    """
+    if callable(left):
+        left_rows = left
+    else:
+        left = sp.csr_array(left)
+
+        def left_rows(chunk_rows):
+            return left[chunk_rows]
+
+    right = sp.csr_array(right)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+
+    values = np.zeros(len(rows), dtype=np.float64)
+    order = np.argsort(rows, kind="stable")
+    sorted_rows = rows[order]
+    unique_rows = np.unique(rows)
+
+    for start in range(0, len(unique_rows), chunk_size):
+        chunk_rows = unique_rows[start : start + chunk_size]
+
+        # Requested pairs whose row falls into this chunk
+        lo = np.searchsorted(sorted_rows, chunk_rows[0], side="left")
+        hi = np.searchsorted(sorted_rows, chunk_rows[-1], side="right")
+        selected = order[lo:hi]
+
+        block = sp.csr_array(left_rows(chunk_rows) @ right)
+        local_rows = np.searchsorted(chunk_rows, rows[selected])
+        values[selected] = lookup(block, local_rows, cols[selected])
+
+    return values
+
+
+def row_blocks(adjacency, right, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Split the rows of adjacency into contiguous blocks for blocked products.
+
+    The number of entries of row i of adjacency @ right is bounded by the sum of
+    the row sizes of right over the neighbors of i. Blocks are grown until that
+    bound, times BYTES_PER_PRODUCT_ENTRY, reaches the memory budget, so that the
+    peak memory of every block product stays within the budget regardless of
+    the size of the graph.
+
+    Parameters:
+    - adjacency (scipy.sparse.csr_array): Left factor of the product.
+    - right (scipy.sparse.csr_array): Right factor of the product.
+    - memory_budget (int): Memory budget of a block, in bytes.
+
+    Returns:
+    - blocks (list): (start, stop) row ranges. A block holds at least one row.
+    """
+    right_sizes = np.diff(sp.csr_array(right).indptr).astype(np.float64)
+    row_work = adjacency @ right_sizes + 1
+    cumulative_work = np.cumsum(row_work)
+    entries_per_block = max(memory_budget // BYTES_PER_PRODUCT_ENTRY, 1)
+
+    blocks = []
+    start = 0
+    n_rows = adjacency.shape[0]
+    while start < n_rows:
+        done = cumulative_work[start - 1] if start else 0.0
+        stop = int(np.searchsorted(cumulative_work, done + entries_per_block, side="right"))
+        stop = min(max(stop, start + 1), n_rows)
+        blocks.append((start, stop))
+        start = stop
+
+    return blocks
+
+
+def blocked_product_scores(adjacency, right, nodes, complement=None, memory_budget=None):
+    """
+    Yield the entries of adjacency @ right for candidate pairs, one row block at a time.
+
+    Without a complement, the candidates are the non-adjacent pairs (i, j), i < j,
+    with a non-zero entry, i.e. the pairs 2 hops apart. With a complement, only
+    its pairs are looked up in every block.
+
+    Parameters:
+    - adjacency (scipy.sparse.csr_array): Adjacency matrix.
+    - right (scipy.sparse.csr_array): Right factor of the product.
+    - nodes (list): Node names as returned by graph_to_csr().
+    - complement (NetworkX Graph, CandidatePairs or None): The candidate pairs.
+    - memory_budget (int or None): Memory budget of a block, in bytes. None uses
+      DEFAULT_MEMORY_BUDGET.
+
+    Yields:
+    - tuple: Arrays (rows, cols, values) of the candidate pairs of a block.
+    """
+    if memory_budget is None:
+        memory_budget = DEFAULT_MEMORY_BUDGET
+
+    adjacency = sp.csr_array(adjacency)
+    right = sp.csr_array(right)
+
+    # Candidate pairs indexed like the adjacency can be generated block by block
+    use_candidate_blocks = hasattr(complement, "block") and complement.nodes == nodes
+
+    if complement is not None and not use_candidate_blocks:
+        # Explicit pairs, grouped by row so every block can slice out its own
+        pair_rows, pair_cols = candidate_pairs(complement, nodes)
+        order = np.argsort(pair_rows, kind="stable")
+        pair_rows, pair_cols = pair_rows[order], pair_cols[order]
+
+    for start, stop in row_blocks(adjacency, right, memory_budget):
+        product = sp.csr_array(adjacency[start:stop] @ right)
+
+        if complement is None:
+            product.sum_duplicates()
+            product_coo = product.tocoo()
+            rows = product_coo.row.astype(np.int64) + start
+            cols = product_coo.col.astype(np.int64)
+            values = product_coo.data
+
+            # Keep the upper triangle and drop existing edges
+            upper = cols > rows
+            rows, cols, values = rows[upper], cols[upper], values[upper]
+            adjacent = lookup(adjacency[start:stop], rows - start, cols) != 0
+            yield rows[~adjacent], cols[~adjacent], values[~adjacent]
+            continue
+
+        if use_candidate_blocks:
+            rows, cols = complement.block(start, stop)
+        else:
+            lo, hi = np.searchsorted(pair_rows, [start, stop])
+            rows, cols = pair_rows[lo:hi], pair_cols[lo:hi]
+
+        yield rows, cols, lookup(product, rows - start, cols)
+
+
+def select_blocks(blocks, top_k=None, per_node_k=None):
+    """
+    Merge scored blocks into a running selection of the best pairs.
+
+    With top_k, only the k best pairs seen so far are kept after every block.
+    With per_node_k, the pairs among the per_node_k best pairs of one of their
+    nodes are kept, and top_k is applied once all blocks are merged. Without
+    either, all pairs are kept.
+
+    Parameters:
+    - blocks (iterable): Arrays (rows, cols, scores) of every block.
+    - top_k (int or None): Number of best pairs to keep.
+    - per_node_k (int or None): Number of best pairs to keep for every node.
+
+    Returns:
+    - rows (numpy.ndarray): Integer ids of the first node of each selected pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each selected pair.
+    - scores (numpy.ndarray): Score of each selected pair.
+    """
+    # Arrays of the selection so far, followed by the blocks merged since
+    rows = [np.zeros(0, dtype=np.int64)]
+    cols = [np.zeros(0, dtype=np.int64)]
+    scores = []
+
+    for block_rows, block_cols, block_scores in blocks:
+        rows.append(block_rows)
+        cols.append(block_cols)
+        scores.append(block_scores)
+
+        if per_node_k is None and top_k is None:
+            continue  # All pairs are kept, and concatenated once at the end
+
+        rows, cols, scores = np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+        if per_node_k is not None:
+            selected = per_node_top_k(rows, cols, scores, per_node_k)
+        else:
+            selected = ranked_order(rows, cols, scores, top_k=top_k)
+        rows, cols, scores = [rows[selected]], [cols[selected]], [scores[selected]]
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float64)
+
+    if per_node_k is not None and top_k is not None:
+        selected = ranked_order(rows, cols, scores, top_k=top_k)
+        rows, cols, scores = rows[selected], cols[selected], scores[selected]
+
+    return rows, cols, scores
+
+
+def per_node_top_k(rows, cols, scores, per_node_k):
+    """
+    Select the pairs that are among the per_node_k best pairs of either of their nodes.
+
+    Parameters:
+    - rows (numpy.ndarray): Integer ids of the first node of each pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each pair.
+    - scores (numpy.ndarray): Score of each pair.
+    - per_node_k (int): Number of pairs kept for every node.
+
+    Returns:
+    - selected (numpy.ndarray): Sorted positions of the selected pairs.
+    """
+    positions = np.arange(len(scores), dtype=np.int64)
+
+    # Every pair is listed once for each of its two nodes
+    node = np.concatenate([rows, cols])
+    pair = np.concatenate([positions, positions])
+
+    # Group by node, then order by descending score with the node ids as tie-breakers
+    order = np.lexsort((cols[pair], rows[pair], -scores[pair], node))
+    node, pair = node[order], pair[order]
+
+    group_starts = np.flatnonzero(np.r_[True, node[1:] != node[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(node)])
+    rank_in_group = np.arange(len(node)) - np.repeat(group_starts, group_sizes)
+
+    return np.unique(pair[rank_in_group < per_node_k])
+
+
+def ranked_order(rows, cols, scores, top_k=None, per_node_k=None):
+    """
+    Compute the ranking order of scored pairs.
+
+    Pairs are ordered by descending score, with ties broken by the node ids of
+    the pairs so that rankings are reproducible. With top_k, only the k best
+    pairs are selected by partitioning the scores, so the full set of pairs is
+    never sorted.
+
+    Parameters:
+    - rows (numpy.ndarray): Integer ids of the first node of each pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each pair.
+    - scores (numpy.ndarray): Score of each pair.
+    - top_k (int or None): Number of best pairs to keep. None keeps all pairs.
+    - per_node_k (int or None): If given, only the pairs that are among the
+      per_node_k best pairs of one of their nodes are ranked.
+
+    Returns:
+    - order (numpy.ndarray): Positions of the ranked pairs, best first.
+    """
+    selected = np.arange(len(scores), dtype=np.int64)
+
+    if per_node_k is not None:
+        selected = per_node_top_k(rows, cols, scores, per_node_k)
+
+    if top_k is not None and top_k < len(selected):
+        # Keep everything that scores at least as high as the k-th best pair
+        negated = -scores[selected]
+        threshold = np.partition(negated, top_k - 1)[top_k - 1]
+        selected = selected[negated <= threshold]
+
+    order = selected[np.lexsort((cols[selected], rows[selected], -scores[selected]))]
+
+    if top_k is not None:
+        order = order[:top_k]
+
+    return order
+
+
+def rank_scores(nodes, rows, cols, scores, top_k=None, per_node_k=None):
+    """
+    Build the ranked dictionary returned by the calculate_* functions.
+
+    Pairs are ordered by descending score. Pairs with equal scores are ordered
+    by the node ids of their nodes (see ranked_order).
+
+    Parameters:
+    - nodes (list): Node names as returned by graph_to_csr().
+    - rows (numpy.ndarray): Integer ids of the first node of each pair.
+    - cols (numpy.ndarray): Integer ids of the second node of each pair.
+    - scores (numpy.ndarray): Score of each pair.
+    - top_k (int or None): Number of best pairs to keep. None keeps all pairs.
+    - per_node_k (int or None): Number of best pairs to keep for every node.
+      None keeps all pairs.
+
+    Returns:
+    - ranked_edges (dict): A dictionary containing (source, target) tuples as keys and
+      their scores as values, sorted in descending order of the scores.
+    """
+    order = ranked_order(rows, cols, scores, top_k=top_k, per_node_k=per_node_k)
+
+    return {
+        (nodes[r], nodes[c]): score
+        for r, c, score in zip(rows[order].tolist(), cols[order].tolist(), scores[order].tolist())
+    }
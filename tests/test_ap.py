@@ -0,0 +1,32 @@
+import networkx as nx
+import numpy as np
+
+import graph_io
+from clustering_module import ap
+
+
+def closed_neighborhood_matrix(G):
+    return ap.closed_neighborhood_matrix(graph_io.EdgeList.from_networkx(G))
+
+
+def test_sparse_affinity_propagation_isolated_nodes():
+    G = nx.Graph([("a", "b"), ("b", "c"), ("c", "a"), ("d", "e")])
+    G.add_node("f")
+    G.add_edge("g", "g")
+
+    labels = ap.sparse_affinity_propagation(closed_neighborhood_matrix(G))
+
+    assert len(labels) == G.number_of_nodes()
+    nodes = list(graph_io.EdgeList.from_networkx(G).nodes)
+    for node in ("f", "g"):
+        assert np.sum(labels == labels[nodes.index(node)]) == 1
+
+
+def test_sparse_affinity_propagation_only_isolated_nodes():
+    G = nx.Graph()
+    G.add_nodes_from(["a", "b"])
+    G.add_edge("c", "c")
+
+    labels = ap.sparse_affinity_propagation(closed_neighborhood_matrix(G))
+
+    assert sorted(labels) == [0, 1, 2]
@@ -0,0 +1,56 @@
+import glob
+import os
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import graph_io
+from clustering_module import wcc
+
+NETWORKS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "ppi_networks", "*.txt")))
+
+
+def reference_order(G, weight=None):
+    reference = wcc.clust_coef(G, weight=weight)
+    coefficients = np.array([reference[node] for node in G.nodes()], dtype=np.float64)
+    tolerance = 0.0 if weight is None else wcc.COEFFICIENT_TOLERANCE
+    return coefficients, wcc.coefficient_order(coefficients, tolerance)
+
+
+@pytest.mark.parametrize("path", NETWORKS)
+@pytest.mark.parametrize("weight", [None, "weight"])
+def test_clustering_coefficients_match_networkx(path, weight):
+    G = graph_io.read_graph(path)
+    if weight is not None and not nx.is_weighted(G, weight=weight):
+        pytest.skip("unweighted network")
+
+    expected, expected_order = reference_order(G, weight)
+    coefficients = wcc.clustering_coefficients(G, weight)
+    tolerance = 0.0 if weight is None else wcc.COEFFICIENT_TOLERANCE
+
+    np.testing.assert_allclose(coefficients, expected, rtol=0, atol=wcc.COEFFICIENT_TOLERANCE)
+    np.testing.assert_array_equal(wcc.coefficient_order(coefficients, tolerance), expected_order)
+
+
+def test_unweighted_coefficients_are_exact():
+    G = nx.gnp_random_graph(200, 0.1, seed=0)
+    G.add_edge(0, 0)
+
+    reference = nx.clustering(G)
+    coefficients = wcc.clustering_coefficients(G)
+
+    assert coefficients.tolist() == [reference[node] for node in G.nodes()]
+
+
+def test_coefficient_order_ties_within_tolerance():
+    # Close values tie even across a rounding boundary, and are ordered by node
+    boundary = 0.5 + 0.5e-12
+    coefficients = np.array(
+        [0.1, np.nextafter(boundary, 0), 0.3, 0.1 + 0.2, np.nextafter(boundary, 1)]
+    )
+
+    order = wcc.coefficient_order(coefficients, wcc.COEFFICIENT_TOLERANCE)
+
+    assert order.tolist() == [1, 4, 2, 3, 0]
+    assert wcc.coefficient_order(coefficients).tolist() == [4, 1, 3, 2, 0]